@@ -0,0 +1,3 @@
+-- Миниатюра изображения товара: ссылка на уменьшенный вариант product.image
+-- (загружается вместе с основным изображением, см. src/s3_utils.py)
+ALTER TABLE product ADD COLUMN IF NOT EXISTS image_thumbnail TEXT;
@@ -0,0 +1,135 @@
+# src/achievements_api.py
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Optional
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from instrumentation import track
+from settings import (
+    ACHIEVEMENTS_API_URL,
+    VISIT_ACHIEVEMENT_TYPE_ID,
+    ACHIEVEMENTS_API_WORKERS,
+    ACHIEVEMENTS_API_TIMEOUT,
+    ACHIEVEMENTS_API_RETRIES
+)
+
+
+@dataclass
+class DispatchResult:
+    """
+    Результат одного вызова API начисления ачивки за посещение.
+    """
+    event_id: int
+    user_id: int
+    ok: bool
+    status_code: Optional[int] = None
+    error: Optional[str] = None
+
+
+class VisitDispatcher:
+    """
+    Отправляет запросы POST /admin/events/visit параллельно.
+
+    - одна requests.Session с keep-alive пулом на max_workers соединений;
+    - не больше max_workers запросов одновременно (пул потоков);
+    - таймаут на каждый запрос и повторы с экспоненциальной паузой
+      при ошибках соединения и ответах 429/503 (запрос не принят сервером).
+    """
+
+    def __init__(self, base_url, achievement_type_id=10, max_workers=16,
+                 timeout=10.0, retries=3, backoff_factor=0.5):
+        self.url = f"{base_url.rstrip('/')}/admin/events/visit"
+        self.achievement_type_id = achievement_type_id
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            # Ответ мог дойти до сервера – повтор по read-таймауту задублирует ачивку
+            read=0,
+            status=retries,
+            backoff_factor=backoff_factor,
+            # 502/504 шлюз может вернуть, когда сервер уже начислил ачивку – их не повторяем
+            status_forcelist=(429, 503),
+            allowed_methods=frozenset({"POST"}),
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "accept": "application/json",
+            "Content-Type": "application/json"
+        })
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="visit-dispatch")
+
+    def post_visit(self, event_id, user_id):
+        """
+        Отправляет один запрос и возвращает DispatchResult (исключения не пробрасываются).
+        """
+        payload = {
+            "achievement_type_id": self.achievement_type_id,
+            "eventID": event_id,
+            "userID": user_id
+        }
+        with track("api", "POST /admin/events/visit") as span:
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            except requests.RequestException as e:
+                span.ok = False
+                return DispatchResult(event_id, user_id, ok=False, error=str(e))
+            span.ok = response.status_code == 200
+            span.bytes = len(response.content)
+        return DispatchResult(
+            event_id,
+            user_id,
+            ok=response.status_code == 200,
+            status_code=response.status_code,
+            error=None if response.status_code == 200 else response.text[:200]
+        )
+
+    def dispatch(self, visits, on_progress=None):
+        """
+        Отправляет запросы для всех пар (event_id, user_id).
+
+        :param visits: iterable пар (event_id, user_id)
+        :param on_progress: необязательный callback(done, total), вызывается по мере завершения
+        :return: список DispatchResult в порядке входных пар
+        """
+        visits = [(int(event_id), int(user_id)) for event_id, user_id in visits]
+        # Каждой задаче – своя копия контекста, чтобы замеры попадали в трассировку страницы
+        futures = {
+            self._executor.submit(contextvars.copy_context().run, self.post_visit, event_id, user_id): i
+            for i, (event_id, user_id) in enumerate(visits)
+        }
+        results = [None] * len(visits)
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if on_progress is not None:
+                on_progress(done, len(visits))
+        return results
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+@st.cache_resource
+def visit_dispatcher():
+    """
+    Создаёт общий на процесс диспетчер запросов к API ачивок
+    (keep-alive сессия и пул потоков переиспользуются между сессиями).
+    """
+    return VisitDispatcher(
+        ACHIEVEMENTS_API_URL,
+        achievement_type_id=VISIT_ACHIEVEMENT_TYPE_ID,
+        max_workers=ACHIEVEMENTS_API_WORKERS,
+        timeout=ACHIEVEMENTS_API_TIMEOUT,
+        retries=ACHIEVEMENTS_API_RETRIES
+    )
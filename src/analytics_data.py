@@ -0,0 +1,635 @@
+# src/analytics_data.py
+import functools
+import os
+import threading
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+import psycopg2
+from psycopg2 import sql
+
+import hll
+from data_cache import read_cached, table_cache
+from db_pool import PoolTimeout
+from db_reader import iter_bulk
+from forecasting import TrendState
+from rollups import USER_SKETCHES, rollup_store
+from settings import db_connection, POSTGRES_HOST, ANALYTICS_PARQUET_DIR, ANALYTICS_WINNINGS_DATE_COLUMN, ANALYTICS_EXACT_DISTINCT
+
+# Для воспроизводимости: все генераторы берут числа из np.random.Generator с этим зерном
+SEED = 42
+
+# ==============================
+# Глобальные константы
+# ==============================
+MERCH_ITEMS = ["Футболка", "Худи", "Кепка", "Плакат", "Наклейка", "Сумка"]
+ACHIEVEMENTS = [
+    "Первый заказ", "Большой покупатель", "Коллекционер",
+    "Лояльный клиент", "Активный пользователь", "Социальный активист"
+]
+# Начальные запасы для прогнозирования остатков
+MERCH_INITIAL_INVENTORY = {
+    "Футболка": 150,
+    "Худи": 100,
+    "Кепка": 200,
+    "Плакат": 50,
+    "Наклейка": 300,
+    "Сумка": 80
+}
+# Запас по умолчанию для товаров без известного начального остатка
+DEFAULT_INITIAL_STOCK = 100
+
+# ====================================================
+# 1. Генерация синтетических данных (векторизованная)
+# ====================================================
+def generate_users_data(n_users=200, rng=None):
+    """
+    Генерация данных пользователей.
+    Поля: user_id, username, registration_date.
+    """
+    rng = rng if rng is not None else np.random.default_rng(SEED)
+    base_date = np.datetime64(datetime.now() - timedelta(days=365), "us")
+    offsets = rng.integers(0, 366, size=n_users).astype("timedelta64[D]")
+    return pl.DataFrame({
+        "user_id": np.arange(1, n_users + 1),
+        "registration_date": base_date + offsets
+    }).select(
+        "user_id",
+        pl.format("user_{}", pl.col("user_id")).alias("username"),
+        "registration_date"
+    )
+
+def _sample_users_and_dates(users_df: pl.DataFrame, n, rng):
+    """
+    Выбирает n случайных пользователей (с повторами) и для каждого –
+    случайную дату между регистрацией и сегодняшним днём.
+    Возвращает (user_ids, dates) как массивы NumPy.
+    """
+    idx = rng.integers(0, users_df.height, size=n)
+    user_ids = users_df["user_id"].to_numpy()[idx]
+    registration = users_df["registration_date"].to_numpy().astype("datetime64[us]")[idx]
+    now = np.datetime64(datetime.now(), "us")
+    delta_days = (now - registration).astype("timedelta64[D]").astype(np.int64)
+    # Как random.randint(0, max(1, delta_days)) – верхняя граница включительно
+    offsets = rng.integers(0, np.maximum(delta_days, 1) + 1)
+    return user_ids, registration + offsets.astype("timedelta64[D]")
+
+def generate_transactions_data(users_df: pl.DataFrame, n_transactions=1000, rng=None):
+    """
+    Генерация данных транзакций.
+    Поля: transaction_date, user_id, item, quantity, price_each, total_amount.
+    """
+    rng = rng if rng is not None else np.random.default_rng(SEED)
+    user_ids, dates = _sample_users_and_dates(users_df, n_transactions, rng)
+    items = rng.integers(0, len(MERCH_ITEMS), size=n_transactions)
+    quantity = rng.choice([1, 2, 3], p=[0.7, 0.2, 0.1], size=n_transactions)
+    price_each = np.round(rng.uniform(10, 100, size=n_transactions), 2)
+    return pl.DataFrame({
+        "transaction_date": dates,
+        "user_id": user_ids,
+        "item": pl.Series(MERCH_ITEMS).gather(items),
+        "quantity": quantity,
+        "price_each": price_each,
+        "total_amount": np.round(price_each * quantity, 2)
+    })
+
+def generate_login_events(users_df: pl.DataFrame, n_events=2000, rng=None):
+    """
+    Генерация данных событий входа (login events).
+    Поля: login_date, user_id.
+    """
+    rng = rng if rng is not None else np.random.default_rng(SEED)
+    user_ids, dates = _sample_users_and_dates(users_df, n_events, rng)
+    return pl.DataFrame({
+        "login_date": dates,
+        "user_id": user_ids
+    })
+
+def generate_achievements_data(users_df: pl.DataFrame, n_events=300, rng=None):
+    """
+    Генерация данных достижений, полученных пользователями.
+    Поля: unlock_date, user_id, achievement.
+    """
+    rng = rng if rng is not None else np.random.default_rng(SEED)
+    user_ids, dates = _sample_users_and_dates(users_df, n_events, rng)
+    achievements = rng.integers(0, len(ACHIEVEMENTS), size=n_events)
+    return pl.DataFrame({
+        "unlock_date": dates,
+        "user_id": user_ids,
+        "achievement": pl.Series(ACHIEVEMENTS).gather(achievements)
+    })
+
+# ====================================================
+# 2. Источники данных для аналитики
+# ====================================================
+# Контракты кадров, которые получает страница аналитики:
+#   users:        user_id, username
+#   transactions: transaction_date, user_id, item, quantity, price_each, total_amount
+#   logins:       login_date, user_id
+#   achievements: unlock_date, user_id, achievement
+# Методы возвращают pl.LazyFrame: фильтры по датам и товарам, переданные
+# в метод или наложенные поверх, выполняются как можно ближе к данным.
+
+def _date_filter(column, start_dt=None, end_dt=None):
+    """
+    Выражение-фильтр по диапазону дат (границы необязательны).
+    """
+    expr = pl.lit(True)
+    if start_dt is not None:
+        expr = expr & (pl.col(column) >= start_dt)
+    if end_dt is not None:
+        expr = expr & (pl.col(column) <= end_dt)
+    return expr
+
+def _in_filter(column, values=None):
+    return pl.lit(True) if values is None else pl.col(column).is_in(list(values))
+
+
+class DataSource(ABC):
+    """
+    Базовый источник данных аналитики.
+
+    tables – метки, по которым сбрасывается кэш загруженных наборов
+    (для PostgreSQL – реальные таблицы, их же сбрасывает insert_data).
+    persist_rollups – хранить ли дневные агрегаты источника в Parquet (см. rollups.py).
+    """
+    kind = None
+    tables = []
+    persist_rollups = True
+
+    def cache_key(self):
+        """Параметры источника, от которых зависят данные (часть ключа кэша)."""
+        return (self.kind,)
+
+    def available(self):
+        """Настроено ли хранилище источника (страница предлагает только доступные)."""
+        return True
+
+    @abstractmethod
+    def users(self) -> pl.LazyFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def transactions(self, items=None, start_dt=None, end_dt=None) -> pl.LazyFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def logins(self, start_dt=None, end_dt=None) -> pl.LazyFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def achievements(self, names=None, start_dt=None, end_dt=None) -> pl.LazyFrame:
+        raise NotImplementedError
+
+    @abstractmethod
+    def item_names(self):
+        """Список товаров для фильтра на странице."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def achievement_names(self):
+        """Список достижений для фильтра на странице."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def initial_inventory(self):
+        """Начальные запасы {товар: количество} для прогноза остатков."""
+        raise NotImplementedError
+
+    def batches(self, method, start_dt=None):
+        """
+        Сырые строки метода method (transactions, logins, achievements) начиная
+        с start_dt порциями pl.DataFrame, упорядоченными по дате события –
+        для построения дневных агрегатов (см. rollups.aggregate_batches).
+        По умолчанию – одна порция.
+        """
+        yield getattr(self, method)(start_dt=start_dt).collect()
+
+
+class SyntheticSource(DataSource):
+    """
+    Синтетические данные из векторизованных генераторов.
+    """
+    kind = "synthetic"
+
+    tables = ["synthetic"]
+    # Даты генерируются относительно «сейчас» заново в каждом процессе – агрегаты только в памяти
+    persist_rollups = False
+
+    def __init__(self, n_users=200, n_transactions=1000, n_logins=2000, n_achievements=300, seed=SEED):
+        self.sizes = (n_users, n_transactions, n_logins, n_achievements)
+        self.seed = seed
+        self._frames = None
+        self._lock = threading.Lock()
+
+    def cache_key(self):
+        return (self.kind, self.seed, self.sizes)
+
+    def _generated(self):
+        # Генерируем лениво: для списка фильтров данные не нужны.
+        # Экземпляр общий для сессий (см. make_data_source) – генерация один раз
+        with self._lock:
+            if self._frames is None:
+                self._frames = self._generate()
+        return self._frames
+
+    def _generate(self):
+        n_users, n_transactions, n_logins, n_achievements = self.sizes
+        rng = np.random.default_rng(self.seed)
+        users = generate_users_data(n_users=n_users, rng=rng)
+        return (
+            users,
+            generate_transactions_data(users, n_transactions=n_transactions, rng=rng),
+            generate_login_events(users, n_events=n_logins, rng=rng),
+            generate_achievements_data(users, n_events=n_achievements, rng=rng)
+        )
+
+    def users(self):
+        return self._generated()[0].lazy()
+
+    def transactions(self, items=None, start_dt=None, end_dt=None):
+        return self._generated()[1].lazy().filter(
+            _in_filter("item", items) & _date_filter("transaction_date", start_dt, end_dt)
+        )
+
+    def logins(self, start_dt=None, end_dt=None):
+        return self._generated()[2].lazy().filter(_date_filter("login_date", start_dt, end_dt))
+
+    def achievements(self, names=None, start_dt=None, end_dt=None):
+        return self._generated()[3].lazy().filter(
+            _in_filter("achievement", names) & _date_filter("unlock_date", start_dt, end_dt)
+        )
+
+    def item_names(self):
+        return list(MERCH_ITEMS)
+
+    def achievement_names(self):
+        return list(ACHIEVEMENTS)
+
+    def initial_inventory(self):
+        return dict(MERCH_INITIAL_INVENTORY)
+
+
+@functools.lru_cache(maxsize=None)
+def _winnings_date_column():
+    """
+    Колонка даты выигрыша (ANALYTICS_WINNINGS_DATE_COLUMN из окружения) как
+    экранированный идентификатор uw."<колонка>" (psycopg2 sql.Identifier).
+    Экранирование зависит от соединения, поэтому строится один раз на процесс.
+    """
+    with db_connection() as conn:
+        return sql.Identifier("uw", ANALYTICS_WINNINGS_DATE_COLUMN).as_string(conn)
+
+
+class PostgresSource(DataSource):
+    """
+    Реальные данные из PostgreSQL. Фильтры передаются в WHERE,
+    чтение – через Arrow (db_reader.read_bulk) и общий кэш таблиц.
+
+    - покупки: user_winnings + product (цена товара, количество 1);
+    - активность: посещения событий со статусом attended (дата – начало события);
+    - достижения: ачивки посещённых событий (дата – окончание события).
+    """
+    kind = "postgres"
+    tables = ["users", "user_winnings", "product", "event_user_visits", "events"]
+
+    def available(self):
+        return bool(POSTGRES_HOST)
+
+    def users(self):
+        return read_cached(
+            "SELECT user_id, concat_ws(' ', surname, name, last_surname) AS username FROM users",
+            tables=["users"],
+            bulk=True
+        ).lazy()
+
+    def transactions(self, items=None, start_dt=None, end_dt=None):
+        query, params = self._transactions_query(items, start_dt, end_dt)
+        return read_cached(query, tables=["user_winnings", "product"], params=params, bulk=True).lazy()
+
+    def logins(self, start_dt=None, end_dt=None):
+        query, params = self._logins_query(start_dt, end_dt)
+        return read_cached(query, tables=["event_user_visits", "events"], params=params, bulk=True).lazy()
+
+    def achievements(self, names=None, start_dt=None, end_dt=None):
+        query, params = self._achievements_query(names, start_dt, end_dt)
+        return read_cached(query, tables=["event_user_visits", "events"], params=params, bulk=True).lazy()
+
+    def batches(self, method, start_dt=None):
+        # Полная история для агрегатов читается порциями (db_reader.iter_bulk) и мимо
+        # кэша таблиц: в памяти одновременно только порция, а не все строки.
+        # Первая колонка каждого запроса – дата события
+        query, params = getattr(self, f"_{method}_query")(start_dt=start_dt)
+        yield from iter_bulk(f"{query} ORDER BY 1", params)
+
+    def _transactions_query(self, items=None, start_dt=None, end_dt=None):
+        date_column = _winnings_date_column()
+        where, params = self._where([], [
+            ("p.name = ANY(%s)", None if items is None else list(items)),
+            (f"{date_column} >= %s", start_dt),
+            (f"{date_column} <= %s", end_dt),
+        ])
+        query = f"""
+            SELECT {date_column} AS transaction_date,
+                   uw.user_id,
+                   p.name AS item,
+                   1 AS quantity,
+                   p.price::float8 AS price_each,
+                   p.price::float8 AS total_amount
+              FROM user_winnings uw
+              JOIN product p ON p.product_id = uw.product_id
+              {where}
+        """
+        return query, params
+
+    def _logins_query(self, start_dt=None, end_dt=None):
+        where, params = self._where(["v.visit = 'attended'"], [
+            ("e.start_ds >= %s", start_dt),
+            ("e.start_ds <= %s", end_dt),
+        ])
+        query = f"""
+            SELECT e.start_ds AS login_date, v.user_id
+              FROM event_user_visits v
+              JOIN events e ON e.event_id = v.event_id
+              {where}
+        """
+        return query, params
+
+    def _achievements_query(self, names=None, start_dt=None, end_dt=None):
+        where, params = self._where(["v.visit = 'attended'", "e.achievement_type_id > 0"], [
+            ("'Ачивка #' || e.achievement_type_id = ANY(%s)", None if names is None else list(names)),
+            ("e.end_ds >= %s", start_dt),
+            ("e.end_ds <= %s", end_dt),
+        ])
+        query = f"""
+            SELECT e.end_ds AS unlock_date, v.user_id,
+                   'Ачивка #' || e.achievement_type_id AS achievement
+              FROM event_user_visits v
+              JOIN events e ON e.event_id = v.event_id
+              {where}
+        """
+        return query, params
+
+    def item_names(self):
+        df = read_cached("SELECT DISTINCT name FROM product ORDER BY name", tables=["product"])
+        return df["name"].to_list()
+
+    def achievement_names(self):
+        df = read_cached(
+            """
+            SELECT DISTINCT 'Ачивка #' || achievement_type_id AS achievement
+              FROM events
+             WHERE achievement_type_id > 0
+             ORDER BY 1
+            """,
+            tables=["events"]
+        )
+        return df["achievement"].to_list()
+
+    def initial_inventory(self):
+        # Начальный запас = текущий остаток + уже выданное
+        df = read_cached(
+            """
+            SELECT p.name AS item,
+                   p.avalibility + COUNT(uw.user_winning_id) AS initial_stock
+              FROM product p
+              LEFT JOIN user_winnings uw ON uw.product_id = p.product_id
+             WHERE p.product_category = 'merch'
+             GROUP BY p.product_id, p.name, p.avalibility
+            """,
+            tables=["product", "user_winnings"]
+        )
+        return dict(zip(df["item"].to_list(), df["initial_stock"].to_list()))
+
+    @staticmethod
+    def _where(fixed, optional):
+        """
+        Собирает WHERE из постоянных условий и условий с параметром.
+        optional: [(sql с одним %s, значение)]; при значении None условие пропускается.
+        """
+        clauses, params = list(fixed), []
+        for clause, value in optional:
+            if value is not None:
+                clauses.append(clause)
+                params.append(value)
+        return (f"WHERE {' AND '.join(clauses)}" if clauses else ""), params
+
+
+class ParquetSource(DataSource):
+    """
+    Parquet-файлы в каталоге ANALYTICS_PARQUET_DIR:
+    users.parquet, transactions.parquet, logins.parquet, achievements.parquet
+    и необязательный inventory.parquet (item, initial_stock).
+
+    Файлы открываются через pl.scan_parquet, поэтому фильтры по датам и товарам
+    проталкиваются в чтение: лишние row group'ы и колонки не загружаются.
+    """
+    kind = "parquet"
+
+    def __init__(self, directory=ANALYTICS_PARQUET_DIR):
+        self.directory = directory
+        self.tables = [f"parquet:{directory}"]
+
+    def cache_key(self):
+        return (self.kind, self.directory)
+
+    def available(self):
+        return all(
+            os.path.exists(os.path.join(self.directory, f"{name}.parquet"))
+            for name in ("users", "transactions", "logins", "achievements")
+        )
+
+    def _scan(self, name):
+        return pl.scan_parquet(os.path.join(self.directory, f"{name}.parquet"))
+
+    def users(self):
+        return self._scan("users").select("user_id", "username")
+
+    def transactions(self, items=None, start_dt=None, end_dt=None):
+        return self._scan("transactions").filter(
+            _in_filter("item", items) & _date_filter("transaction_date", start_dt, end_dt)
+        )
+
+    def logins(self, start_dt=None, end_dt=None):
+        return self._scan("logins").filter(_date_filter("login_date", start_dt, end_dt))
+
+    def achievements(self, names=None, start_dt=None, end_dt=None):
+        return self._scan("achievements").filter(
+            _in_filter("achievement", names) & _date_filter("unlock_date", start_dt, end_dt)
+        )
+
+    def item_names(self):
+        return self._scan("transactions").select(pl.col("item").unique().sort()).collect()["item"].to_list()
+
+    def achievement_names(self):
+        return self._scan("achievements").select(
+            pl.col("achievement").unique().sort()
+        ).collect()["achievement"].to_list()
+
+    def initial_inventory(self):
+        path = os.path.join(self.directory, "inventory.parquet")
+        if not os.path.exists(path):
+            return {item: DEFAULT_INITIAL_STOCK for item in self.item_names()}
+        df = pl.read_parquet(path, columns=["item", "initial_stock"])
+        return dict(zip(df["item"].to_list(), df["initial_stock"].to_list()))
+
+
+DATA_SOURCES = {
+    "synthetic": SyntheticSource,
+    "postgres": PostgresSource,
+    "parquet": ParquetSource
+}
+
+# Ошибки хранилища источника (нет файлов, нет связи с базой, пул занят):
+# страница показывает их, а не падает
+SOURCE_ERRORS = (OSError, pl.exceptions.PolarsError, psycopg2.Error, PoolTimeout)
+
+def available_sources():
+    """
+    Названия источников, у которых настроено хранилище, в порядке DATA_SOURCES.
+    """
+    return [kind for kind in DATA_SOURCES if make_data_source(kind).available()]
+
+
+# Источники по cache_key(): модуль импортируется один раз и разделяется всеми сессиями
+_sources = {}
+_sources_lock = threading.Lock()
+
+def make_data_source(kind, **kwargs):
+    """
+    Возвращает источник данных по названию: synthetic | postgres | parquet.
+
+    Экземпляр общий для всех прогонов и сессий с теми же параметрами
+    (cache_key): синтетика генерируется один раз на процесс, а не заново
+    на каждом прогоне страницы и обновлении агрегатов.
+    """
+    if kind not in DATA_SOURCES:
+        raise ValueError(f"Неизвестный источник данных аналитики: {kind}")
+    source = DATA_SOURCES[kind](**kwargs)
+    with _sources_lock:
+        return _sources.setdefault(source.cache_key(), source)
+
+
+# ====================================================
+# 3. Загрузка наборов с кэшированием между прогонами и сессиями
+# ====================================================
+AnalyticsData = namedtuple("AnalyticsData", ["users", "transactions", "initial_inventory"])
+
+def load_analytics_data(source: DataSource, items, start_dt, end_dt):
+    """
+    Загружает сырые наборы страницы аналитики через общий кэш (data_cache.table_cache).
+
+    Ключ – параметры источника (вид, зерно, размеры, каталог), фильтр товаров и период;
+    кэш общий для всех сессий, ограничен по памяти и вытесняет давно не
+    использованное. Сбросить – refresh_analytics_data(source).
+    Сырые транзакции нужны только за период (рейтинг покупателей): дневные
+    графики и прогноз читают агрегаты из rollups.py.
+    """
+    key = (
+        "analytics",
+        source.cache_key(),
+        tuple(items),
+        start_dt,
+        end_dt
+    )
+
+    def load():
+        return AnalyticsData(
+            users=source.users().collect(),
+            transactions=source.transactions(items=items, start_dt=start_dt, end_dt=end_dt).with_columns(
+                pl.col("transaction_date").cast(pl.Datetime("us"))
+            ).collect(),
+            initial_inventory=source.initial_inventory()
+        )
+
+    return table_cache.get_or_load(key, source.tables, load)
+
+def load_rollups(source: DataSource):
+    """
+    Дочитывает новые дни в дневные агрегаты источника и возвращает их хранилище.
+    """
+    store = rollup_store(source)
+    store.update(source)
+    return store
+
+# Окна активности: DAU / WAU / MAU – число дней, заканчивающихся текущим
+ACTIVE_USER_WINDOWS = {"DAU": 1, "WAU": 7, "MAU": 30}
+
+def load_active_users(source: DataSource, store, window, start_dt, end_dt):
+    """
+    Число активных пользователей за окно из window дней, заканчивающееся
+    каждым днём периода.
+
+    DAU берётся из дневного агрегата как есть. Для окон длиннее дня, если
+    в окнах не больше ANALYTICS_EXACT_DISTINCT пар (пользователь, день),
+    счёт точный по сырым логинам, иначе – объединением дневных
+    HLL-скетчей (hll.py) без чтения сырых данных.
+
+    :return: (DataFrame day, active_users; True, если значения точные)
+    """
+    start_day = datetime.combine(start_dt.date(), datetime.min.time())
+    end_day = datetime.combine(end_dt.date(), datetime.min.time())
+    days = pl.DataFrame({"day": pl.datetime_range(start_day, end_day, "1d", time_unit="us", eager=True)})
+    if window == 1:
+        daily = store.scan("daily_active_users", start_dt, end_dt).collect()
+        return days.join(daily, on="day", how="left").fill_null(0), True
+
+    history_start = start_day - timedelta(days=window - 1)
+    volume = store.scan("daily_active_users", history_start, end_dt).select(
+        pl.col("active_users").sum()
+    ).collect().item() or 0
+
+    if volume <= ANALYTICS_EXACT_DISTINCT:
+        exact = hll.rolling_distinct_exact(
+            source.logins(start_dt=history_start, end_dt=end_dt), "login_date", "user_id", window
+        ).rename({"distinct": "active_users"})
+        return days.join(exact, on="day", how="left").fill_null(0), True
+
+    history = pl.datetime_range(history_start, end_day, "1d", time_unit="us", eager=True).to_list()
+    sketches = store.scan(USER_SKETCHES, history_start, end_dt).collect()
+    estimates = hll.rolling_distinct(sketches, history, window)[window - 1:]
+    return days.with_columns(pl.Series("active_users", estimates.round().astype(np.int64))), False
+
+# Состояния трендов продаж по источникам (общие для всех сессий)
+_trend_states = {}
+_trend_states_lock = threading.Lock()
+
+def _trend_state(source: DataSource, store) -> TrendState:
+    with _trend_states_lock:
+        key = source.cache_key()
+        if key not in _trend_states:
+            path = os.path.join(store.directory, "item_trends.parquet") if store.directory else None
+            _trend_states[key] = TrendState(path)
+        return _trend_states[key]
+
+def load_item_trends(source: DataSource, store):
+    """
+    Тренды дневных продаж по всем товарам источника для прогноза остатков.
+
+    Суммы МНК хранятся в forecasting.TrendState рядом с дневными агрегатами;
+    из агрегата daily_item_sales читаются только дни после high-water mark
+    состояния. Дни окна пересчёта агрегатов (store.lookback_days) и
+    сегодняшний ещё могут измениться – они учитываются, но не сохраняются.
+    """
+    state = _trend_state(source, store)
+    since = state.high_water_mark()
+    new_rows = store.scan(
+        "daily_item_sales", start_dt=since + timedelta(days=1) if since is not None else None
+    ).select(
+        "item", pl.col("day").alias("trans_day"), pl.col("quantity").alias("daily_sold")
+    ).collect()
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    return state.fit(new_rows, complete_before=today - timedelta(days=store.lookback_days))
+
+def refresh_analytics_data(source: DataSource):
+    """
+    Сбрасывает закэшированные наборы источника (для PostgreSQL – и прочитанные таблицы),
+    его дневные агрегаты и состояние трендов: они будут пересчитаны за всю историю.
+    """
+    table_cache.invalidate(*source.tables)
+    store = rollup_store(source)
+    store.reset()
+    _trend_state(source, store).reset()
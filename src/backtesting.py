@@ -0,0 +1,180 @@
+# src/backtesting.py
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+import numpy as np
+import polars as pl
+
+# Длина недельного сезона для seasonal-naive
+SEASON = 7
+# Коэффициент сглаживания простого экспоненциального сглаживания
+SMOOTHING_ALPHA = 0.3
+
+
+# ====================================================
+# Модели: (история y, маска дней с данными, горизонт) -> прогноз длины horizon
+# ====================================================
+def linear_model(y: np.ndarray, present: np.ndarray, horizon) -> np.ndarray:
+    """
+    Текущая модель страницы: линейный тренд по дням, в которые были продажи
+    (как в forecasting.fit_linear_trends), отрицательные значения обрезаются.
+    """
+    x = np.flatnonzero(present).astype(np.float64)
+    if len(x) == 0:
+        return np.zeros(horizon)
+    values = y[present]
+    if len(x) == 1:
+        return np.full(horizon, values[0])
+    x0 = x - x[0]
+    # Замкнутая формула МНК, как в forecasting.fit_linear_trends
+    n, sx, sy = len(x0), x0.sum(), values.sum()
+    denominator = n * (x0 @ x0) - sx * sx
+    slope = (n * (x0 @ values) - sx * sy) / denominator if denominator > 0 else 0.0
+    intercept = (sy - slope * sx) / n
+    future = x0[-1] + np.arange(1, horizon + 1)
+    return np.maximum(intercept + slope * future, 0.0)
+
+
+def seasonal_naive_model(y: np.ndarray, present: np.ndarray, horizon) -> np.ndarray:
+    """
+    Повтор последней недели (или последнего значения, если истории меньше недели).
+    """
+    if len(y) == 0:
+        return np.zeros(horizon)
+    if len(y) < SEASON:
+        return np.full(horizon, y[-1])
+    return np.resize(y[-SEASON:], horizon)
+
+
+def exponential_smoothing_model(y: np.ndarray, present: np.ndarray, horizon) -> np.ndarray:
+    """
+    Простое экспоненциальное сглаживание: плоский прогноз последним уровнем.
+    """
+    if len(y) == 0:
+        return np.zeros(horizon)
+    # Уровень после рекурсии level = a*y + (1-a)*level, раскрытой в взвешенную сумму
+    weights = SMOOTHING_ALPHA * (1 - SMOOTHING_ALPHA) ** np.arange(len(y) - 1, -1, -1)
+    weights[0] = (1 - SMOOTHING_ALPHA) ** (len(y) - 1)
+    return np.full(horizon, weights @ y)
+
+
+MODELS = {
+    "linear": linear_model,
+    "seasonal_naive": seasonal_naive_model,
+    "exp_smoothing": exponential_smoothing_model
+}
+
+
+# ====================================================
+# Прогон с подвижной точкой отсчёта
+# ====================================================
+def backtest_series(series_id, y: np.ndarray, present: np.ndarray, horizon=7, min_train=28, step=7):
+    """
+    Rolling-origin бэктест одного ряда: для каждой точки отсчёта t модели
+    обучаются на y[:t] и прогнозируют y[t:t + horizon].
+
+    :return: список словарей (series, model, origins, abs_error, sq_error, points, fit_seconds)
+    """
+    origins = range(min_train, len(y) - horizon + 1, step)
+    results = []
+    for model_name, model in MODELS.items():
+        abs_error = sq_error = fit_seconds = 0.0
+        points = 0
+        for origin in origins:
+            started = time.perf_counter()
+            forecast = model(y[:origin], present[:origin], horizon)
+            fit_seconds += time.perf_counter() - started
+            error = forecast - y[origin:origin + horizon]
+            abs_error += float(np.abs(error).sum())
+            sq_error += float((error ** 2).sum())
+            points += horizon
+        results.append({
+            "series": series_id,
+            "model": model_name,
+            "origins": len(origins),
+            "abs_error": abs_error,
+            "sq_error": sq_error,
+            "points": points,
+            "fit_seconds": fit_seconds
+        })
+    return results
+
+
+def _backtest_chunk(chunk, horizon, min_train, step):
+    results = []
+    for series_id, y, present in chunk:
+        results.extend(backtest_series(series_id, y, present, horizon, min_train, step))
+    return results
+
+
+def daily_matrix(df: pl.DataFrame, key, date_column, value_column):
+    """
+    Плотные дневные ряды из длинной таблицы (key, date, value): для каждого
+    ключа – значения с первого дня с данными до последнего дня во всей таблице,
+    пропуски заполнены нулями.
+
+    :return: список (ключ, y, маска дней с данными)
+    """
+    if df.height == 0:
+        return []
+    first_day = df[date_column].min()
+    indexed = df.with_columns(
+        (pl.col(date_column) - first_day).dt.total_days().alias("_day"),
+        pl.col(value_column).cast(pl.Float64)
+    )
+    n_days = int(indexed["_day"].max()) + 1
+    series = []
+    for (key_value,), group in indexed.partition_by(key, as_dict=True, maintain_order=True).items():
+        days = group["_day"].to_numpy()
+        y = np.zeros(n_days)
+        present = np.zeros(n_days, dtype=bool)
+        y[days] = group[value_column].to_numpy()
+        present[days] = True
+        start = days.min()
+        series.append((key_value, y[start:], present[start:]))
+    return series
+
+
+def run_backtest(series, horizon=7, min_train=28, step=7, max_workers=None, chunk_size=64):
+    """
+    Бэктест всех рядов на пуле процессов (ряды делятся на порции по chunk_size).
+
+    :param series: список (id ряда, y, маска дней с данными) – см. daily_matrix
+    :return: (summary, per_series)
+             summary – model, series, origins, MAE, RMSE, fit_ms_total, fit_ms_per_origin;
+             per_series – те же метрики по каждому ряду и модели
+    """
+    chunks = [series[i:i + chunk_size] for i in range(0, len(series), chunk_size)]
+    rows = []
+    if len(chunks) <= 1 or max_workers == 1:
+        for chunk in chunks:
+            rows.extend(_backtest_chunk(chunk, horizon, min_train, step))
+    else:
+        # spawn, а не fork: форк многопоточного процесса (Streamlit, polars) может зависнуть
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=get_context("spawn")) as executor:
+            futures = [executor.submit(_backtest_chunk, chunk, horizon, min_train, step) for chunk in chunks]
+            for future in futures:
+                rows.extend(future.result())
+
+    schema = {
+        "series": pl.String, "model": pl.String, "origins": pl.Int64, "abs_error": pl.Float64,
+        "sq_error": pl.Float64, "points": pl.Int64, "fit_seconds": pl.Float64
+    }
+    per_series = pl.DataFrame(
+        [dict(row, series=str(row["series"])) for row in rows], schema=schema
+    ).filter(pl.col("points") > 0)
+    summary = per_series.group_by("model", maintain_order=True).agg(
+        pl.len().alias("series"),
+        pl.col("origins").sum(),
+        (pl.col("abs_error").sum() / pl.col("points").sum()).alias("MAE"),
+        (pl.col("sq_error").sum() / pl.col("points").sum()).sqrt().alias("RMSE"),
+        (pl.col("fit_seconds").sum() * 1000).alias("fit_ms_total"),
+        (pl.col("fit_seconds").sum() * 1000 / pl.col("origins").sum()).alias("fit_ms_per_origin")
+    ).sort("MAE")
+    per_series = per_series.with_columns(
+        (pl.col("abs_error") / pl.col("points")).alias("MAE"),
+        (pl.col("sq_error") / pl.col("points")).sqrt().alias("RMSE"),
+        (pl.col("fit_seconds") * 1000).alias("fit_ms")
+    ).select("series", "model", "origins", "MAE", "RMSE", "fit_ms")
+    return summary, per_series
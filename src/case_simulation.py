@@ -0,0 +1,168 @@
+# src/case_simulation.py
+import numpy as np
+import polars as pl
+
+# Предел числа выпадений, которые сэмплируются за один проход:
+# прогоны делятся на порции, чтобы матрица выпадений не занимала больше ~100 МБ
+CHUNK_DRAWS = 1 << 22
+# Квантили полос разброса
+LOWER_QUANTILE = 0.05
+UPPER_QUANTILE = 0.95
+
+
+def build_alias(weights: np.ndarray):
+    """
+    Таблица алиасов (метод Vose) для дискретного распределения weights.
+    После построения одно выпадение стоит O(1) независимо от числа товаров:
+    выбираем ячейку i равномерно и берём i с вероятностью prob[i], иначе alias[i].
+
+    :param weights: неотрицательные веса (например, drop_probability в процентах)
+    :return: (prob, alias) – массивы длины len(weights)
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    n = len(weights)
+    if n == 0 or weights.sum() <= 0 or (weights < 0).any():
+        raise ValueError("Нужен хотя бы один товар с положительной вероятностью.")
+    scaled = weights * n / weights.sum()
+    prob = np.zeros(n)
+    alias = np.arange(n)
+    small = [i for i in range(n) if scaled[i] < 1.0]
+    large = [i for i in range(n) if scaled[i] >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] = scaled[more] + scaled[less] - 1.0
+        (small if scaled[more] < 1.0 else large).append(more)
+    # Остатки равны 1 с точностью до округления
+    for i in small + large:
+        prob[i] = 1.0
+    return prob, alias
+
+
+def sample_alias(prob: np.ndarray, alias: np.ndarray, size, rng: np.random.Generator) -> np.ndarray:
+    """
+    Векторное сэмплирование size выпадений (size – число или форма массива).
+    """
+    cells = rng.integers(0, len(prob), size=size)
+    keep = rng.random(size=size) < prob[cells]
+    return np.where(keep, cells, alias[cells])
+
+
+def depletion_openings(draws: np.ndarray, n_products, stock: np.ndarray) -> np.ndarray:
+    """
+    Номер открытия (с 1), на котором выпадает последний экземпляр товара,
+    для каждого прогона (строки draws) и товара. Если запас не исчерпан
+    за число открытий прогона – NaN; при нулевом запасе – 0.
+
+    Все товары за один проход: устойчивая сортировка выпадений по
+    (прогон, товар) сохраняет порядок открытий внутри группы, поэтому
+    stock[k]-е выпадение товара k – элемент группы с номером stock[k] - 1.
+
+    :return: массив (прогонов × товаров)
+    """
+    runs, openings = draws.shape
+    stock = np.asarray(stock, dtype=np.int64)
+    group = (np.arange(runs, dtype=np.int64)[:, None] * n_products + draws).ravel()
+    order = np.argsort(group, kind="stable")
+    counts = np.bincount(group, minlength=runs * n_products).reshape(runs, n_products)
+    starts = np.cumsum(counts, axis=None).reshape(runs, n_products) - counts
+
+    reached = (counts >= stock) & (stock > 0)
+    # Позиция stock[k]-го выпадения в исходной (плоской) матрице; вне reached – заглушка 0
+    flat = order[np.where(reached, starts + stock - 1, 0)]
+    result = np.where(reached, flat % openings + 1, np.nan)
+    result[:, stock <= 0] = 0
+    return result
+
+
+def simulate_case(weights, payouts, stock, openings, runs=1000, seed=None):
+    """
+    Монте-Карло открытий одного кейса: runs независимых прогонов по openings открытий.
+
+    Запас в ходе прогона не ограничивает выпадения: товар выпадает с заданной
+    вероятностью и после исчерпания – так видно, когда конфигурация упрётся в склад.
+
+    :param weights: вероятности выпадения товаров (любая нормировка)
+    :param payouts: стоимость товара в монетах (выплата за выпадение)
+    :param stock: текущий запас товаров (product.avalibility)
+    :return: (payout, depletion)
+             payout – выплата за прогон (массив длины runs);
+             depletion – номер открытия, на котором исчерпан товар (runs × товаров, NaN – не исчерпан)
+    """
+    prob, alias = build_alias(weights)
+    payouts = np.asarray(payouts, dtype=np.float64)
+    stock = np.asarray(stock, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    payout = np.empty(runs)
+    depletion = np.empty((runs, len(prob)))
+    runs_per_chunk = max(1, CHUNK_DRAWS // max(openings, 1))
+    for start in range(0, runs, runs_per_chunk):
+        stop = min(start + runs_per_chunk, runs)
+        draws = sample_alias(prob, alias, (stop - start, openings), rng)
+        payout[start:stop] = payouts[draws].sum(axis=1)
+        depletion[start:stop] = depletion_openings(draws, len(prob), stock)
+    return payout, depletion
+
+
+def summarize_simulation(products: pl.DataFrame, payout: np.ndarray, depletion: np.ndarray,
+                         openings, case_price=None, openings_per_day=None):
+    """
+    Сводка симуляции.
+
+    :param products: product_id, product_name, drop_probability, price, stock – в порядке весов simulate_case
+    :param case_price: цена открытия кейса в монетах (None – маржа не считается)
+    :param openings_per_day: ожидаемое число открытий в день для перевода в дни (None – только открытия)
+    :return: (economics, per_product)
+             economics – словарь: ожидаемая выплата за открытие (аналитически и по симуляции),
+             стандартное отклонение, полоса выплаты за openings открытий, маржа;
+             per_product – товар, доля выпадений, ожидаемое число выпадений, доля прогонов
+             с исчерпанием и квантили номера открытия (и дня) исчерпания
+    """
+    share = products["drop_probability"].cast(pl.Float64).to_numpy()
+    share = share / share.sum()
+    prices = products["price"].cast(pl.Float64).fill_null(0.0).to_numpy()
+    mean_payout = float(share @ prices)
+    std_payout = float(np.sqrt(share @ (prices - mean_payout) ** 2))
+
+    economics = {
+        "openings": openings,
+        "runs": len(payout),
+        "expected_payout": mean_payout,
+        "payout_std": std_payout,
+        "simulated_payout": float(payout.mean() / openings),
+        "total_mean": float(payout.mean()),
+        "total_lower": float(np.quantile(payout, LOWER_QUANTILE)),
+        "total_upper": float(np.quantile(payout, UPPER_QUANTILE)),
+        "case_price": case_price,
+        "expected_margin": None if case_price is None else case_price - mean_payout,
+        # Доля прогонов, в которых выплата превысила выручку с открытий
+        "loss_share": None if case_price is None else float((payout > case_price * openings).mean())
+    }
+
+    depleted = ~np.isnan(depletion)
+    # Квантили только по прогонам, где товар закончился; для ни разу
+    # не исчерпанных товаров – NaN (nanquantile предупреждает о пустых колонках)
+    quantiles = np.full((3, depletion.shape[1]), np.nan)
+    columns = depleted.any(axis=0)
+    if columns.any():
+        quantiles[:, columns] = np.nanquantile(
+            np.where(depleted, depletion, np.nan)[:, columns], [LOWER_QUANTILE, 0.5, UPPER_QUANTILE], axis=0
+        )
+    lower, median, upper = quantiles
+    per_product = products.select("product_id", "product_name", "stock").with_columns(
+        pl.Series("share", share * 100),
+        pl.Series("expected_drops", share * openings),
+        pl.Series("depleted_share", depleted.mean(axis=0) * 100),
+        pl.Series("depletion_lower", lower),
+        pl.Series("depletion_median", median),
+        pl.Series("depletion_upper", upper)
+    ).with_columns(
+        pl.col(["depletion_lower", "depletion_median", "depletion_upper"]).fill_nan(None)
+    )
+    if openings_per_day:
+        per_product = per_product.with_columns(
+            (pl.col("depletion_median") / openings_per_day).round(1).alias("depletion_days")
+        )
+    return economics, per_product.sort("depletion_median", nulls_last=True)
@@ -0,0 +1,109 @@
+# src/charts.py
+import numpy as np
+import plotly.graph_objects as go
+import polars as pl
+
+from settings import CHART_MAX_POINTS
+
+TEMPLATE = "plotly_white"
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """
+    Индексы точек, которые оставляет Largest-Triangle-Three-Buckets.
+
+    Первая и последняя точки сохраняются, остальные делятся на threshold - 2
+    корзины; из каждой берётся точка, образующая наибольший треугольник
+    с выбранной точкой предыдущей корзины и средним следующей. Форма ряда
+    (пики и провалы) сохраняется лучше, чем при прореживании через шаг.
+    """
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    x = x.astype(np.float64)
+    y = y.astype(np.float64)
+    every = (n - 2) / (threshold - 2)
+    edges = (np.arange(threshold - 1) * every).astype(np.int64) + 1
+    edges[-1] = n - 1
+
+    indices = np.empty(threshold, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        indices[i + 1] = a
+    return indices
+
+
+def downsample(df: pl.DataFrame, x, y, max_points=CHART_MAX_POINTS) -> pl.DataFrame:
+    """
+    Прореживает ряд (df отсортирован по x) до max_points точек методом LTTB.
+    """
+    if df.height <= max_points:
+        return df
+    x_values = df[x].to_physical().to_numpy()
+    y_values = df[y].fill_null(0).to_numpy()
+    return df[lttb_indices(x_values, y_values, max_points)]
+
+
+def line_chart(df: pl.DataFrame, x, y, title, labels, color=None, max_points=CHART_MAX_POINTS) -> go.Figure:
+    """
+    Линейный график из polars.DataFrame без перехода через pandas:
+    колонки передаются в Plotly как массивы NumPy, каждый ряд прорежен
+    до max_points точек (примерно ширина графика в пикселях).
+
+    :param color: колонка, по которой ряды рисуются отдельными линиями
+    :param labels: подписи осей {колонка: подпись}
+    """
+    fig = go.Figure()
+    groups = df.partition_by(color, as_dict=True, maintain_order=True) if color else {(None,): df}
+    for (name,), series in groups.items():
+        series = downsample(series.sort(x), x, y, max_points)
+        fig.add_trace(go.Scatter(
+            x=series[x].to_numpy(),
+            y=series[y].to_numpy(),
+            mode="lines",
+            name=name,
+            showlegend=color is not None
+        ))
+    _layout(fig, title, labels.get(x, x), labels.get(y, y), legend_title=labels.get(color, color))
+    return fig
+
+
+def bar_chart(df: pl.DataFrame, x, y, title, labels, top_n=None) -> go.Figure:
+    """
+    Столбчатая диаграмма; при заданном top_n – только top_n наибольших по y.
+    """
+    if top_n is not None:
+        df = df.sort(y, descending=True).head(top_n)
+    fig = go.Figure(go.Bar(x=df[x].to_numpy(), y=df[y].to_numpy()))
+    _layout(fig, title, labels.get(x, x), labels.get(y, y))
+    return fig
+
+
+def pie_chart(df: pl.DataFrame, names, values, title, top_n=None) -> go.Figure:
+    """
+    Круговая диаграмма; при заданном top_n – только top_n наибольших долей.
+    """
+    if top_n is not None:
+        df = df.sort(values, descending=True).head(top_n)
+    fig = go.Figure(go.Pie(labels=df[names].to_numpy(), values=df[values].to_numpy()))
+    _layout(fig, title)
+    return fig
+
+
+def _layout(fig, title, x_title=None, y_title=None, legend_title=None):
+    fig.update_layout(
+        title=title,
+        xaxis_title=x_title,
+        yaxis_title=y_title,
+        legend_title_text=legend_title,
+        template=TEMPLATE
+    )
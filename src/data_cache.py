@@ -0,0 +1,152 @@
+# src/data_cache.py
+import threading
+import time
+from collections import OrderedDict
+
+import polars as pl
+
+from db_reader import read_bulk, read_frame
+from settings import TABLE_CACHE_TTL, TABLE_CACHE_MAX_ENTRIES, TABLE_CACHE_MAX_MB
+
+
+class FrameCache:
+    """
+    Потокобезопасный кэш результатов чтения, привязанный к таблицам.
+
+    Каждая запись помечена набором таблиц, из которых она прочитана.
+    Запись живёт не дольше ttl секунд, всего записей не больше max_entries,
+    а их суммарный размер – не больше max_bytes (вытесняются давно не
+    использованные). invalidate("events") сбрасывает все записи,
+    зависящие от таблицы events.
+    """
+
+    def __init__(self, ttl=300.0, max_entries=128, max_bytes=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (tables, stored_at, value, nbytes)
+        self._generations = {}          # table -> счётчик инвалидаций
+        self._epoch = 0                 # счётчик clear(): сбрасывает поколения всех таблиц
+        self._total_bytes = 0
+
+    def get_or_load(self, key, tables, loader):
+        """
+        Возвращает значение из кэша или вызывает loader() и кладёт результат в кэш.
+        """
+        tables = frozenset(tables)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self.ttl is None or time.monotonic() - entry[1] <= self.ttl:
+                    self._entries.move_to_end(key)
+                    return entry[2]
+                self._drop(key)
+            generations = self._snapshot_generations(tables)
+
+        value = loader()
+        nbytes = estimated_size(value)
+
+        with self._lock:
+            # Если таблицу изменили, пока мы читали, результат может быть устаревшим
+            if generations == self._snapshot_generations(tables):
+                if key in self._entries:
+                    self._drop(key)
+                self._entries[key] = (tables, time.monotonic(), value, nbytes)
+                self._total_bytes += nbytes
+                while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self._total_bytes > self.max_bytes and len(self._entries) > 1
+                ):
+                    self._drop(next(iter(self._entries)))
+        return value
+
+    def invalidate(self, *tables):
+        """
+        Сбрасывает все записи, прочитанные из указанных таблиц.
+        """
+        tables = set(tables)
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+            stale = [key for key, entry in self._entries.items() if entry[0] & tables]
+            for key in stale:
+                self._drop(key)
+
+    def clear(self):
+        """
+        Сбрасывает все записи. Чтения, начатые до сброса, в кэш уже не попадут.
+        """
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._total_bytes -= entry[3]
+
+    def _snapshot_generations(self, tables):
+        return self._epoch, {table: self._generations.get(table, 0) for table in tables}
+
+
+def estimated_size(value):
+    """
+    Примерный размер значения в байтах: polars-кадры считаются точно,
+    кортежи/списки/словари – по сумме элементов, остальное – как 0.
+    """
+    if isinstance(value, (pl.DataFrame, pl.Series)):
+        return value.estimated_size()
+    if isinstance(value, (tuple, list)):
+        return sum(estimated_size(item) for item in value)
+    if isinstance(value, dict):
+        return sum(estimated_size(item) for item in value.values())
+    return 0
+
+
+class RerunSnapshot:
+    """
+    Данные одного прогона страницы.
+
+    Каждый набор читается лениво, при первом обращении snapshot["events"],
+    и дальше все вкладки получают тот же объект. Streamlit выполняет скрипт
+    страницы заново на каждый rerun, поэтому снимок создаётся в начале скрипта
+    и живёт ровно один прогон.
+    """
+
+    def __init__(self, **loaders):
+        self._loaders = loaders
+        self._values = {}
+
+    def __getitem__(self, name):
+        if name not in self._values:
+            self._values[name] = self._loaders[name]()
+        return self._values[name]
+
+
+# Общий на процесс кэш: модуль импортируется один раз и разделяется всеми сессиями
+table_cache = FrameCache(
+    ttl=TABLE_CACHE_TTL,
+    max_entries=TABLE_CACHE_MAX_ENTRIES,
+    max_bytes=TABLE_CACHE_MAX_MB * 1024 * 1024
+)
+
+
+def read_cached(query, tables, params=None, bulk=False):
+    """
+    Читает результат запроса в polars.DataFrame через кэш.
+
+    :param query: SQL-запрос
+    :param tables: таблицы, из которых читает запрос (по ним идёт инвалидация)
+    :param params: параметры запроса (для плейсхолдеров %s)
+    :param bulk: большой результат – читать через Arrow (db_reader.read_bulk)
+    """
+    key = (query, tuple(params) if params is not None else None)
+    reader = read_bulk if bulk else read_frame
+    return table_cache.get_or_load(key, tables, lambda: reader(query, params))
+
+
+def invalidate_tables(*tables):
+    """
+    Сбрасывает кэш по таблицам. Вызывается после успешного commit изменений.
+    """
+    table_cache.invalidate(*tables)
@@ -0,0 +1,161 @@
+# src/db_pool.py
+import threading
+import time
+from contextlib import contextmanager
+
+import psycopg2
+from psycopg2 import extensions
+
+
+class PoolTimeout(Exception):
+    """
+    Не удалось получить соединение из пула за отведённое время.
+    """
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений с PostgreSQL.
+
+    - одновременно открыто не больше max_size соединений;
+    - свободного соединения ждём не дольше checkout_timeout секунд;
+    - соединения старше max_lifetime секунд закрываются и открываются заново;
+    - соединение, простоявшее без дела дольше health_check_interval секунд,
+      перед выдачей проверяется запросом SELECT 1.
+    """
+
+    def __init__(self, connect_kwargs, max_size=10, checkout_timeout=10.0,
+                 max_lifetime=1800.0, health_check_interval=30.0):
+        self.connect_kwargs = dict(connect_kwargs)
+        self.max_size = max_size
+        self.checkout_timeout = checkout_timeout
+        self.max_lifetime = max_lifetime
+        self.health_check_interval = health_check_interval
+
+        self._cond = threading.Condition()
+        self._idle = []       # [(conn, last_used)] – свободные соединения
+        self._created = {}    # conn -> время открытия
+        self._size = 0        # открытые + зарезервированные под открытие
+
+    # -------------------------------------
+    # Выдача и возврат соединений
+    # -------------------------------------
+    def getconn(self, timeout=None):
+        """
+        Выдаёт рабочее соединение из пула (или открывает новое).
+        Бросает PoolTimeout, если за timeout секунд свободных соединений не появилось.
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            conn, last_used = self._acquire(deadline)
+            if conn is None:
+                return self._open()
+            # Проверку делаем вне блокировки: она ходит в сеть
+            if self._is_usable(conn, last_used):
+                return conn
+            self._discard(conn)
+
+    def putconn(self, conn, discard=False):
+        """
+        Возвращает соединение в пул. Незавершённая транзакция откатывается,
+        сломанные и устаревшие соединения закрываются.
+        """
+        if discard or conn.closed or self._expired(conn):
+            self._discard(conn)
+            return
+        if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._discard(conn)
+                return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Контекстный менеджер: берёт соединение из пула и гарантированно возвращает его.
+        При разрыве связи (OperationalError) соединение выбрасывается из пула.
+        """
+        conn = self.getconn(timeout)
+        broken = False
+        try:
+            yield conn
+        except psycopg2.OperationalError:
+            broken = True
+            raise
+        finally:
+            self.putconn(conn, discard=broken)
+
+    def closeall(self):
+        """
+        Закрывает все свободные соединения (выданные закроются при возврате).
+        """
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+    # -------------------------------------
+    # Внутренние помощники
+    # -------------------------------------
+    def _acquire(self, deadline):
+        """
+        Возвращает (conn, last_used) свободного соединения либо (None, None),
+        если зарезервировано место под новое соединение.
+        """
+        with self._cond:
+            while True:
+                if self._idle:
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        f"Нет свободных соединений с БД (max_size={self.max_size})"
+                    )
+                self._cond.wait(remaining)
+
+    def _open(self):
+        try:
+            conn = psycopg2.connect(**self.connect_kwargs)
+        except BaseException:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._created[conn] = time.monotonic()
+        return conn
+
+    def _expired(self, conn):
+        created = self._created.get(conn)
+        return created is None or time.monotonic() - created > self.max_lifetime
+
+    def _is_usable(self, conn, last_used):
+        if conn.closed or self._expired(conn):
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+        with self._cond:
+            self._created.pop(conn, None)
+            self._size -= 1
+            self._cond.notify()
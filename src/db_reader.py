@@ -0,0 +1,151 @@
+# src/db_reader.py
+import importlib.util
+import math
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+import polars as pl
+
+from instrumentation import track, query_name, frame_measure
+from settings import db_connection, POSTGRES_URI, DB_BULK_ENGINE, DB_BULK_BATCH_SIZE
+
+
+def _available(module_name):
+    return importlib.util.find_spec(module_name) is not None
+
+
+def bulk_engine():
+    """
+    Возвращает движок для массового чтения: "adbc", "connectorx" или "psycopg2".
+
+    ADBC (adbc-driver-postgresql) читает через COPY ... TO STDOUT (FORMAT binary)
+    сразу в Arrow-буферы, connectorx – тоже в Arrow, но без потоковой выдачи.
+    psycopg2 – запасной вариант, он собирает строки в питоновские кортежи.
+    """
+    if DB_BULK_ENGINE != "auto":
+        return DB_BULK_ENGINE
+    if _available("adbc_driver_postgresql") and _available("pyarrow"):
+        return "adbc"
+    if _available("connectorx"):
+        return "connectorx"
+    return "psycopg2"
+
+
+def _literal(value):
+    """
+    SQL-литерал для значения параметра (None, bool, числа, строки, даты и списки).
+    Строки – в виде E'...': экранирование не зависит от standard_conforming_strings.
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, float) and not math.isfinite(value):
+        return f"'{value}'::float8"
+    if isinstance(value, (int, float, Decimal)):
+        return repr(value) if isinstance(value, float) else str(value)
+    if isinstance(value, datetime):
+        return f"'{value.isoformat()}'::{'timestamptz' if value.tzinfo else 'timestamp'}"
+    if isinstance(value, date):
+        return f"'{value.isoformat()}'::date"
+    if isinstance(value, str):
+        if "\x00" in value:
+            raise ValueError("Строка с нулевым символом не может быть параметром запроса.")
+        return "E'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+    if isinstance(value, (list, tuple)):
+        return f"ARRAY[{', '.join(_literal(v) for v in value)}]" if value else "'{}'"
+    raise TypeError(f"Неподдерживаемый тип параметра: {type(value).__name__}")
+
+
+def _render(query, params):
+    """
+    Подставляет параметры в запрос на стороне клиента: ADBC и connectorx
+    не понимают плейсхолдеры %s. Соединение из пула для этого не занимается.
+    """
+    if params is None:
+        return query
+    return query % tuple(_literal(value) for value in params)
+
+
+def read_frame(query, params=None):
+    """
+    Читает небольшой результат через соединение из пула.
+    Подходит для справочников и точечных выборок.
+    """
+    with track("db.read", query_name(query)) as span, db_connection() as conn:
+        if params is None:
+            frame = pl.read_database(query, connection=conn)
+        else:
+            frame = pl.read_database(query, connection=conn, execute_options={"parameters": params})
+        span.rows, span.bytes = frame_measure(frame)
+        return frame
+
+
+def read_bulk(query, params=None):
+    """
+    Читает большой результат в polars.DataFrame через Arrow,
+    не создавая питоновский объект на каждую строку.
+    Без ADBC/connectorx падает обратно на read_frame.
+    """
+    engine = bulk_engine()
+    if engine == "psycopg2":
+        return read_frame(query, params)
+    with track("db.read", f"[{engine}] {query_name(query)}") as span:
+        frame = pl.read_database_uri(_render(query, params), POSTGRES_URI, engine=engine)
+        span.rows, span.bytes = frame_measure(frame)
+        return frame
+
+
+def iter_bulk(query, params=None, batch_size=DB_BULK_BATCH_SIZE):
+    """
+    Читает результат порциями примерно по batch_size строк (генератор polars.DataFrame).
+    Пиковая память ограничена одной порцией, а не всей таблицей.
+    """
+    engine = bulk_engine()
+    if engine == "adbc":
+        batches = _iter_adbc(_render(query, params), batch_size)
+    else:
+        # connectorx не умеет отдавать результат порциями – читаем серверным курсором
+        engine = "cursor"
+        batches = _iter_server_cursor(query, params, batch_size)
+    with track("db.read", f"[{engine}, batches] {query_name(query)}") as span:
+        span.rows, span.bytes = 0, 0
+        for batch in batches:
+            rows, size = frame_measure(batch)
+            span.rows += rows
+            span.bytes += size
+            yield batch
+
+
+def _iter_adbc(sql, batch_size):
+    import adbc_driver_postgresql.dbapi as adbc
+
+    pending, pending_rows = [], 0
+    with adbc.connect(POSTGRES_URI) as conn, conn.cursor() as cur:
+        cur.execute(sql)
+        for batch in cur.fetch_record_batch():
+            pending.append(pl.from_arrow(batch))
+            pending_rows += batch.num_rows
+            if pending_rows >= batch_size:
+                yield pl.concat(pending, rechunk=True)
+                pending, pending_rows = [], 0
+    if pending:
+        yield pl.concat(pending, rechunk=True)
+
+
+def _iter_server_cursor(query, params, batch_size):
+    with db_connection() as conn:
+        # Именованный курсор держит результат на сервере и отдаёт его по batch_size строк.
+        # description у него появляется только после первого FETCH, поэтому
+        # имена колонок читаются после первой порции
+        with conn.cursor(name=f"bulk_{uuid.uuid4().hex}") as cur:
+            cur.execute(query, params)
+            columns = None
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                if columns is None:
+                    columns = [column[0] for column in cur.description]
+                yield pl.DataFrame(rows, schema=columns, orient="row", infer_schema_length=None)
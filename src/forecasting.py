@@ -0,0 +1,238 @@
+# src/forecasting.py
+import os
+import threading
+from datetime import datetime
+
+import polars as pl
+
+# Порог «почти нет продаж» для оценки дней до исчерпания
+MIN_DAILY_SALES = 0.01
+
+# Ключ-заглушка для рядов без группировки (прогноз выручки)
+_SINGLE_SERIES = "__series__"
+
+# Суммы МНК, из которых восстанавливаются наклон и сдвиг
+SUM_COLUMNS = ["n", "sx", "sy", "sxy", "sxx"]
+
+
+def trend_sums(df: pl.DataFrame, by, date_column, value_column, origins: pl.DataFrame = None) -> pl.DataFrame:
+    """
+    Суммы для МНК по группам: n, Σx, Σy, Σxy, Σx², где x – номер дня от origin группы.
+
+    :param origins: необязательная таблица (by..., origin) – начало отсчёта для уже
+                    известных групп; для остальных origin – первая дата группы в df
+    :return: by..., origin, n, sx, sy, sxy, sxx, last_day
+    """
+    frame = df.lazy()
+    origin = pl.col(date_column).min().over(by)
+    if origins is not None:
+        frame = frame.join(origins.lazy(), on=by, how="left")
+        origin = pl.coalesce(pl.col("origin"), origin)
+    x = (pl.col(date_column) - pl.col("origin")).dt.total_days().cast(pl.Float64)
+    y = pl.col(value_column).cast(pl.Float64)
+    return frame.with_columns(origin.alias("origin")).with_columns(x.alias("_x"), y.alias("_y")).group_by(by).agg(
+        pl.col("origin").first(),
+        pl.len().cast(pl.Int64).alias("n"),
+        pl.col("_x").sum().alias("sx"),
+        pl.col("_y").sum().alias("sy"),
+        (pl.col("_x") * pl.col("_y")).sum().alias("sxy"),
+        (pl.col("_x") ** 2).sum().alias("sxx"),
+        pl.col(date_column).max().alias("last_day")
+    ).collect()
+
+
+def merge_sums(left: pl.DataFrame, right: pl.DataFrame, by) -> pl.DataFrame:
+    """
+    Складывает суммы двух наборов (по одинаковым origin): суммы МНК аддитивны.
+    """
+    if left is None or left.height == 0:
+        return right
+    if right.height == 0:
+        return left
+    merged = left.join(right, on=by, how="full", coalesce=True, suffix="_new")
+    return merged.select(
+        *by,
+        pl.coalesce("origin", "origin_new").alias("origin"),
+        *[(pl.col(c).fill_null(0) + pl.col(f"{c}_new").fill_null(0)).alias(c) for c in SUM_COLUMNS],
+        pl.max_horizontal("last_day", "last_day_new").alias("last_day")
+    )
+
+
+def trends_from_sums(sums: pl.DataFrame, by) -> pl.DataFrame:
+    """
+    Наклон и сдвиг по замкнутой формуле МНК из сумм trend_sums.
+    Для групп из одной точки наклон 0, а сдвиг равен этой точке (прогноз средним).
+
+    :return: by..., n, slope, intercept, last_index, last_day, total
+    """
+    denominator = pl.col("n") * pl.col("sxx") - pl.col("sx") ** 2
+    slope = pl.when(denominator > 0).then(
+        (pl.col("n") * pl.col("sxy") - pl.col("sx") * pl.col("sy")) / denominator
+    ).otherwise(0.0)
+    return sums.with_columns(slope.alias("slope")).with_columns(
+        ((pl.col("sy") - pl.col("slope") * pl.col("sx")) / pl.col("n")).alias("intercept"),
+        (pl.col("last_day") - pl.col("origin")).dt.total_days().cast(pl.Float64).alias("last_index"),
+        pl.col("sy").alias("total")
+    ).select(*by, "n", "slope", "intercept", "last_index", "last_day", "total")
+
+
+def fit_linear_trends(df: pl.DataFrame, by, date_column, value_column) -> pl.DataFrame:
+    """
+    Линейный тренд value = intercept + slope * day_index для каждой группы by сразу.
+
+    Наклон и сдвиг считаются по замкнутой формуле МНК из сумм n, Σx, Σy, Σxy, Σx²
+    одним group_by, без цикла по группам. day_index – номер дня от первой даты группы.
+
+    :return: by..., n, slope, intercept, last_index, last_day, total
+    """
+    return trends_from_sums(trend_sums(df, by, date_column, value_column), by)
+
+
+class TrendState:
+    """
+    Накопленные суммы МНК по товарам (trend_sums), которые обновляются только
+    новыми днями и хранятся в Parquet между сессиями и перезапусками.
+
+    Полные дни (раньше complete_before) складываются в сохраняемое состояние,
+    последний, возможно неполный, день добавляется только к результату fit().
+    High-water mark – последний день, попавший в состояние. Прогноз по
+    состоянию стоит O(товаров), а не O(длины истории).
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._sums = None
+
+    def high_water_mark(self):
+        with self._lock:
+            sums = self._load()
+            return sums["last_day"].max() if sums is not None and sums.height > 0 else None
+
+    def fit(self, new_rows: pl.DataFrame, complete_before: datetime) -> pl.DataFrame:
+        """
+        Дописывает в состояние полные дни из new_rows и возвращает тренды.
+
+        :param new_rows: item, trans_day, daily_sold – дни после high_water_mark()
+        :param complete_before: дни начиная с этой даты считаются неполными
+        :return: item, n, slope, intercept, last_index, last_day, total
+        """
+        with self._lock:
+            sums = self._load()
+            through = sums["last_day"].max() if sums is not None and sums.height > 0 else None
+            if through is not None:
+                new_rows = new_rows.filter(pl.col("trans_day") > through)
+            origins = sums.select("item", "origin") if sums is not None else None
+
+            complete = new_rows.filter(pl.col("trans_day") < complete_before)
+            if complete.height > 0:
+                sums = merge_sums(sums, trend_sums(complete, ["item"], "trans_day", "daily_sold", origins), ["item"])
+                self._save(sums)
+                origins = sums.select("item", "origin")
+
+            partial = new_rows.filter(pl.col("trans_day") >= complete_before)
+            if partial.height > 0:
+                sums = merge_sums(sums, trend_sums(partial, ["item"], "trans_day", "daily_sold", origins), ["item"])
+        if sums is None:
+            sums = trend_sums(new_rows.head(0), ["item"], "trans_day", "daily_sold")
+        return trends_from_sums(sums, ["item"])
+
+    def reset(self):
+        """
+        Удаляет состояние: следующий fit() пересчитает суммы по всей истории.
+        """
+        with self._lock:
+            self._sums = None
+            if self.path is not None and os.path.exists(self.path):
+                os.remove(self.path)
+
+    def _load(self):
+        if self._sums is None and self.path is not None and os.path.exists(self.path):
+            self._sums = pl.read_parquet(self.path)
+        return self._sums
+
+    def _save(self, sums):
+        if self.path is not None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            sums.write_parquet(f"{self.path}.tmp")
+            os.replace(f"{self.path}.tmp", self.path)
+        self._sums = sums
+
+
+def project_trends(trends: pl.DataFrame, by, horizon, default_last_day: datetime) -> pl.DataFrame:
+    """
+    Прогноз на horizon дней вперёд для всех групп: одна строка на (группа, шаг).
+    Отрицательные значения обрезаются до 0. Группы без истории (n = null после
+    левого соединения) получают прогноз 0 от даты default_last_day.
+
+    :return: by..., step, date, forecast
+    """
+    steps = pl.DataFrame({"step": pl.int_range(1, horizon + 1, eager=True)})
+    return trends.join(steps, how="cross").with_columns(
+        (pl.col("last_day").fill_null(default_last_day) + pl.duration(days=pl.col("step"))).alias("date"),
+        (
+            pl.col("intercept").fill_null(0.0)
+            + pl.col("slope").fill_null(0.0) * (pl.col("last_index").fill_null(0.0) + pl.col("step"))
+        ).clip(lower_bound=0.0).alias("forecast")
+    ).select(*by, "step", "date", "forecast").sort([*by, "step"])
+
+
+def forecast_series(df: pl.DataFrame, date_column, value_column, horizon, default_last_day: datetime) -> pl.DataFrame:
+    """
+    Прогноз одного ряда (например, дневной выручки): date, forecast.
+    """
+    trends = fit_linear_trends(
+        df.with_columns(pl.lit(_SINGLE_SERIES).alias(_SINGLE_SERIES)), [_SINGLE_SERIES], date_column, value_column
+    )
+    if trends.height == 0:
+        trends = pl.DataFrame({_SINGLE_SERIES: [_SINGLE_SERIES]}).join(trends, on=_SINGLE_SERIES, how="left")
+    return project_trends(trends, [_SINGLE_SERIES], horizon, default_last_day).select("date", "forecast")
+
+
+def forecast_inventory(trends: pl.DataFrame, initial_inventory: dict, horizon, default_stock,
+                       default_last_day: datetime):
+    """
+    Пакетный прогноз остатков для всех товаров сразу.
+
+    :param trends: тренды продаж по товарам за всю историю (fit_linear_trends или TrendState.fit)
+    :param initial_inventory: {товар: начальный запас}; None – default_stock
+    :return: (projection, stockout)
+             projection – item, date, forecast_inventory (остаток по дням прогноза);
+             stockout – item, current_inventory, mean_forecast_sales, days_to_stockout, status
+    """
+    inventory = pl.DataFrame(
+        {
+            "item": list(initial_inventory.keys()),
+            "initial_stock": [default_stock if stock is None else stock for stock in initial_inventory.values()]
+        },
+        schema={"item": pl.String, "initial_stock": pl.Float64}
+    )
+    trends = inventory.join(trends, on="item", how="left").with_columns(
+        (pl.col("initial_stock") - pl.col("total").fill_null(0.0)).clip(lower_bound=0.0).alias("current_inventory")
+    )
+
+    forecast = project_trends(trends, ["item"], horizon, default_last_day).join(
+        trends.select("item", "current_inventory"), on="item", how="left"
+    ).with_columns(
+        pl.col("forecast").cum_sum().over("item").alias("cum_sales")
+    )
+    projection = forecast.select(
+        "item",
+        "date",
+        (pl.col("current_inventory") - pl.col("cum_sales")).clip(lower_bound=0.0).alias("forecast_inventory")
+    )
+
+    stockout = forecast.group_by("item", maintain_order=True).agg(
+        pl.col("current_inventory").first(),
+        pl.col("forecast").mean().alias("mean_forecast_sales")
+    ).with_columns(
+        pl.when((pl.col("current_inventory") > 0) & (pl.col("mean_forecast_sales") > MIN_DAILY_SALES))
+        .then((pl.col("current_inventory") / pl.col("mean_forecast_sales")).round(1))
+        .alias("days_to_stockout"),
+        pl.when(pl.col("current_inventory") == 0).then(pl.lit("Запасы уже 0"))
+        .when(pl.col("mean_forecast_sales") <= MIN_DAILY_SALES).then(pl.lit("Нет продаж/минимальные"))
+        .otherwise(pl.lit("Продаётся"))
+        .alias("status"),
+        pl.col("mean_forecast_sales").round(2)
+    )
+    return projection, stockout
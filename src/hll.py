@@ -0,0 +1,151 @@
+# src/hll.py
+import math
+
+import numpy as np
+import polars as pl
+
+from settings import ANALYTICS_HLL_ERROR
+
+MIN_PRECISION = 4
+MAX_PRECISION = 18
+
+
+def precision_for_error(error):
+    """
+    Точность p (2^p регистров), при которой стандартная ошибка HLL
+    1.04 / sqrt(2^p) не превышает error.
+    """
+    p = math.ceil(math.log2((1.04 / error) ** 2))
+    return min(max(p, MIN_PRECISION), MAX_PRECISION)
+
+
+# Точность скетчей из настройки ANALYTICS_HLL_ERROR
+PRECISION = precision_for_error(ANALYTICS_HLL_ERROR)
+
+
+def standard_error(p=PRECISION):
+    return 1.04 / math.sqrt(1 << p)
+
+
+def hash64(values: np.ndarray) -> np.ndarray:
+    """
+    64-битный хэш splitmix64 для целых идентификаторов.
+    Свой, а не встроенный хэш polars: сохранённые скетчи должны оставаться
+    совместимыми при обновлении библиотек.
+    """
+    z = values.astype(np.uint64, copy=True)
+    with np.errstate(over="ignore"):
+        z += np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """
+    Длина в битах для uint64 (точно: каждая половина по 32 бита переводится в float без потерь).
+    """
+    high = (values >> np.uint64(32)).astype(np.float64)
+    low = (values & np.uint64(0xFFFFFFFF)).astype(np.float64)
+    return np.where(high > 0, 32 + np.frexp(high)[1], np.frexp(low)[1])
+
+
+def register_ranks(values: np.ndarray, p=PRECISION):
+    """
+    Номер регистра (старшие p бит хэша) и ранг – позиция первой единицы
+    в оставшихся 64 - p битах (от 1 до 64 - p + 1).
+    """
+    hashed = hash64(values)
+    registers = (hashed >> np.uint64(64 - p)).astype(np.int64)
+    rest = hashed & np.uint64((1 << (64 - p)) - 1)
+    ranks = (64 - p) - _bit_length(rest) + 1
+    return registers, ranks.astype(np.int64)
+
+
+def sketch_columns(frame: pl.LazyFrame, column, p=PRECISION) -> pl.LazyFrame:
+    """
+    Добавляет к строкам колонки register и rank по значению column.
+    Дальше скетч любой группы – group_by([..., "register"]).agg(pl.col("rank").max()).
+    """
+    def packed(series: pl.Series) -> pl.Series:
+        registers, ranks = register_ranks(series.to_numpy(), p)
+        return pl.Series((registers << 8) | ranks, dtype=pl.Int64)
+
+    return frame.with_columns(
+        pl.col(column).cast(pl.Int64).map_batches(packed, return_dtype=pl.Int64).alias("_packed")
+    ).with_columns(
+        (pl.col("_packed") // 256).alias("register"),
+        (pl.col("_packed") % 256).alias("rank")
+    ).drop("_packed")
+
+
+def dense_sketches(sketches: pl.DataFrame, days, p=PRECISION) -> np.ndarray:
+    """
+    Матрица регистров (число дней × 2^p) из разреженных дневных скетчей
+    (day, register, rank). Дни без данных – нулевые строки.
+    """
+    matrix = np.zeros((len(days), 1 << p), dtype=np.uint8)
+    if sketches.height == 0:
+        return matrix
+    day_index = {day: i for i, day in enumerate(days)}
+    sketches = sketches.filter(pl.col("day").is_in(list(days)))
+    rows = np.array([day_index[day] for day in sketches["day"].to_list()], dtype=np.int64)
+    matrix[rows, sketches["register"].to_numpy()] = sketches["rank"].to_numpy()
+    return matrix
+
+
+def rolling_merge(matrix: np.ndarray, window) -> np.ndarray:
+    """
+    Объединение скетчей скользящим окном: строка i – поэлементный максимум
+    строк [i - window + 1, i]. Окно набирается удвоением за O(log window) проходов.
+    """
+    result = matrix.copy()
+    span = 1
+    while span < window:
+        step = min(span, window - span)
+        shifted = np.zeros_like(result)
+        if step < len(result):
+            shifted[step:] = result[:-step]
+        np.maximum(result, shifted, out=result)
+        span += step
+    return result
+
+
+def estimate(matrix: np.ndarray) -> np.ndarray:
+    """
+    Оценка числа различных значений для каждой строки матрицы регистров
+    (с поправкой linear counting для малых значений).
+    """
+    m = matrix.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.ldexp(1.0, -matrix.astype(np.int32)), axis=1)
+    zeros = np.count_nonzero(matrix == 0, axis=1)
+    with np.errstate(divide="ignore"):
+        small = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), small, raw)
+
+
+def rolling_distinct(sketches: pl.DataFrame, days, window, p=PRECISION) -> np.ndarray:
+    """
+    Оценка числа различных пользователей за окно из window дней,
+    заканчивающееся каждым днём из days (days – подряд идущие дни).
+    """
+    return estimate(rolling_merge(dense_sketches(sketches, days, p), window))
+
+
+def rolling_distinct_exact(frame: pl.LazyFrame, date_column, column, window) -> pl.DataFrame:
+    """
+    Точное число различных значений column за окно из window дней,
+    заканчивающееся каждым днём (для небольших данных): day, distinct.
+    """
+    return frame.select(
+        pl.col(date_column).cast(pl.Datetime("us")).dt.truncate("1d").alias("day"),
+        pl.col(column)
+    ).unique().sort("day").group_by_dynamic(
+        "day", every="1d", period=f"{window}d", offset=f"-{window - 1}d", closed="left", label="left"
+    ).agg(
+        pl.col(column).n_unique().cast(pl.Int64).alias("distinct")
+    ).with_columns(
+        # Метка окна – его первый день; окно относим к последнему
+        pl.col("day").dt.offset_by(f"{window - 1}d")
+    ).collect()
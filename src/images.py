@@ -0,0 +1,51 @@
+# src/images.py
+import io
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from settings import IMAGE_JPEG_QUALITY
+
+# Расширение файла -> (формат Pillow, расширение ключа в S3)
+IMAGE_FORMATS = {
+    "jpg": ("JPEG", "jpg"),
+    "jpeg": ("JPEG", "jpg"),
+    "png": ("PNG", "png")
+}
+
+
+def image_extension(filename):
+    """
+    Расширение, под которым изображение хранится в S3 (jpg или png),
+    или None для файлов, которые не пережимаются.
+    """
+    extension = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return IMAGE_FORMATS[extension][1] if extension in IMAGE_FORMATS else None
+
+
+def normalize_image(file_bytes, extension, max_size):
+    """
+    Уменьшает изображение так, чтобы наибольшая сторона не превышала max_size,
+    с учётом ориентации из EXIF. Изображения, которые уже укладываются в размер
+    и не повёрнуты, возвращаются как есть – без повторного сжатия.
+
+    :param extension: jpg или png (см. image_extension)
+    :return: bytes в том же формате
+    :raises ValueError: если байты не читаются как изображение
+    """
+    try:
+        # open() читает только заголовок: размер известен без декодирования
+        image = Image.open(io.BytesIO(file_bytes))
+        # 0x0112 – тег ориентации EXIF, 1 – без поворота
+        if max(image.size) <= max_size and image.getexif().get(0x0112, 1) == 1:
+            return file_bytes
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+
+        buffer = io.BytesIO()
+        if IMAGE_FORMATS[extension][0] == "JPEG":
+            image.convert("RGB").save(buffer, "JPEG", quality=IMAGE_JPEG_QUALITY, optimize=True, progressive=True)
+        else:
+            image.save(buffer, "PNG", optimize=True)
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError(f"Не удалось прочитать изображение: {e}") from e
+    return buffer.getvalue()
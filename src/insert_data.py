@@ -1,5 +1,11 @@
 # insert_data.py
+from psycopg2.extras import execute_values
 
+from data_cache import invalidate_tables
+from instrumentation import traced
+
+
+@traced("db.write")
 def insert_event(conn, event_name, description, title,
                  start_ds, end_ds, status, event_type,
                  max_users, coin, achievement_type_id, company_id):
@@ -24,7 +30,9 @@ def insert_event(conn, event_name, description, title,
             company_id
         ))
     conn.commit()
+    invalidate_tables("events")
 
+@traced("db.write")
 def update_event(conn, event_id, event_name, description, title,
                  start_ds, end_ds, status, event_type,
                  max_users, coin, achievement_type_id, company_id):
@@ -59,14 +67,18 @@ def update_event(conn, event_id, event_name, description, title,
             event_id
         ))
     conn.commit()
+    invalidate_tables("events")
 
+@traced("db.write")
 def delete_event(conn, event_id):
     with conn.cursor() as cur:
         query = "DELETE FROM events WHERE event_id=%s"
         cur.execute(query, (event_id,))
     conn.commit()
+    invalidate_tables("events", "event_user_visits")
 
 
+@traced("db.write")
 def update_visit(conn, event_id, user_id, new_visit):
     """Обновляет статус посещаемости в базе (attended или missed)."""
     with conn.cursor() as cur:
@@ -77,23 +89,155 @@ def update_visit(conn, event_id, user_id, new_visit):
         """
         cur.execute(query, (new_visit, event_id, user_id))
     conn.commit()
+    invalidate_tables("event_user_visits")
+
+
+# SQL-типы колонок из каталога PostgreSQL: {(таблица, колонка): тип}
+_column_types = {}
+
+def column_type(conn, table, column):
+    """
+    SQL-тип колонки (format_type из pg_attribute, например text или enum visit_status)
+    для явного приведения значений в VALUES. Читается из каталога один раз на процесс.
+    """
+    key = (table, column)
+    if key not in _column_types:
+        query = """
+            SELECT format_type(a.atttypid, a.atttypmod)
+              FROM pg_attribute a
+             WHERE a.attrelid = %s::regclass
+               AND a.attname = %s
+               AND NOT a.attisdropped
+        """
+        with conn.cursor() as cur:
+            cur.execute(query, (table, column))
+            row = cur.fetchone()
+        if row is None:
+            raise ValueError(f"Колонка {table}.{column} не найдена.")
+        _column_types[key] = row[0]
+    return _column_types[key]
+
+@traced("db.write", measure=lambda args, kwargs, result: (len(result), None))
+def update_visits(conn, changes):
+    """
+    Массово обновляет статусы посещаемости одним запросом UPDATE ... FROM (VALUES ...)
+    в одной транзакции.
+
+    :param changes: iterable кортежей (event_id, user_id, visit)
+    :return: словарь {(event_id, user_id): True, если строка найдена и обновлена}
+    """
+    # Дубликаты ключей схлопываем: побеждает последнее значение
+    latest = {(event_id, user_id): visit for event_id, user_id, visit in changes}
+    if not latest:
+        return {}
+
+    query = """
+        UPDATE event_user_visits AS euv
+           SET visit = v.visit
+          FROM (VALUES %s) AS v (event_id, user_id, visit)
+         WHERE euv.event_id = v.event_id
+           AND euv.user_id = v.user_id
+     RETURNING euv.event_id, euv.user_id
+    """
+    rows = [(event_id, user_id, visit) for (event_id, user_id), visit in latest.items()]
+    # Литерал в VALUES без приведения получает тип text, и SET visit = v.visit
+    # не пройдёт, если visit – enum или домен: приводим к типу колонки явно
+    visit_type = column_type(conn, "event_user_visits", "visit")
+    with conn.cursor() as cur:
+        # page_size=len(rows) – все строки уходят одним запросом
+        updated = execute_values(
+            cur, query, rows,
+            template=f"(%s::bigint, %s::bigint, %s::{visit_type})",
+            page_size=len(rows),
+            fetch=True
+        )
+    conn.commit()
+    invalidate_tables("event_user_visits")
+
+    updated_keys = {(int(event_id), int(user_id)) for event_id, user_id in updated}
+    return {key: (int(key[0]), int(key[1])) in updated_keys for key in latest}
 
 
 # src/insert_data.py (примерный файл для вспомогательных функций)
 
-def add_product_to_db(conn, name, price, description, image, availability, category, case_type_id=None):
+@traced("db.write")
+def add_product_to_db(conn, name, price, description, image, availability, category, case_type_id=None,
+                      image_thumbnail=None):
     """
     Добавляет новый товар (мерч или кейс) в таблицу product.
     Если это кейс, case_type_id должен быть не None.
+    image_thumbnail – ссылка на миниатюру изображения (s3_utils.StoredImage.thumbnail_url).
+    """
+    query = """
+        INSERT INTO product (name, price, description, image, avalibility, product_category, case_type_id,
+                             image_thumbnail)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+    """
+    with conn.cursor() as cur:
+        cur.execute(query, (name, price, description, image, availability, category, case_type_id, image_thumbnail))
+    conn.commit()
+    invalidate_tables("product")
+
+@traced("db.write", measure=lambda args, kwargs, result: (len(result), None))
+def add_products_to_db(conn, products):
+    """
+    Массово добавляет товары одним запросом INSERT ... VALUES в одной транзакции.
+
+    :param products: iterable кортежей
+                     (name, price, description, image, availability, category, case_type_id, image_thumbnail)
+    :return: список product_id новых товаров в порядке products
+    """
+    rows = [tuple(product) for product in products]
+    if not rows:
+        return []
+
+    query = """
+        INSERT INTO product (name, price, description, image, avalibility, product_category, case_type_id,
+                             image_thumbnail)
+        VALUES %s
+     RETURNING product_id
+    """
+    with conn.cursor() as cur:
+        # page_size=len(rows) – все строки уходят одним запросом (RETURNING в порядке VALUES)
+        inserted = execute_values(cur, query, rows, page_size=len(rows), fetch=True)
+    conn.commit()
+    invalidate_tables("product")
+    return [int(product_id) for (product_id,) in inserted]
+
+@traced("db.write", measure=lambda args, kwargs, result: (result, None))
+def update_product_images(conn, images):
+    """
+    Массово заменяет ссылки на изображения и миниатюры товаров одним UPDATE ... FROM (VALUES ...).
+
+    :param images: iterable кортежей (product_id, image, image_thumbnail)
+    :return: число обновлённых товаров
     """
+    # Дубликаты товаров схлопываем: побеждает последняя ссылка
+    latest = {int(product_id): (image, thumbnail) for product_id, image, thumbnail in images}
+    rows = [(product_id, image, thumbnail) for product_id, (image, thumbnail) in latest.items()]
+    if not rows:
+        return 0
+
     query = """
-        INSERT INTO product (name, price, description, image, avalibility, product_category, case_type_id)
-        VALUES (%s, %s, %s, %s, %s, %s, %s)
+        UPDATE product AS p
+           SET image = v.image,
+               image_thumbnail = v.image_thumbnail
+          FROM (VALUES %s) AS v (product_id, image, image_thumbnail)
+         WHERE p.product_id = v.product_id
+     RETURNING p.product_id
     """
     with conn.cursor() as cur:
-        cur.execute(query, (name, price, description, image, availability, category, case_type_id))
+        updated = execute_values(
+            cur, query, rows,
+            template="(%s::bigint, %s, %s)",
+            page_size=len(rows),
+            fetch=True
+        )
     conn.commit()
+    invalidate_tables("product")
+    return len(updated)
 
+@traced("db.write")
 def delete_product(conn, product_id):
     """
     Удаляет товар из таблицы product по product_id.
@@ -103,10 +247,13 @@ def delete_product(conn, product_id):
     with conn.cursor() as cur:
         cur.execute(query, (product_id,))
     conn.commit()
+    invalidate_tables("product", "case_product_probability", "user_winnings")
 
-def update_product(conn, product_id, name, price, description, image, availability, category, case_type_id=None):
+@traced("db.write")
+def update_product(conn, product_id, name, price, description, image, availability, category, case_type_id=None,
+                   image_thumbnail=None):
     """
-    Обновляет товар в таблице product по product_id.
+    Обновляет товар в таблице product по product_id (вместе со ссылкой на миниатюру).
     """
     query = """
         UPDATE product
@@ -116,13 +263,18 @@ def update_product(conn, product_id, name, price, description, image, availabili
                image = %s,
                avalibility = %s,
                product_category = %s,
-               case_type_id = %s
+               case_type_id = %s,
+               image_thumbnail = %s
          WHERE product_id = %s
     """
     with conn.cursor() as cur:
-        cur.execute(query, (name, price, description, image, availability, category, case_type_id, product_id))
+        cur.execute(query, (
+            name, price, description, image, availability, category, case_type_id, image_thumbnail, product_id
+        ))
     conn.commit()
+    invalidate_tables("product")
 
+@traced("db.write")
 def update_case_probabilities(conn, case_type_id, product_id, new_probability):
     """
     Обновляет вероятность выпадения товара (product_id) в данном кейсе (case_type_id).
@@ -137,7 +289,9 @@ def update_case_probabilities(conn, case_type_id, product_id, new_probability):
     with conn.cursor() as cur:
         cur.execute(query, (new_probability, case_type_id, product_id))
     conn.commit()
+    invalidate_tables("case_product_probability")
 
+@traced("db.write")
 def insert_case_probability(conn, case_type_id, product_id, probability):
     """
     Если нужно вставить новую связь (case_type_id, product_id) в case_product_probability.
@@ -149,7 +303,9 @@ def insert_case_probability(conn, case_type_id, product_id, probability):
     with conn.cursor() as cur:
         cur.execute(query, (case_type_id, product_id, probability))
     conn.commit()
+    invalidate_tables("case_product_probability")
 
+@traced("db.write")
 def delete_case_probability(conn, case_type_id, product_id):
     """
     Удаляет связь (case_type_id, product_id) из case_product_probability.
@@ -162,7 +318,78 @@ def delete_case_probability(conn, case_type_id, product_id):
     with conn.cursor() as cur:
         cur.execute(query, (case_type_id, product_id))
     conn.commit()
+    invalidate_tables("case_product_probability")
+
+# Допустимое отклонение суммы вероятностей кейса от 100%
+PROBABILITY_TOTAL_TOLERANCE = 0.01
+
+@traced("db.write", measure=lambda args, kwargs, result: (sum(result.values()), None))
+def apply_case_probabilities(conn, case_type_id, rows):
+    """
+    Приводит вероятности кейса к заданному набору одним запросом в одной транзакции:
+    удаляет связи с товарами, которых нет в rows, обновляет изменённые
+    вероятности и добавляет новые товары (CTE с DELETE / UPDATE / INSERT).
+
+    :param rows: iterable пар (product_id, drop_probability) – полный новый состав кейса;
+                 каждый товар один раз, сумма вероятностей должна быть 100
+    :return: {"deleted": n, "updated": n, "inserted": n}
+    :raises ValueError: пустой состав, повтор товара или сумма не 100%
+    """
+    rows = [(int(product_id), float(probability)) for product_id, probability in rows]
+    desired = dict(rows)
+    if len(desired) != len(rows):
+        duplicates = sorted({product_id for product_id, _ in rows if sum(p == product_id for p, _ in rows) > 1})
+        raise ValueError(f"Товар указан несколько раз: {', '.join(map(str, duplicates))}.")
+    if not desired:
+        raise ValueError("В кейсе должен остаться хотя бы один товар.")
+    total = sum(desired.values())
+    if abs(total - 100.0) > PROBABILITY_TOTAL_TOLERANCE:
+        raise ValueError(f"Сумма вероятностей должна быть 100%, сейчас {total:g}%.")
+
+    values = ", ".join(["(%s::bigint, %s::numeric)"] * len(desired))
+    query = f"""
+        WITH desired (product_id, drop_probability) AS (
+            VALUES {values}
+        ),
+        deleted AS (
+            DELETE FROM case_product_probability AS cpp
+             WHERE cpp.case_type_id = %s
+               AND NOT EXISTS (SELECT 1 FROM desired d WHERE d.product_id = cpp.product_id)
+         RETURNING 1
+        ),
+        updated AS (
+            UPDATE case_product_probability AS cpp
+               SET drop_probability = d.drop_probability
+              FROM desired d
+             WHERE cpp.case_type_id = %s
+               AND cpp.product_id = d.product_id
+               AND cpp.drop_probability IS DISTINCT FROM d.drop_probability
+         RETURNING 1
+        ),
+        inserted AS (
+            INSERT INTO case_product_probability (case_type_id, product_id, drop_probability)
+            SELECT %s, d.product_id, d.drop_probability
+              FROM desired d
+             WHERE NOT EXISTS (
+                   SELECT 1 FROM case_product_probability cpp
+                    WHERE cpp.case_type_id = %s
+                      AND cpp.product_id = d.product_id
+             )
+         RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM deleted),
+               (SELECT COUNT(*) FROM updated),
+               (SELECT COUNT(*) FROM inserted)
+    """
+    params = [value for pair in desired.items() for value in pair] + [case_type_id] * 4
+    with conn.cursor() as cur:
+        cur.execute(query, params)
+        deleted, updated, inserted = cur.fetchone()
+    conn.commit()
+    invalidate_tables("case_product_probability")
+    return {"deleted": deleted, "updated": updated, "inserted": inserted}
 
+@traced("db.write")
 def create_case_type(conn, name, description):
     """
     Создаёт новую запись в таблице case_type (например, 'Платиновый кейс').
@@ -171,7 +398,9 @@ def create_case_type(conn, name, description):
     with conn.cursor() as cur:
         cur.execute(query, (name, description))
     conn.commit()
+    invalidate_tables("case_type")
 
+@traced("db.write")
 def delete_case_type(conn, case_type_id):
     """
     Удаляет запись из таблицы case_type.
@@ -181,7 +410,9 @@ def delete_case_type(conn, case_type_id):
     with conn.cursor() as cur:
         cur.execute(query, (case_type_id,))
     conn.commit()
+    invalidate_tables("case_type", "case_product_probability", "product")
 
+@traced("db.write")
 def update_case_type(conn, case_type_id, new_name, new_description):
     """
     Обновляет запись в таблице case_type.
@@ -195,7 +426,9 @@ def update_case_type(conn, case_type_id, new_name, new_description):
     with conn.cursor() as cur:
         cur.execute(query, (new_name, new_description, case_type_id))
     conn.commit()
+    invalidate_tables("case_type")
 
+@traced("db.write")
 def update_winning_delivery(conn, user_winning_id, delivered, delivered_by):
     """
     Выдача товара (обновляет поле delivered, delivered_at и delivered_by).
@@ -210,3 +443,4 @@ def update_winning_delivery(conn, user_winning_id, delivered, delivered_by):
     with conn.cursor() as cur:
         cur.execute(query, (delivered, delivered_by, user_winning_id))
     conn.commit()
+    invalidate_tables("user_winnings")
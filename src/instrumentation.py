@@ -0,0 +1,280 @@
+# src/instrumentation.py
+import bisect
+import contextvars
+import functools
+import json
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+from settings import DASHBOARD_DEBUG, METRICS_LOG_PATH
+
+# Границы корзин гистограммы задержек, мс
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000]
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_section = contextvars.ContextVar("current_section", default=None)
+
+
+class Span:
+    """
+    Один замер: запрос к БД, запись, обращение к S3 или к API, отрисовка вкладки.
+    rows и bytes заполняет вызывающий код, если они известны.
+    """
+
+    def __init__(self, kind, name, page, section, started_at):
+        self.kind = kind
+        self.name = name
+        self.page = page
+        self.section = section
+        self.started_at = started_at
+        self.duration_ms = 0.0
+        self.rows = None
+        self.bytes = None
+        self.ok = True
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "name": self.name,
+            "page": self.page,
+            "section": self.section,
+            "duration_ms": round(self.duration_ms, 3),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "ok": self.ok
+        }
+
+
+class RerunTrace:
+    """
+    Все замеры одного прогона страницы (для «водопада» в отладочной панели).
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.started_at = time.perf_counter()
+        self._lock = threading.Lock()
+        self.spans = []
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+
+class MetricsRegistry:
+    """
+    Накопительная статистика на процесс: гистограммы задержек, строки и байты
+    по ключу (страница, вкладка, тип, имя). При заданном log_path каждый замер
+    дописывается в JSONL-журнал.
+    """
+
+    def __init__(self, log_path=None):
+        self.log_path = log_path
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, span):
+        key = (span.page, span.section, span.kind, span.name)
+        bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, span.duration_ms)
+        with self._lock:
+            stats = self._stats.setdefault(key, {
+                "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0,
+                "rows": 0, "bytes": 0, "buckets": [0] * (len(LATENCY_BUCKETS_MS) + 1)
+            })
+            stats["count"] += 1
+            stats["errors"] += 0 if span.ok else 1
+            stats["total_ms"] += span.duration_ms
+            stats["max_ms"] = max(stats["max_ms"], span.duration_ms)
+            stats["rows"] += span.rows or 0
+            stats["bytes"] += span.bytes or 0
+            stats["buckets"][bucket] += 1
+            if self.log_path:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps({"ts": time.time(), **span.as_dict()}, ensure_ascii=False) + "\n")
+
+    def export(self):
+        """
+        Возвращает список словарей со сводкой по каждому ключу,
+        включая оценки p50/p95 по корзинам гистограммы.
+        """
+        with self._lock:
+            items = [(key, dict(stats, buckets=list(stats["buckets"]))) for key, stats in self._stats.items()]
+        result = []
+        for (page, section, kind, name), stats in items:
+            result.append({
+                "page": page,
+                "section": section,
+                "kind": kind,
+                "name": name,
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "avg_ms": round(stats["total_ms"] / stats["count"], 3),
+                "p50_ms": _bucket_quantile(stats["buckets"], 0.5),
+                "p95_ms": _bucket_quantile(stats["buckets"], 0.95),
+                "max_ms": round(stats["max_ms"], 3),
+                "rows": stats["rows"],
+                "bytes": stats["bytes"],
+                "histogram": dict(zip([f"<={b}ms" for b in LATENCY_BUCKETS_MS] + ["inf"], stats["buckets"]))
+            })
+        return sorted(result, key=lambda r: r["avg_ms"] * r["count"], reverse=True)
+
+
+def _bucket_quantile(buckets, q):
+    """
+    Верхняя граница корзины, в которую попадает квантиль q.
+    """
+    target = q * sum(buckets)
+    running = 0
+    for i, count in enumerate(buckets):
+        running += count
+        if running >= target:
+            return LATENCY_BUCKETS_MS[i] if i < len(LATENCY_BUCKETS_MS) else None
+    return None
+
+
+# Общий на процесс реестр (модуль импортируется один раз)
+registry = MetricsRegistry(log_path=METRICS_LOG_PATH)
+
+
+# -------------------------------------
+# API для страниц и модулей доступа к данным
+# -------------------------------------
+def start_rerun(page):
+    """
+    Начинает трассировку прогона страницы. Вызывается в начале скрипта страницы.
+    """
+    trace = RerunTrace(page)
+    _current_trace.set(trace)
+    _current_section.set(None)
+    return trace
+
+
+@contextmanager
+def section(name):
+    """
+    Помечает замеры внутри блока названием вкладки/раздела
+    и сам замеряет время отрисовки раздела.
+    """
+    token = _current_section.set(name)
+    try:
+        with track("render", name):
+            yield
+    finally:
+        _current_section.reset(token)
+
+
+@contextmanager
+def track(kind, name):
+    """
+    Замеряет блок кода. Возвращает Span, в который можно записать rows и bytes.
+    """
+    trace = _current_trace.get()
+    span = Span(kind, name, trace.page if trace else None, _current_section.get(), time.perf_counter())
+    try:
+        yield span
+    except BaseException as e:
+        # Остановка/перезапуск скрипта Streamlit – не ошибка вызова
+        span.ok = type(e).__name__ in ("StopException", "RerunException")
+        raise
+    finally:
+        span.duration_ms = (time.perf_counter() - span.started_at) * 1000
+        if trace is not None:
+            trace.add(span)
+        registry.record(span)
+
+
+def traced(kind, name=None, measure=None):
+    """
+    Декоратор: замеряет каждый вызов функции.
+
+    :param name: имя замера (по умолчанию – имя функции)
+    :param measure: необязательная функция (args, kwargs, result) -> (rows, bytes)
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with track(kind, name or func.__name__) as span:
+                result = func(*args, **kwargs)
+                if measure is not None:
+                    span.rows, span.bytes = measure(args, kwargs, result)
+                return result
+        return wrapper
+    return decorator
+
+
+def query_name(query, limit=80):
+    """
+    Короткое имя запроса для отчётов: одна строка без лишних пробелов.
+    """
+    text = " ".join(query.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def frame_measure(frame):
+    """
+    (rows, bytes) для polars.DataFrame.
+    """
+    return frame.height, frame.estimated_size()
+
+
+# -------------------------------------
+# Отладочная панель
+# -------------------------------------
+def debug_enabled():
+    return DASHBOARD_DEBUG or st.query_params.get("debug") == "1"
+
+
+def render_debug_sidebar():
+    """
+    Показывает в боковой панели «водопад» текущего прогона и сводку по процессу.
+    Включается переменной DASHBOARD_DEBUG=1 или параметром ?debug=1 в адресе.
+    Вызывается в конце скрипта страницы.
+    """
+    trace = _current_trace.get()
+    if trace is None or not debug_enabled():
+        return
+
+    import plotly.graph_objects as go
+
+    with st.sidebar:
+        st.subheader("Отладка: время прогона")
+        total_ms = (time.perf_counter() - trace.started_at) * 1000
+        st.caption(f"Прогон {trace.page}: {total_ms:.0f} мс, замеров: {len(trace.spans)}")
+
+        spans = sorted(trace.spans, key=lambda s: s.started_at)
+        if spans:
+            labels = [f"{s.section or '-'} · {s.kind} · {s.name}" for s in spans]
+            fig = go.Figure(go.Bar(
+                y=labels,
+                x=[s.duration_ms for s in spans],
+                base=[(s.started_at - trace.started_at) * 1000 for s in spans],
+                orientation="h",
+                marker_color=["#d62728" if not s.ok else "#1f77b4" for s in spans],
+                hovertext=[f"rows={s.rows}, bytes={s.bytes}" for s in spans]
+            ))
+            fig.update_layout(
+                height=max(200, 22 * len(spans)),
+                margin=dict(l=0, r=0, t=10, b=0),
+                xaxis_title="мс от начала прогона",
+                yaxis=dict(autorange="reversed"),
+                template="plotly_white"
+            )
+            st.plotly_chart(fig, use_container_width=True)
+
+        summary = registry.export()
+        if summary:
+            st.write("Самые дорогие вызовы (процесс):")
+            st.dataframe(
+                [{k: r[k] for k in ("page", "section", "kind", "name", "count", "avg_ms", "p95_ms", "rows")}
+                 for r in summary[:20]],
+                hide_index=True
+            )
+            st.download_button(
+                "Скачать метрики (JSON)",
+                data=json.dumps(summary, ensure_ascii=False, indent=2),
+                file_name="dashboard_metrics.json",
+                mime="application/json"
+            )
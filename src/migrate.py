@@ -0,0 +1,31 @@
+# src/migrate.py
+import glob
+import os
+
+from settings import db_connection
+
+# Каталог SQL-миграций: в образе – /opt/app/migrations, рядом с src
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "migrations")
+
+
+def apply_migrations(conn, directory=MIGRATIONS_DIR):
+    """
+    Применяет все миграции *.sql из directory в порядке имён, в одной транзакции.
+    Миграции идемпотентны (IF NOT EXISTS), поэтому запускаются при каждом деплое
+    перед стартом приложения.
+
+    :return: список применённых файлов
+    """
+    paths = sorted(glob.glob(os.path.join(directory, "*.sql")))
+    with conn.cursor() as cur:
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                cur.execute(f.read())
+    conn.commit()
+    return [os.path.basename(path) for path in paths]
+
+
+if __name__ == "__main__":
+    with db_connection() as conn:
+        for name in apply_migrations(conn):
+            print(f"Применена миграция {name}")
@@ -1,10 +1,13 @@
 import streamlit as st
 import polars as pl
 from datetime import datetime, time
-import requests  # импортируем requests для HTTP-запросов
 
 from settings import db_connection
-from insert_data import insert_event, update_event, delete_event, update_visit
+from achievements_api import visit_dispatcher
+from data_cache import read_cached, RerunSnapshot
+from visits import diff_visits, edited_attendance, fetch_visits_page, count_visits, VISITS_PAGE_SIZE
+from instrumentation import start_rerun, section, render_debug_sidebar
+from insert_data import insert_event, update_event, delete_event, update_visits
 
 ENG_TO_RU = {
     "attended": "Посетил",
@@ -13,16 +16,41 @@ ENG_TO_RU = {
 }
 RU_TO_ENG = {v: k for k, v in ENG_TO_RU.items()}
 
+# Пары (event_id, user_id), для которых посещение уже сохранено, а ачивка не начислена:
+# diff_visits их больше не вернёт, поэтому они ждут повторной отправки в сессии
+FAILED_ACHIEVEMENTS_KEY = "visits_failed_achievements"
+
+def send_visit_achievements(visits):
+    """
+    Отправляет ачивки за посещение параллельно и показывает ошибки.
+    Неудачные пары запоминаются в st.session_state[FAILED_ACHIEVEMENTS_KEY]
+    для повторной отправки, удачные оттуда убираются.
+
+    :return: список неудачных пар (event_id, user_id)
+    """
+    progress = st.progress(0.0, text="Начисление ачивок...")
+    results = visit_dispatcher().dispatch(
+        visits,
+        on_progress=lambda done, total: progress.progress(done / total)
+    )
+    failed = [result for result in results if not result.ok]
+    for result in failed:
+        st.error(
+            f"Ошибка при отправке запроса для eventID={result.event_id}, "
+            f"userID={result.user_id}: {result.status_code or result.error}"
+        )
+    failed_keys = [(result.event_id, result.user_id) for result in failed]
+    sent = {(result.event_id, result.user_id) for result in results}
+    st.session_state[FAILED_ACHIEVEMENTS_KEY] = [
+        key for key in st.session_state.get(FAILED_ACHIEVEMENTS_KEY, []) if key not in sent
+    ] + failed_keys
+    return failed_keys
+
 def load_events():
-    conn = db_connection()
-    df = pl.read_database("SELECT * FROM events", connection=conn)
-    conn.close()
-    return df
+    return read_cached("SELECT * FROM events", tables=["events"])
 
 def load_companies():
-    conn = db_connection()
-    company_df = pl.read_database("SELECT company_id, company FROM company", connection=conn)
-    conn.close()
+    company_df = read_cached("SELECT company_id, company FROM company", tables=["company"])
 
     name_to_id = {}
     for row in company_df.to_dicts():
@@ -30,13 +58,18 @@ def load_companies():
     return name_to_id
 
 
+start_rerun("1_page_one")
+
+# Все вкладки выполняются на каждом rerun – читаем каждый набор один раз за прогон
+snapshot = RerunSnapshot(events=load_events, companies=load_companies)
+
 st.title("Админка: таблица Events")
 tab_view, tab_add, tab_edit, tab_delete, tab_visits = st.tabs(["Просмотр", "Добавить", "Редактировать", "Удалить", "Визиты"])
 
 # ========= Вкладка "Просмотр" =========
-with tab_view:
+with tab_view, section("Просмотр"):
     st.subheader("Просмотр таблицы ивенты и задачи")
-    df_events = load_events()
+    df_events = snapshot["events"]
     if len(df_events) == 0:
         st.warning("Таблица events пуста.")
     else:
@@ -58,10 +91,10 @@ with tab_view:
         st.dataframe(df_display)
 
 # ========= Вкладка "Добавить" =========
-with tab_add:
+with tab_add, section("Добавить"):
     st.subheader("Добавить новую запись (ивент, задача)")
 
-    companies_dict = load_companies()
+    companies_dict = snapshot["companies"]
     company_names = list(companies_dict.keys())
 
     with st.form("add_form", clear_on_submit=True):
@@ -152,29 +185,28 @@ with tab_add:
 
         submitted = st.form_submit_button("Добавить запись")
         if submitted:
-            conn = db_connection()
-            insert_event(
-                conn,
-                event_name,
-                description,
-                title,
-                start_ds,
-                end_ds,
-                status,
-                event_type,
-                max_users,
-                coin,
-                achievement_type_id,
-                chosen_company_id
-            )
-            conn.close()
+            with db_connection() as conn:
+                insert_event(
+                    conn,
+                    event_name,
+                    description,
+                    title,
+                    start_ds,
+                    end_ds,
+                    status,
+                    event_type,
+                    max_users,
+                    coin,
+                    achievement_type_id,
+                    chosen_company_id
+                )
             st.success("Запись успешно добавлена!")
             st.rerun()
 
 # ========= Вкладка "Редактировать" =========
-with tab_edit:
+with tab_edit, section("Редактировать"):
     st.subheader("Редактировать существующую запись в events")
-    df_events = load_events()
+    df_events = snapshot["events"]
 
     if len(df_events) == 0:
         st.warning("Таблица events пуста, нечего редактировать.")
@@ -257,7 +289,7 @@ with tab_edit:
             )
 
             st.write("---")
-            companies_dict = load_companies()
+            companies_dict = snapshot["companies"]
             company_names = list(companies_dict.keys())
 
             current_company_id = row_to_edit["company_id"] or 0
@@ -284,30 +316,29 @@ with tab_edit:
 
             save_changes = st.form_submit_button("Сохранить изменения")
             if save_changes:
-                conn = db_connection()
-                update_event(
-                    conn,
-                    selected_id,
-                    new_event_name,
-                    new_description,
-                    new_title,
-                    updated_start_ds,
-                    updated_end_ds,
-                    new_status,
-                    new_event_type,
-                    new_max_users,
-                    new_coin,
-                    new_achievement_type_id,
-                    new_company_id
-                )
-                conn.close()
+                with db_connection() as conn:
+                    update_event(
+                        conn,
+                        selected_id,
+                        new_event_name,
+                        new_description,
+                        new_title,
+                        updated_start_ds,
+                        updated_end_ds,
+                        new_status,
+                        new_event_type,
+                        new_max_users,
+                        new_coin,
+                        new_achievement_type_id,
+                        new_company_id
+                    )
                 st.success(f"Запись с event_id={selected_id} обновлена!")
                 st.rerun()
 
 # ========= Вкладка "Удалить" =========
-with tab_delete:
+with tab_delete, section("Удалить"):
     st.subheader("Удалить запись из таблицы events")
-    df_events = load_events()
+    df_events = snapshot["events"]
     if len(df_events) == 0:
         st.warning("Таблица events пуста, нечего удалять.")
     else:
@@ -316,21 +347,18 @@ with tab_delete:
             selected_id_delete = st.selectbox("Выберите event_id для удаления", event_ids_delete)
             delete_button = st.form_submit_button("Удалить")
             if delete_button:
-                conn = db_connection()
-                delete_event(conn, selected_id_delete)
-                conn.close()
+                with db_connection() as conn:
+                    delete_event(conn, selected_id_delete)
                 st.success(f"Запись с event_id={selected_id_delete} успешно удалена!")
                 st.rerun()
 
 
-with tab_visits:
+with tab_visits, section("Визиты"):
     st.subheader("Фильтр и редактирование посещаемости")
 
     # Форма фильтрации – два selectbox: для Event ID и Event Name
     with st.form("filter_form", clear_on_submit=False):
-        conn = db_connection()
-        df_events = pl.read_database("SELECT event_id, event_name FROM events", connection=conn)
-        conn.close()
+        df_events = snapshot["events"].select("event_id", "event_name")
 
         if df_events.is_empty():
             st.error("Нет данных о событиях в таблице events.")
@@ -344,82 +372,110 @@ with tab_visits:
         if st.form_submit_button("Поиск"):
             st.session_state["selected_event_id"] = selected_event_id
             st.session_state["selected_event_name"] = selected_event_name
+            # Новый фильтр – начинаем с первой страницы
+            st.session_state["visits_page_starts"] = [None]
             st.rerun()
 
     filter_event_id = st.session_state.get("selected_event_id", "Все")
     filter_event_name = st.session_state.get("selected_event_name", "Все")
 
-    conn = db_connection()
-    df_visits = pl.read_database("SELECT * FROM event_user_visits", connection=conn)
-    df_events = pl.read_database("SELECT event_id, event_name FROM events", connection=conn)
-    df_users = pl.read_database("SELECT user_id, surname, name, last_surname FROM users", connection=conn)
-    conn.close()
-
-    df_visits = df_visits.with_columns(pl.col("event_id").cast(pl.Int64))
-    df_events = df_events.with_columns(pl.col("event_id").cast(pl.Int64))
-    df_visits = df_visits.with_columns(pl.col("user_id").cast(pl.Int64))
-    df_users = df_users.with_columns(pl.col("user_id").cast(pl.Int64))
-
-    df_visits = df_visits.join(df_events, on="event_id", how="left")
-    df_visits = df_visits.join(df_users, on="user_id", how="left")
-
+    query_event_id = None
     if filter_event_id != "Все":
         try:
-            df_visits = df_visits.filter(pl.col("event_id") == int(filter_event_id))
-        except Exception as e:
+            query_event_id = int(filter_event_id)
+        except ValueError as e:
             st.error(f"Ошибка фильтрации по Event ID: {e}")
-
-    if filter_event_name != "Все":
-        df_visits = df_visits.filter(pl.col("event_name") == filter_event_name)
+    query_event_name = None if filter_event_name == "Все" else filter_event_name
+
+    # Соединение и фильтрация выполняются в PostgreSQL, читаем только текущую страницу.
+    # page_starts – стек ключей (event_id, user_id), с которых начинаются просмотренные страницы.
+    page_starts = st.session_state.setdefault("visits_page_starts", [None])
+    total_visits = count_visits(query_event_id, query_event_name)
+    df_visits = fetch_visits_page(query_event_id, query_event_name, after=page_starts[-1])
+    df_visits = df_visits.with_columns(
+        pl.col("event_id").cast(pl.Int64),
+        pl.col("user_id").cast(pl.Int64)
+    )
+
+    if df_visits.height > 0:
+        first_row = (len(page_starts) - 1) * VISITS_PAGE_SIZE + 1
+        st.caption(f"Записи {first_row}–{first_row + df_visits.height - 1} из {total_visits}")
+    col_prev, col_next = st.columns(2)
+    if col_prev.button("← Предыдущая страница", disabled=len(page_starts) == 1):
+        page_starts.pop()
+        st.rerun()
+    if col_next.button("Следующая страница →", disabled=df_visits.height < VISITS_PAGE_SIZE):
+        last_row = df_visits.row(-1, named=True)
+        page_starts.append((last_row["event_id"], last_row["user_id"]))
+        st.rerun()
+
+    pending_achievements = st.session_state.get(FAILED_ACHIEVEMENTS_KEY, [])
+    if pending_achievements:
+        st.warning(f"Посещение сохранено, но ачивка не начислена: {len(pending_achievements)}")
+        if st.button("Повторить начисление ачивок"):
+            if not send_visit_achievements(pending_achievements):
+                st.success("Ачивки начислены.")
+                st.rerun()
 
     if df_visits.is_empty():
         st.info("Нет записей посещаемости по заданным фильтрам.")
     else:
         st.write("Отметьте галочкой, кто посетил событие, и нажмите «Сохранить изменения».")
 
+        # Одна таблица с колонкой-галочкой вместо набора виджетов на каждого участника.
+        # Ключ зависит от страницы и фильтров, чтобы правки не переезжали на чужие строки.
+        editor_key = f"visits_editor_{page_starts[-1]}_{query_event_id}_{query_event_name}"
+        editor_frame = df_visits.select(
+            "event_name", "surname", "name", "last_surname",
+            (pl.col("visit") == "attended").fill_null(False).alias("attended")
+        )
+
         with st.form("visits_edit_form", clear_on_submit=False):
-            col_event, col_surname, col_name, col_lastname, col_visit = st.columns(5)
-            col_event.write("Название события")
-            col_surname.write("Фамилия")
-            col_name.write("Имя")
-            col_lastname.write("Отчество")
-            col_visit.write("Посетил")
-
-            new_statuses = {}
-            for idx, row in enumerate(df_visits.to_dicts()):
-                cols = st.columns(5)
-                cols[0].write(row.get("event_name", ""))
-                cols[1].write(row.get("surname", ""))
-                cols[2].write(row.get("name", ""))
-                cols[3].write(row.get("last_surname", ""))
-                # Если в базе статус "attended" – галочка установлена, иначе – снята
-                visited = (row.get("visit") == "attended")
-                cb_val = cols[4].checkbox("", value=visited, key=f"visit_{idx}")
-                new_status = "attended" if cb_val else "missed"
-                new_statuses[(row["event_id"], row["user_id"])] = new_status
+            st.data_editor(
+                editor_frame,
+                key=editor_key,
+                hide_index=True,
+                use_container_width=True,
+                column_config={
+                    "event_name": "Название события",
+                    "surname": "Фамилия",
+                    "name": "Имя",
+                    "last_surname": "Отчество",
+                    "attended": st.column_config.CheckboxColumn("Посетил")
+                },
+                disabled=["event_name", "surname", "name", "last_surname"]
+            )
 
             if st.form_submit_button("Сохранить изменения"):
-                conn = db_connection()
-                for (event_id, user_id), status in new_statuses.items():
-                    update_visit(conn, event_id, user_id, status)
-                    # Выполняем API-запрос для статуса "attended"
-                    if status == "attended":
-                        payload = {
-                            "achievement_type_id": 10,  # здесь можно подставить нужное значение
-                            "eventID": event_id,
-                            "userID": user_id
-                        }
-                        response = requests.post(
-                            "https://api.b8st.ru/admin/events/visit",
-                            headers={
-                                "accept": "application/json",
-                                "Content-Type": "application/json"
-                            },
-                            json=payload
-                        )
-                        # При необходимости можно добавить проверку статуса ответа:
-                        if response.status_code != 200:
-                            st.error(f"Ошибка при отправке запроса для eventID={event_id}, userID={user_id}")
-                conn.close()
+                # Редактор возвращает только изменённые ячейки – по ним и считаем изменения
+                edited_rows = st.session_state[editor_key]["edited_rows"]
+                loaded_statuses, attended_flags = edited_attendance(df_visits, edited_rows)
+                # Пишем и отправляем в API только строки, у которых статус действительно изменился
+                changes = diff_visits(loaded_statuses, attended_flags)
+                if not changes:
+                    st.info("Изменений нет.")
+                    st.stop()
+
+                # Все изменения пишем одним запросом в одной транзакции
+                with db_connection() as conn:
+                    outcomes = update_visits(conn, changes)
+                not_found = [key for key, ok in outcomes.items() if not ok]
+                if not_found:
+                    st.warning(f"Не найдено записей посещаемости: {len(not_found)}")
+
+                # API-запросы отправляем параллельно и только для новых "attended"
+                attended = [
+                    (event_id, user_id) for event_id, user_id, status in changes
+                    if status == "attended" and outcomes.get((event_id, user_id))
+                ]
+                if attended and send_visit_achievements(attended):
+                    # Посещения уже сохранены: неудачные ачивки ждут кнопки
+                    # «Повторить начисление ачивок». Не перезапускаем страницу,
+                    # чтобы ошибки остались на экране
+                    st.stop()
                 st.success("Посещаемость успешно обновлена!")
+                # Сохранённые правки уже в базе – сбрасываем состояние редактора
+                del st.session_state[editor_key]
                 st.rerun()
+
+render_debug_sidebar()
@@ -1,418 +1,321 @@
 import streamlit as st
 import polars as pl
-import plotly.express as px
-import random
 from datetime import datetime, timedelta
 
-# ВАЖНО: для динамического прогноза нужно установить numpy и scikit-learn:
-import numpy as np
-from sklearn.linear_model import LinearRegression
-
-# Для воспроизводимости
-random.seed(42)
+from analytics_data import (
+    ACTIVE_USER_WINDOWS,
+    DEFAULT_INITIAL_STOCK,
+    SOURCE_ERRORS,
+    available_sources,
+    make_data_source,
+    load_active_users,
+    load_analytics_data,
+    load_item_trends,
+    load_rollups,
+    refresh_analytics_data
+)
+from backtesting import daily_matrix, run_backtest
+from charts import line_chart, bar_chart, pie_chart
+from forecasting import forecast_series, forecast_inventory
+from hll import standard_error
+from instrumentation import start_rerun, section, render_debug_sidebar
+from settings import ANALYTICS_SOURCE, BACKTEST_WORKERS, CHART_MAX_BARS
+
+SOURCE_LABELS = {
+    "synthetic": "Синтетические данные",
+    "postgres": "PostgreSQL",
+    "parquet": "Parquet-файлы"
+}
+ACTIVE_USER_LABELS = {
+    "DAU": "за день (DAU)",
+    "WAU": "за 7 дней (WAU)",
+    "MAU": "за 30 дней (MAU)"
+}
 
 # Обязательно первым вызовом Streamlit – установка конфигурации страницы!
 st.set_page_config(page_title="Аналитика мерча", layout="wide")
 
-# ==============================
-# Глобальные константы
-# ==============================
-MERCH_ITEMS = ["Футболка", "Худи", "Кепка", "Плакат", "Наклейка", "Сумка"]
-ACHIEVEMENTS = [
-    "Первый заказ", "Большой покупатель", "Коллекционер",
-    "Лояльный клиент", "Активный пользователь", "Социальный активист"
-]
-# Начальные запасы для прогнозирования остатков
-MERCH_INITIAL_INVENTORY = {
-    "Футболка": 150,
-    "Худи": 100,
-    "Кепка": 200,
-    "Плакат": 50,
-    "Наклейка": 300,
-    "Сумка": 80
-}
-
 # ====================================================
-# 1. Генерация синтетических данных
+# 1. Единый ленивый план запросов и функции отображения графиков
 # ====================================================
-def generate_users_data(n_users=200):
-    """
-    Генерация данных пользователей.
-    Поля: user_id, username, registration_date.
+def build_chart_queries(rollups, users_df: pl.DataFrame, trans_df: pl.DataFrame,
+                        items, achievements, start_date, end_date):
     """
-    users = []
-    base_date = datetime.now() - timedelta(days=365)
-    for i in range(1, n_users + 1):
-        registration_date = base_date + timedelta(days=random.randint(0, 365))
-        users.append({
-            "user_id": i,
-            "username": f"user_{i}",
-            "registration_date": registration_date
-        })
-    return pl.DataFrame(users)
-
-def generate_transactions_data(users_df: pl.DataFrame, n_transactions=1000):
+    Описывает все агрегаты страницы как pl.LazyFrame.
+    Дневные графики и прогноз читают готовые дневные агрегаты (rollups.RollupStore),
+    поэтому их стоимость зависит от числа дней, а не от числа событий.
+    Общие подпланы объявлены один раз: pl.collect_all посчитает их однократно
+    и выполнит запросы параллельно.
     """
-    Генерация данных транзакций.
-    Поля: transaction_date, user_id, item, quantity, price_each, total_amount.
-    """
-    transactions = []
-    now = datetime.now()
-    for _ in range(n_transactions):
-        user = users_df.sample(1).to_dicts()[0]
-        delta_days = (now - user["registration_date"]).days
-        trans_day = user["registration_date"] + timedelta(days=random.randint(0, max(1, delta_days)))
-        item = random.choice(MERCH_ITEMS)
-        quantity = random.choices([1, 2, 3], weights=[70, 20, 10])[0]
-        price_each = round(random.uniform(10, 100), 2)
-        total_amount = round(price_each * quantity, 2)
-        transactions.append({
-            "transaction_date": trans_day,
-            "user_id": user["user_id"],
-            "item": item,
-            "quantity": quantity,
-            "price_each": price_each,
-            "total_amount": total_amount
-        })
-    return pl.DataFrame(transactions)
-
-def generate_login_events(users_df: pl.DataFrame, n_events=2000):
-    """
-    Генерация данных событий входа (login events).
-    Поля: login_date, user_id.
-    """
-    events = []
-    now = datetime.now()
-    for _ in range(n_events):
-        user = users_df.sample(1).to_dicts()[0]
-        delta_days = (now - user["registration_date"]).days
-        login_date = user["registration_date"] + timedelta(days=random.randint(0, max(1, delta_days)))
-        events.append({
-            "login_date": login_date,
-            "user_id": user["user_id"]
-        })
-    return pl.DataFrame(events)
-
-def generate_achievements_data(users_df: pl.DataFrame, n_events=300):
+    item_sales = rollups.scan("daily_item_sales").filter(pl.col("item").is_in(list(items)))
+    item_sales_window = item_sales.filter(
+        (pl.col("day") >= pl.lit(start_date).dt.truncate("1d")) & (pl.col("day") <= end_date)
+    )
+
+    return {
+        "daily_active_users": rollups.scan("daily_active_users", start_date, end_date).select(
+            pl.col("day").alias("login_day"), "active_users"
+        ),
+        "daily_revenue": item_sales_window.group_by("day").agg(
+            pl.col("revenue").sum().alias("daily_revenue")
+        ).sort("day").rename({"day": "trans_day"}),
+        # Полный рейтинг покупателей: слайдер топ-N только берёт голову
+        "user_spend": trans_df.lazy().group_by("user_id").agg(
+            pl.col("total_amount").sum().alias("total_spent")
+        ).sort("total_spent", descending=True).join(
+            users_df.lazy().select("user_id", "username"), on="user_id", how="left"
+        ),
+        "achievements": rollups.scan("daily_achievements", start_date, end_date).filter(
+            pl.col("achievement").is_in(list(achievements))
+        ).group_by("achievement").agg(
+            pl.col("count").sum()
+        ).sort("count", descending=True),
+        # Продажи по товарам за всю историю – для прогноза остатков
+        "daily_item_sales": item_sales.select(
+            "item", pl.col("day").alias("trans_day"), pl.col("quantity").alias("daily_sold")
+        ).sort(["item", "trans_day"])
+    }
+
+def collect_chart_data(queries: dict):
     """
-    Генерация данных достижений, полученных пользователями.
-    Поля: unlock_date, user_id, achievement.
+    Выполняет все запросы одним вызовом pl.collect_all.
     """
-    achievements_data = []
-    now = datetime.now()
-    for _ in range(n_events):
-        user = users_df.sample(1).to_dicts()[0]
-        delta_days = (now - user["registration_date"]).days
-        unlock_date = user["registration_date"] + timedelta(days=random.randint(0, max(1, delta_days)))
-        achievement = random.choice(ACHIEVEMENTS)
-        achievements_data.append({
-            "unlock_date": unlock_date,
-            "user_id": user["user_id"],
-            "achievement": achievement
-        })
-    return pl.DataFrame(achievements_data)
+    return dict(zip(queries.keys(), pl.collect_all(list(queries.values()))))
 
-# ====================================================
-# 2. Функции агрегации и отображения графиков
-# ====================================================
-def show_daily_active_users(login_df: pl.DataFrame, start_date, end_date):
+def show_daily_active_users(df_daily: pl.DataFrame, title="Ежедневная активность пользователей"):
     """
-    Линейный график ежедневной активности (уникальные логины).
+    Линейный график активности (уникальные логины за день или за окно из нескольких дней).
     """
-    df_filtered = login_df.filter(
-        (pl.col("login_date") >= start_date) & (pl.col("login_date") <= end_date)
-    )
-    df_filtered = df_filtered.with_columns(
-        pl.col("login_date").dt.truncate("1d").alias("login_day")
-    )
-    df_daily = df_filtered.group_by("login_day").agg(
-        pl.col("user_id").n_unique().alias("active_users")
-    ).sort("login_day")
-
-    fig = px.line(
-        df_daily.to_pandas(),
+    fig = line_chart(
+        df_daily,
         x="login_day",
         y="active_users",
-        title="Ежедневная активность пользователей",
-        labels={"login_day": "Дата", "active_users": "Активных пользователей"},
-        template="plotly_white"
+        title=title,
+        labels={"login_day": "Дата", "active_users": "Активных пользователей"}
     )
     st.plotly_chart(fig, use_container_width=True)
 
-def show_daily_revenue(trans_df: pl.DataFrame, start_date, end_date):
+def show_daily_revenue(df_daily: pl.DataFrame):
     """
     Линейный график ежедневного дохода магазина.
     """
-    df_filtered = trans_df.filter(
-        (pl.col("transaction_date") >= start_date) & (pl.col("transaction_date") <= end_date)
-    )
-    df_filtered = df_filtered.with_columns(
-        pl.col("transaction_date").dt.truncate("1d").alias("trans_day")
-    )
-    df_daily = df_filtered.group_by("trans_day").agg(
-        pl.col("total_amount").sum().alias("daily_revenue")
-    ).sort("trans_day")
-
-    fig = px.line(
-        df_daily.to_pandas(),
+    fig = line_chart(
+        df_daily,
         x="trans_day",
         y="daily_revenue",
         title="Ежедневный доход магазина",
-        labels={"trans_day": "Дата", "daily_revenue": "Доход"},
-        template="plotly_white"
+        labels={"trans_day": "Дата", "daily_revenue": "Доход"}
     )
     st.plotly_chart(fig, use_container_width=True)
 
-def show_top_spenders(trans_df: pl.DataFrame, users_df: pl.DataFrame, top_n=10, start_date=None, end_date=None):
+def show_top_spenders(df_user_spend: pl.DataFrame, top_n=10):
     """
     Бар-чарт топ-пользователей по сумме покупок.
     """
-    df_filtered = trans_df
-    if start_date and end_date:
-        df_filtered = df_filtered.filter(
-            (pl.col("transaction_date") >= start_date) & (pl.col("transaction_date") <= end_date)
-        )
-    df_user = df_filtered.group_by("user_id").agg(
-        pl.col("total_amount").sum().alias("total_spent")
-    ).sort("total_spent", descending=True).limit(top_n)
-
-    users_pd = users_df.to_pandas()
-    df_user_pd = df_user.to_pandas().merge(users_pd, on="user_id")
-
-    fig = px.bar(
-        df_user_pd,
+    fig = bar_chart(
+        df_user_spend,
         x="username",
         y="total_spent",
         title=f"Топ-{top_n} покупателей по сумме покупок",
         labels={"username": "Пользователь", "total_spent": "Потрачено ($)"},
-        template="plotly_white"
+        top_n=top_n
     )
     st.plotly_chart(fig, use_container_width=True)
 
-def show_achievements(ach_df: pl.DataFrame, start_date, end_date):
+def show_achievements(df_ach: pl.DataFrame):
     """
-    Бар-чарт количества полученных достижений по типу.
+    Бар-чарт количества полученных достижений по типу (не больше CHART_MAX_BARS столбцов).
     """
-    df_filtered = ach_df.filter(
-        (pl.col("unlock_date") >= start_date) & (pl.col("unlock_date") <= end_date)
-    )
-    df_ach = df_filtered.group_by("achievement").agg(
-        pl.count("achievement").alias("count")
-    ).sort("count", descending=True)
-
-    fig = px.bar(
-        df_ach.to_pandas(),
+    fig = bar_chart(
+        df_ach,
         x="achievement",
         y="count",
         title="Полученные достижения",
         labels={"achievement": "Достижение", "count": "Количество"},
-        template="plotly_white"
+        top_n=CHART_MAX_BARS
     )
     st.plotly_chart(fig, use_container_width=True)
 
-def show_top_achievements(ach_df: pl.DataFrame, top_n=5, start_date=None, end_date=None):
+def show_top_achievements(df_ach: pl.DataFrame, top_n=5):
     """
     Круговая диаграмма топ-достижений по количеству получений.
     """
-    df_filtered = ach_df
-    if start_date and end_date:
-        df_filtered = df_filtered.filter(
-            (pl.col("unlock_date") >= start_date) & (pl.col("unlock_date") <= end_date)
-        )
-    df_top = df_filtered.group_by("achievement").agg(
-        pl.count("achievement").alias("total")
-    ).sort("total", descending=True).limit(top_n)
-
-    fig = px.pie(
-        df_top.to_pandas(),
+    fig = pie_chart(
+        df_ach,
         names="achievement",
-        values="total",
+        values="count",
         title=f"Топ-{top_n} достижений",
-        template="plotly_white"
+        top_n=top_n
     )
     st.plotly_chart(fig, use_container_width=True)
 
 # ====================================================
-# 3. Функция прогнозирования продаж и остатков (с линейной регрессией)
+# 2. Функция прогнозирования продаж и остатков (с линейной регрессией)
 # ====================================================
-def show_forecasting(trans_df: pl.DataFrame, start_dt: datetime, end_dt: datetime):
+def show_forecasting(df_rev: pl.DataFrame, item_trends: pl.DataFrame, end_dt: datetime, initial_inventory: dict):
     """
     Прогноз будущего дохода (на 7 дней) и прогноз остатков товаров
-    с помощью простой линейной регрессии.
+    с помощью простой линейной регрессии (пакетно для всех товаров, см. forecasting.py).
+    df_rev – дневной доход за период из build_chart_queries,
+    item_trends – тренды продаж выбранных товаров из накопленного состояния (load_item_trends).
+    initial_inventory – начальные запасы {товар: количество} из источника данных.
     """
     forecast_days = 7
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
 
     # -------------------------------------------------------
     # 1. Прогноз выручки (Revenue Forecast)
     # -------------------------------------------------------
-    df_rev = (
-        trans_df
-        .filter((pl.col("transaction_date") >= start_dt) & (pl.col("transaction_date") <= end_dt))
-        .with_columns(pl.col("transaction_date").dt.truncate("1d").alias("trans_day"))
-        .group_by("trans_day")
-        .agg(pl.col("total_amount").sum().alias("daily_revenue"))
-        .sort("trans_day")
-    )
-
-    # Если данных нет или только 1 точка, fallback на среднее
-    if df_rev.height < 2:
-        if df_rev.height == 1:
-            avg_daily_revenue = df_rev["daily_revenue"][0]
-        else:
-            avg_daily_revenue = 0.0
-        forecast_dates = [end_dt.date() + timedelta(days=i+1) for i in range(forecast_days)]
-        forecast_values = [avg_daily_revenue] * forecast_days
-    else:
-        # Линейная регрессия по daily_revenue
-        df_pd = df_rev.to_pandas()
-        # Преобразуем даты в "номер дня" относительно минимальной даты
-        df_pd["day_index"] = (df_pd["trans_day"] - df_pd["trans_day"].min()).dt.days
-
-        X = df_pd[["day_index"]].values  # (n_samples, 1)
-        y = df_pd["daily_revenue"].values
-
-        model = LinearRegression()
-        model.fit(X, y)
-
-        # Прогнозируем на следующие forecast_days
-        last_day_index = df_pd["day_index"].max()
-        future_day_indices = np.arange(last_day_index+1, last_day_index+forecast_days+1)
-
-        forecast_values = model.predict(future_day_indices.reshape(-1, 1))
-        # Ограничиваем отрицательные прогнозы (исправление)
-        forecast_values = np.maximum(forecast_values, 0)
-        # Даты для прогноза
-        last_date = df_pd["trans_day"].max()
-        forecast_dates = [last_date.date() + timedelta(days=i) for i in range(1, forecast_days+1)]
-
-    # Собираем DataFrame с результатом
-    forecast_rev_df = pl.DataFrame({
-        "date": forecast_dates,
-        "forecasted_revenue": forecast_values.tolist()  # преобразуем в список для совместимости
-    })
-
-    # Построение графика
-    fig_rev = px.line(
-        forecast_rev_df.to_pandas(),
+    # Без данных прогноз 0, по одной точке – её значение
+    forecast_rev_df = forecast_series(
+        df_rev, "trans_day", "daily_revenue", forecast_days,
+        default_last_day=datetime.combine(end_dt.date(), datetime.min.time())
+    ).rename({"forecast": "forecasted_revenue"})
+
+    fig_rev = line_chart(
+        forecast_rev_df,
         x="date",
         y="forecasted_revenue",
         title="Прогноз будущего дохода (на 7 дней)",
-        labels={"date": "Дата", "forecasted_revenue": "Прогноз дохода"},
-        template="plotly_white"
+        labels={"date": "Дата", "forecasted_revenue": "Прогноз дохода"}
     )
     st.plotly_chart(fig_rev, use_container_width=True)
 
     # -------------------------------------------------------
     # 2. Прогноз остатков товаров (Inventory Forecast)
     # -------------------------------------------------------
-    # Считаем дневные продажи каждого товара
-    df_sales = (
-        trans_df
-        .with_columns(pl.col("transaction_date").dt.truncate("1d").alias("trans_day"))
-        .group_by(["item", "trans_day"])
-        .agg(pl.col("quantity").sum().alias("daily_sold"))
-        .sort(["item", "trans_day"])
+    forecast_inv_df, stockout_df = forecast_inventory(
+        item_trends, initial_inventory, forecast_days,
+        default_stock=DEFAULT_INITIAL_STOCK,
+        default_last_day=today
     )
-
-    # Подготовим итоговую структуру для графика и таблицы
-    forecast_plot_data = []
-    stockout_data = []
-
-    for item in MERCH_ITEMS:
-        init_stock = MERCH_INITIAL_INVENTORY.get(item, 100)
-
-        # Фильтруем продажи по конкретному товару
-        df_item = df_sales.filter(pl.col("item") == item)
-
-        # Суммарные продажи, чтобы понять текущий остаток
-        total_sold_item = df_item["daily_sold"].sum() if df_item.height > 0 else 0
-        current_inventory = max(init_stock - total_sold_item, 0)
-
-        # Если у нас нет исторических данных или только одна дата – fallback на средние продажи
-        if df_item.height < 2:
-            if df_item.height == 1:
-                avg_daily_sales = df_item["daily_sold"][0]
-            else:
-                avg_daily_sales = 0
-            # Прогноз на 7 дней – одна линия
-            forecast_sales = [avg_daily_sales] * forecast_days
-            # Начнём прогноз с сегодняшней даты (или можно брать max из trans_day)
-            last_date_item = datetime.now()
-        else:
-            # Линейная регрессия
-            df_item_pd = df_item.to_pandas()
-            min_date_item = df_item_pd["trans_day"].min()
-            df_item_pd["day_index"] = (df_item_pd["trans_day"] - min_date_item).dt.days
-
-            X = df_item_pd[["day_index"]].values
-            y = df_item_pd["daily_sold"].values
-
-            model = LinearRegression()
-            model.fit(X, y)
-
-            last_day_index_item = df_item_pd["day_index"].max()
-            future_day_indices_item = np.arange(last_day_index_item+1, last_day_index_item+forecast_days+1)
-            forecast_sales = model.predict(future_day_indices_item.reshape(-1, 1))
-            # Не допускаем отрицательные прогнозы
-            forecast_sales = np.maximum(forecast_sales, 0)
-
-            last_date_item = df_item_pd["trans_day"].max()
-
-        # Даты прогноза (7 дней вперёд от последней даты продаж)
-        forecast_dates_item = [last_date_item + timedelta(days=i) for i in range(1, forecast_days+1)]
-
-        # Накапливаем продажи и считаем остатки
-        cum_sales = 0
-        for i, pred_sales in enumerate(forecast_sales):
-            cum_sales += pred_sales
-            forecast_inv = max(current_inventory - cum_sales, 0)
-
-            forecast_plot_data.append({
-                "item": item,
-                "date": forecast_dates_item[i],
-                "forecast_inventory": forecast_inv
-            })
-
-        # Оценка дней до исчерпания (простейший вариант – средняя из forecast_sales)
-        mean_future_sales = np.mean(forecast_sales) if len(forecast_sales) > 0 else 0
-        if current_inventory == 0:
-            days_to_stockout = "Запасы уже 0"
-        elif mean_future_sales <= 0.01:
-            days_to_stockout = "Нет продаж/минимальные"
-        else:
-            days_to_stockout = round(current_inventory / mean_future_sales, 1)
-
-        stockout_data.append({
-            "item": item,
-            "текущий остаток": current_inventory,
-            "средние продажи (по регрессии)": round(mean_future_sales, 2),
-            "прогноз дней до исчерпания": days_to_stockout
-        })
-
-    # Построим график остатков
-    forecast_inv_df = pl.DataFrame(forecast_plot_data).sort(["item", "date"])
-    fig_inv = px.line(
-        forecast_inv_df.to_pandas(),
+    fig_inv = line_chart(
+        forecast_inv_df,
         x="date",
         y="forecast_inventory",
         color="item",
         title="Прогноз остатков инвентаря (на 7 дней)",
-        labels={"date": "Дата", "forecast_inventory": "Остатки"},
-        template="plotly_white"
+        labels={"date": "Дата", "forecast_inventory": "Остатки"}
     )
     st.plotly_chart(fig_inv, use_container_width=True)
 
-    # Таблица с прогнозом исчерпания запасов
+    # Таблица с прогнозом исчерпания запасов: числа и статус – в разных колонках
     st.subheader("Прогноз исчерпания запасов")
-    st.dataframe(stockout_data)
+    st.dataframe(
+        stockout_df.rename({
+            "current_inventory": "текущий остаток",
+            "mean_forecast_sales": "средние продажи (по регрессии)",
+            "days_to_stockout": "прогноз дней до исчерпания",
+            "status": "статус"
+        }),
+        hide_index=True
+    )
+
+@st.fragment
+def backtest_fragment(df_sales: pl.DataFrame, df_rev: pl.DataFrame, data_key):
+    """
+    Бэктест моделей прогноза по кнопке: rolling-origin по каждому товару
+    (продажи в штуках) и по дневной выручке, ряды считаются на пуле процессов.
+    Результат хранится в session_state и не пересчитывается на каждый rerun.
+
+    :param data_key: источник и фильтры, по которым построены ряды: результат
+                     показывается, только пока они и параметры бэктеста не менялись
+    """
+    with st.expander("Бэктест моделей прогноза"):
+        col1, col2 = st.columns(2)
+        with col1:
+            min_train = st.number_input("Минимальная история, дней", min_value=7, max_value=365, value=28)
+        with col2:
+            step = st.number_input("Шаг точки отсчёта, дней", min_value=1, max_value=90, value=7)
+
+        results_key = (data_key, min_train, step)
+        if st.button("Запустить бэктест"):
+            with section("Бэктест"), st.spinner("Бэктест моделей..."):
+                st.session_state["backtest_results"] = results_key, {
+                    "Продажи по товарам": run_backtest(
+                        daily_matrix(df_sales, "item", "trans_day", "daily_sold"),
+                        horizon=7, min_train=min_train, step=step, max_workers=BACKTEST_WORKERS
+                    ),
+                    "Дневная выручка": run_backtest(
+                        daily_matrix(
+                            df_rev.with_columns(pl.lit("выручка").alias("series")),
+                            "series", "trans_day", "daily_revenue"
+                        ),
+                        horizon=7, min_train=min_train, step=step, max_workers=1
+                    )
+                }
+
+        stored_key, results = st.session_state.get("backtest_results", (None, None))
+        if stored_key != results_key:
+            st.caption("Модели: линейный тренд (текущая), seasonal-naive (неделя), экспоненциальное сглаживание.")
+            return
+        for title, (summary, per_series) in results.items():
+            st.write(f"**{title}**: ошибка на горизонте 7 дней и время обучения")
+            if summary.height == 0:
+                st.info("Недостаточно истории для бэктеста.")
+                continue
+            st.dataframe(summary, hide_index=True)
+            if per_series["series"].n_unique() > 1:
+                st.dataframe(per_series.sort(["series", "MAE"]), hide_index=True)
+
+@st.fragment
+def active_users_fragment(df_dau: pl.DataFrame, source, rollups, start_dt, end_dt):
+    """
+    Переключатель DAU / WAU / MAU и график. DAU уже посчитан в общем плане,
+    недельная и месячная активность – точно или по HLL-скетчам (load_active_users).
+    """
+    period = st.radio(
+        "Окно активности",
+        options=list(ACTIVE_USER_WINDOWS),
+        format_func=lambda key: ACTIVE_USER_LABELS[key],
+        horizontal=True
+    )
+    window = ACTIVE_USER_WINDOWS[period]
+    if window == 1:
+        df_active, exact = df_dau, True
+    else:
+        df_active, exact = load_active_users(source, rollups, window, start_dt, end_dt)
+        df_active = df_active.rename({"day": "login_day"})
+    show_daily_active_users(df_active, title=f"Активные пользователи: {ACTIVE_USER_LABELS[period]}")
+    if not exact:
+        st.caption(f"Оценка HyperLogLog, стандартная ошибка ≈ {standard_error():.1%}")
+
+@st.fragment
+def top_spenders_fragment(df_user_spend: pl.DataFrame):
+    """
+    Слайдер топ-N и его график. Фрагмент перезапускается отдельно,
+    поэтому движение слайдера не пересчитывает остальные графики.
+    Рейтинг посчитан заранее целиком – слайдер только берёт первые top_n строк.
+    """
+    top_n = st.slider("Выберите количество топ-пользователей", min_value=3, max_value=20, value=10)
+    show_top_spenders(df_user_spend, top_n=top_n)
 
 # ====================================================
-# 4. Основная функция приложения с фильтрами в главном интерфейсе
+# 3. Основная функция приложения с фильтрами в главном интерфейсе
 # ====================================================
 def main():
+    start_rerun("2_analytics")
     # Основной заголовок
     st.title("Аналитика магазина мерча")
 
+    # Только источники с настроенным хранилищем (Parquet-файлы на месте, задан хост БД)
+    sources = available_sources()
+    source_kind = st.selectbox(
+        "Источник данных",
+        options=sources,
+        index=sources.index(ANALYTICS_SOURCE) if ANALYTICS_SOURCE in sources else 0,
+        format_func=lambda kind: SOURCE_LABELS.get(kind, kind)
+    )
+    source = make_data_source(source_kind)
+    if st.button("Обновить данные", help="Сбросить кэш и заново загрузить данные источника"):
+        refresh_analytics_data(source)
+    try:
+        item_options = source.item_names()
+        achievement_options = source.achievement_names()
+    except SOURCE_ERRORS as e:
+        st.error(f"Не удалось прочитать источник «{SOURCE_LABELS.get(source_kind, source_kind)}»: {e}")
+        st.stop()
+
     # Фильтры, размещённые в основном интерфейсе
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -421,28 +324,35 @@ def main():
             [datetime.now() - timedelta(days=30), datetime.now()]
         )
     with col2:
-        merch_filter = st.multiselect("Выберите товары мерча", options=MERCH_ITEMS, default=MERCH_ITEMS)
+        merch_filter = st.multiselect("Выберите товары мерча", options=item_options, default=item_options)
     with col3:
-        achievement_filter = st.multiselect("Выберите достижения", options=ACHIEVEMENTS, default=ACHIEVEMENTS)
+        achievement_filter = st.multiselect("Выберите достижения", options=achievement_options, default=achievement_options)
 
     start_date, end_date = date_range
     start_dt = datetime.combine(start_date, datetime.min.time())
     end_dt = datetime.combine(end_date, datetime.max.time())
 
-    # Генерация данных
-    users_df = generate_users_data(n_users=200)
-    trans_df = generate_transactions_data(users_df, n_transactions=1000)
-    login_df = generate_login_events(users_df, n_events=2000)
-    ach_df = generate_achievements_data(users_df, n_events=300)
-
-    # Приведение дат к нужному типу
-    trans_df = trans_df.with_columns([pl.col("transaction_date").cast(pl.Datetime("us")).alias("transaction_date")])
-    login_df = login_df.with_columns([pl.col("login_date").cast(pl.Datetime("us")).alias("login_date")])
-    ach_df = ach_df.with_columns([pl.col("unlock_date").cast(pl.Datetime("us")).alias("unlock_date")])
-
-    # Фильтрация по выбранным товарам и достижениям
-    trans_df = trans_df.filter(pl.col("item").is_in(merch_filter))
-    ach_df = ach_df.filter(pl.col("achievement").is_in(achievement_filter))
+    # Загрузка данных. Фильтры по товарам и датам уходят в источник
+    # (WHERE в PostgreSQL, predicate pushdown в scan_parquet). Наборы кэшируются
+    # между прогонами и сессиями по источнику, фильтрам и периоду.
+    try:
+        with section("Загрузка данных"):
+            users_df, trans_df, initial_inventory = load_analytics_data(
+                source, merch_filter, start_dt, end_dt
+            )
+        # Дневные агрегаты пересчитываются только за окно последних дней (rollups.RollupStore)
+        with section("Дневные агрегаты"):
+            rollups = load_rollups(source)
+    except SOURCE_ERRORS as e:
+        st.error(f"Не удалось загрузить данные источника «{SOURCE_LABELS.get(source_kind, source_kind)}»: {e}")
+        st.stop()
+
+    # Все агрегаты страницы – один ленивый план: общие подпланы считаются
+    # один раз, независимые ветки выполняются параллельно в pl.collect_all
+    with section("Расчёт агрегатов"):
+        charts = collect_chart_data(
+            build_chart_queries(rollups, users_df, trans_df, merch_filter, achievement_filter, start_dt, end_dt)
+        )
 
     # Вкладки аналитики
     tab1, tab2, tab3, tab4, tab5 = st.tabs([
@@ -453,28 +363,35 @@ def main():
         "Прогнозирование"
     ])
 
-    with tab1:
-        st.subheader("Ежедневная активность пользователей")
-        show_daily_active_users(login_df, start_dt, end_dt)
+    with tab1, section("Пользовательская активность"):
+        st.subheader("Активность пользователей")
+        active_users_fragment(charts["daily_active_users"], source, rollups, start_dt, end_dt)
 
-    with tab2:
+    with tab2, section("Продажи"):
         st.subheader("Дневной доход магазина")
-        show_daily_revenue(trans_df, start_dt, end_dt)
+        show_daily_revenue(charts["daily_revenue"])
 
-    with tab3:
+    with tab3, section("Достижения"):
         st.subheader("Анализ достижений")
-        show_achievements(ach_df, start_dt, end_dt)
+        show_achievements(charts["achievements"])
         st.subheader("Топ достижений")
-        show_top_achievements(ach_df, top_n=5, start_date=start_dt, end_date=end_dt)
+        show_top_achievements(charts["achievements"], top_n=5)
 
-    with tab4:
+    with tab4, section("Топ пользователи"):
         st.subheader("Топ покупателей")
-        top_n = st.slider("Выберите количество топ-пользователей", min_value=3, max_value=20, value=10)
-        show_top_spenders(trans_df, users_df, top_n=top_n, start_date=start_dt, end_date=end_dt)
+        top_spenders_fragment(charts["user_spend"])
 
-    with tab5:
+    with tab5, section("Прогнозирование"):
         st.subheader("Прогнозирование продаж и остатков")
-        show_forecasting(trans_df, start_dt, end_dt)
+        # Тренды товаров – из накопленных сумм МНК: дочитываются только новые дни
+        item_trends = load_item_trends(source, rollups).filter(pl.col("item").is_in(merch_filter))
+        show_forecasting(charts["daily_revenue"], item_trends, end_dt, initial_inventory)
+        backtest_fragment(
+            charts["daily_item_sales"], charts["daily_revenue"],
+            data_key=(source.cache_key(), tuple(merch_filter), start_dt, end_dt)
+        )
+
+    render_debug_sidebar()
 
 if __name__ == "__main__":
     main()
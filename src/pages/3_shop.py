@@ -1,76 +1,157 @@
 # src/pages/shop.py
 import streamlit as st
 import polars as pl
-from settings import db_connection
-from s3_utils import upload_to_s3, list_s3_objects  # <-- ваши функции S3
+from settings import db_connection, CASE_SIMULATION_MAX_DRAWS
+from data_cache import read_cached
+from instrumentation import start_rerun, section, render_debug_sidebar
+from s3_utils import upload_to_s3, upload_many, list_s3_objects_cached, refresh_s3_listing  # <-- ваши функции S3
+from case_simulation import simulate_case, summarize_simulation
 from insert_data import (
     add_product_to_db,
+    add_products_to_db,
     delete_product,
     update_product,
-    update_case_probabilities,
-    insert_case_probability,
-    delete_case_probability,
+    update_product_images,
+    apply_case_probabilities,
+    PROBABILITY_TOTAL_TOLERANCE,
     create_case_type,
     delete_case_type,
     update_case_type,
     update_winning_delivery
 )
 
-def shop_page():
-    st.title("Управление магазином (с загрузкой изображений в S3)")
-
-    conn = db_connection()
-
-    # Создаем 9 вкладок (добавил "Просмотр S3" отдельно)
-    tabs = st.tabs([
-        "Добавление товаров",      # index 0
-        "Удаление товаров",        # index 1
-        "Редактирование товаров",  # index 2
-        "Изменение вероятностей",  # index 3
-        "Создание кейсов",         # index 4
-        "Удаление кейсов",         # index 5
-        "Редактирование кейсов",   # index 6
-        "Выдача товаров (призы)",  # index 7
-        "Просмотр S3"             # index 8
-    ])
-
-    # -------------------------------------
-    # Tab 0. Добавление товаров
-    # -------------------------------------
-    with tabs[0]:
-        st.subheader("Добавление товаров")
-
-        product_name = st.text_input("Название товара")
-        product_price = st.number_input("Цена", step=0.01)
-        product_description = st.text_area("Описание")
-        product_availability = st.number_input("Количество на складе", step=1, value=100)
-        product_category = st.selectbox("Категория товара", ["merch", "case"])
-
-        uploaded_file = st.file_uploader("Загрузить изображение", type=["jpg", "jpeg", "png"])
-
-        # Если это кейс, выберем тип кейса
-        case_type_id = None
-        if product_category == "case":
-            df_case_types = pl.read_database("SELECT case_type_id, name FROM case_type", connection=conn)
-            if len(df_case_types) > 0:
-                case_types_list = [(r["case_type_id"], r["name"]) for r in df_case_types.to_dicts()]
-                chosen_case_type = st.selectbox("Выберите тип кейса", case_types_list, format_func=lambda x: x[1])
-                if chosen_case_type:
-                    case_type_id = chosen_case_type[0]
-            else:
-                st.warning("Нет типов кейсов в базе.")
+# -------------------------------------
+# Загрузчики данных. Результаты кэшируются в data_cache с метками таблиц:
+# повторные прогоны (ввод в форме, переключение разделов) не ходят в базу,
+# а запись через insert_data сбрасывает только зависящие от таблицы записи.
+# -------------------------------------
+def load_products_brief():
+    return read_cached("""
+        SELECT product_id, name, product_category
+          FROM product
+         ORDER BY product_id
+    """, tables=["product"])
+
+def load_products():
+    return read_cached("SELECT * FROM product ORDER BY product_id", tables=["product"])
+
+def load_merch():
+    return read_cached(
+        "SELECT product_id, name FROM product WHERE product_category = 'merch' ORDER BY product_id",
+        tables=["product"]
+    )
+
+def load_case_types():
+    return read_cached(
+        "SELECT case_type_id, name, description FROM case_type ORDER BY case_type_id",
+        tables=["case_type"]
+    )
+
+def load_case_probabilities(case_type_id):
+    return read_cached("""
+        SELECT cpp.case_type_id, cpp.product_id, cpp.drop_probability,
+               p.name AS product_name
+          FROM case_product_probability cpp
+          JOIN product p ON p.product_id = cpp.product_id
+         WHERE cpp.case_type_id = %s
+         ORDER BY cpp.product_id
+    """, tables=["case_product_probability", "product"], params=[case_type_id])
+
+def load_case_prizes(case_type_id):
+    return read_cached("""
+        SELECT cpp.product_id, p.name AS product_name, cpp.drop_probability,
+               p.price, p.avalibility AS stock
+          FROM case_product_probability cpp
+          JOIN product p ON p.product_id = cpp.product_id
+         WHERE cpp.case_type_id = %s AND cpp.drop_probability > 0
+         ORDER BY cpp.product_id
+    """, tables=["case_product_probability", "product"], params=[case_type_id])
+
+def load_case_price(case_type_id):
+    df = read_cached("""
+        SELECT MIN(price) AS price
+          FROM product
+         WHERE product_category = 'case' AND case_type_id = %s
+    """, tables=["product"], params=[case_type_id])
+    price = df["price"][0] if len(df) > 0 else None
+    return None if price is None else float(price)
+
+def load_winnings(delivered_filter):
+    filter_query = """
+        SELECT uw.user_winning_id, uw.user_id, uw.product_id, uw.delivered, uw.delivered_at, uw.delivered_by,
+               p.name AS product_name
+          FROM user_winnings uw
+          JOIN product p ON uw.product_id = p.product_id
+    """
+    if delivered_filter == "Только невыданные":
+        filter_query += " WHERE uw.delivered = FALSE"
+    elif delivered_filter == "Только выданные":
+        filter_query += " WHERE uw.delivered = TRUE"
+    return read_cached(filter_query, tables=["user_winnings", "product"], bulk=True)
+
+def upload_files_with_progress(uploaded_files):
+    """
+    Параллельная загрузка файлов из st.file_uploader в S3 с индикатором прогресса.
+    Ошибки загрузки выводятся списком; возвращаются все UploadResult.
+    """
+    progress = st.progress(0.0, text=f"Загрузка 0 из {len(uploaded_files)}")
+    results = upload_many(
+        [(f.name, f.getvalue()) for f in uploaded_files],
+        on_progress=lambda done, total, name: progress.progress(done / total, text=f"Загружено {done} из {total}: {name}")
+    )
+    failed = [r for r in results if not r.ok]
+    if failed:
+        st.error("Не удалось загрузить: " + ", ".join(f"{r.filename} ({r.error})" for r in failed))
+    reused = sum(r.ok and not r.uploaded for r in results)
+    if reused:
+        st.info(f"Уже были в хранилище (не загружались повторно): {reused}.")
+    return results
+
+def product_name_from_filename(filename):
+    """
+    Название товара из имени файла: без расширения, '_' заменены пробелами.
+    """
+    return filename.rsplit(".", 1)[0].replace("_", " ").strip()
+
+def add_product_section():
+    """
+    Форма добавления товара (с загрузкой изображения в S3).
+    """
+    st.subheader("Добавление товаров")
+
+    product_name = st.text_input("Название товара")
+    product_price = st.number_input("Цена", step=0.01)
+    product_description = st.text_area("Описание")
+    product_availability = st.number_input("Количество на складе", step=1, value=100)
+    product_category = st.selectbox("Категория товара", ["merch", "case"])
+
+    uploaded_file = st.file_uploader("Загрузить изображение", type=["jpg", "jpeg", "png"])
+
+    # Если это кейс, выберем тип кейса
+    case_type_id = None
+    if product_category == "case":
+        df_case_types = load_case_types()
+        if len(df_case_types) > 0:
+            case_types_list = [(r["case_type_id"], r["name"]) for r in df_case_types.to_dicts()]
+            chosen_case_type = st.selectbox("Выберите тип кейса", case_types_list, format_func=lambda x: x[1])
+            if chosen_case_type:
+                case_type_id = chosen_case_type[0]
+        else:
+            st.warning("Нет типов кейсов в базе.")
 
-        if st.button("Добавить товар"):
-            if not product_name:
-                st.error("Укажите название товара.")
-                st.stop()
+    if st.button("Добавить товар"):
+        if not product_name:
+            st.error("Укажите название товара.")
+            st.stop()
 
-            # Ссылка на изображение
-            image_url = None
-            if uploaded_file is not None:
-                file_bytes = uploaded_file.read()
-                image_url = upload_to_s3(file_bytes, uploaded_file.name)
+        # Ссылка на изображение
+        image_url = thumbnail_url = None
+        if uploaded_file is not None:
+            file_bytes = uploaded_file.read()
+            stored = upload_to_s3(file_bytes, uploaded_file.name)
+            image_url, thumbnail_url = stored.url, stored.thumbnail_url
 
+        with db_connection() as conn:
             add_product_to_db(
                 conn,
                 name=product_name,
@@ -79,101 +160,124 @@ def shop_page():
                 image=image_url,
                 availability=product_availability,
                 category=product_category,
-                case_type_id=case_type_id
+                case_type_id=case_type_id,
+                image_thumbnail=thumbnail_url
             )
-            st.success("Товар успешно добавлен!")
-
-    # -------------------------------------
-    # Tab 1. Удаление товаров
-    # -------------------------------------
-    with tabs[1]:
-        st.subheader("Удаление товаров")
-
-        df_products = pl.read_database("""
-            SELECT product_id, name, product_category
-              FROM product
-             ORDER BY product_id
-        """, connection=conn)
-
-        if len(df_products) == 0:
-            st.info("Нет товаров для удаления.")
-        else:
-            pd_products = df_products.to_pandas()
-            product_options = [(r.product_id, r.name) for r in pd_products.itertuples()]
-            choice = st.selectbox("Выберите товар для удаления", product_options, format_func=lambda x: x[1])
-
-            if choice:
-                chosen_product_id = choice[0]
-                if st.button("Удалить выбранный товар"):
+        st.success("Товар успешно добавлен!")
+
+    st.divider()
+    st.subheader("Массовое добавление из изображений")
+    st.write("Каждый файл станет отдельным товаром-мерчем с названием по имени файла.")
+    bulk_files = st.file_uploader(
+        "Изображения товаров", type=["jpg", "jpeg", "png"], accept_multiple_files=True, key="bulk_add_files"
+    )
+    bulk_price = st.number_input("Цена", step=0.01, key="bulk_add_price")
+    bulk_availability = st.number_input("Количество на складе", step=1, value=100, key="bulk_add_availability")
+
+    if bulk_files and st.button(f"Добавить товары ({len(bulk_files)})"):
+        results = upload_files_with_progress(bulk_files)
+        products = [
+            (product_name_from_filename(r.filename), bulk_price, "", r.url, bulk_availability, "merch", None,
+             r.thumbnail_url)
+            for r in results if r.ok
+        ]
+        with db_connection() as conn:
+            product_ids = add_products_to_db(conn, products)
+        st.success(f"Добавлено товаров: {len(product_ids)}.")
+
+def delete_product_section():
+    """
+    Удаление товара из списка.
+    """
+    st.subheader("Удаление товаров")
+
+    df_products = load_products_brief()
+
+    if len(df_products) == 0:
+        st.info("Нет товаров для удаления.")
+    else:
+        pd_products = df_products.to_pandas()
+        product_options = [(r.product_id, r.name) for r in pd_products.itertuples()]
+        choice = st.selectbox("Выберите товар для удаления", product_options, format_func=lambda x: x[1])
+
+        if choice:
+            chosen_product_id = choice[0]
+            if st.button("Удалить выбранный товар"):
+                with db_connection() as conn:
                     delete_product(conn, chosen_product_id)
-                    st.success(f"Товар (ID={chosen_product_id}) удалён.")
-
-    # -------------------------------------
-    # Tab 2. Редактирование товаров
-    # -------------------------------------
-    with tabs[2]:
-        st.subheader("Редактирование товаров")
-
-        df_products = pl.read_database("SELECT * FROM product ORDER BY product_id", connection=conn)
-        if len(df_products) == 0:
-            st.info("Нет товаров для редактирования.")
-        else:
-            pd_products = df_products.to_pandas()
-            product_options = [(r.product_id, r.name) for r in pd_products.itertuples()]
-            choice = st.selectbox("Выберите товар для редактирования", product_options, format_func=lambda x: x[1])
-
-            if choice:
-                chosen_product_id = choice[0]
-                row = pd_products.loc[pd_products["product_id"] == chosen_product_id].iloc[0]
-
-                edit_name = st.text_input("Название товара", value=row["name"] or "")
-                edit_price = st.number_input("Цена", step=0.01, value=float(row["price"] or 0.0))
-                edit_description = st.text_area("Описание", value=row["description"] or "")
-                edit_aval = st.number_input("Количество на складе", step=1, value=int(row["avalibility"] or 0), key="x")
-                edit_category = st.selectbox("Категория", ["merch", "case"],
-                                             index=0 if row["product_category"] == "merch" else 1)
-
-                # Показать текущее изображение
-                if row["image"]:
-                    st.image(row["image"], caption="Текущее изображение", use_column_width=True)
-                else:
-                    st.write("Нет загруженного изображения.")
+                st.success(f"Товар (ID={chosen_product_id}) удалён.")
+
+def edit_product_section():
+    """
+    Редактирование товара и замена изображения.
+    """
+    st.subheader("Редактирование товаров")
+
+    df_products = load_products()
+    if len(df_products) == 0:
+        st.info("Нет товаров для редактирования.")
+    else:
+        pd_products = df_products.to_pandas()
+        product_options = [(r.product_id, r.name) for r in pd_products.itertuples()]
+        choice = st.selectbox("Выберите товар для редактирования", product_options, format_func=lambda x: x[1])
+
+        if choice:
+            chosen_product_id = choice[0]
+            row = pd_products.loc[pd_products["product_id"] == chosen_product_id].iloc[0]
+
+            edit_name = st.text_input("Название товара", value=row["name"] or "")
+            edit_price = st.number_input("Цена", step=0.01, value=float(row["price"] or 0.0))
+            edit_description = st.text_area("Описание", value=row["description"] or "")
+            edit_aval = st.number_input("Количество на складе", step=1, value=int(row["avalibility"] or 0), key="x")
+            edit_category = st.selectbox("Категория", ["merch", "case"],
+                                         index=0 if row["product_category"] == "merch" else 1)
+
+            # Показать текущее изображение
+            # Превью – миниатюра, если она есть: не тянем в браузер полноразмерный файл
+            if row["image"]:
+                st.image(row.get("image_thumbnail") or row["image"], caption="Текущее изображение")
+            else:
+                st.write("Нет загруженного изображения.")
 
-                # Файл для замены картинки
-                uploaded_file_edit = st.file_uploader(
-                    "Загрузить новое изображение (чтобы заменить текущее)",
-                    type=["jpg", "jpeg", "png"]
-                )
-                new_image_url = row["image"]  # по умолчанию оставляем старую ссылку
-
-                edit_case_type = row["case_type_id"]
-                if edit_category == "case":
-                    # Если товар - кейс, выбираем тип кейса
-                    df_case_types = pl.read_database("SELECT case_type_id, name FROM case_type", connection=conn)
-                    if len(df_case_types) > 0:
-                        case_type_list = [(r["case_type_id"], r["name"]) for r in df_case_types.to_dicts()]
-
-                        # Определим индекс для selectbox
-                        def find_index(lst, val):
-                            for i, x in enumerate(lst):
-                                if x[0] == val:
-                                    return i
-                            return 0
-                        idx_case = find_index(case_type_list, edit_case_type)
-                        select_case_type = st.selectbox("Тип кейса", case_type_list,
-                                                        index=idx_case, format_func=lambda x: x[1])
-                        edit_case_type = select_case_type[0]
-                    else:
-                        st.warning("Нет типов кейсов в базе.")
+            # Файл для замены картинки
+            uploaded_file_edit = st.file_uploader(
+                "Загрузить новое изображение (чтобы заменить текущее)",
+                type=["jpg", "jpeg", "png"]
+            )
+            new_image_url = row["image"]  # по умолчанию оставляем старую ссылку
+            # Колонки нет, пока не применена миграция 001_product_image_thumbnail
+            new_thumbnail_url = row.get("image_thumbnail")
+
+            edit_case_type = row["case_type_id"]
+            if edit_category == "case":
+                # Если товар - кейс, выбираем тип кейса
+                df_case_types = load_case_types()
+                if len(df_case_types) > 0:
+                    case_type_list = [(r["case_type_id"], r["name"]) for r in df_case_types.to_dicts()]
+
+                    # Определим индекс для selectbox
+                    def find_index(lst, val):
+                        for i, x in enumerate(lst):
+                            if x[0] == val:
+                                return i
+                        return 0
+                    idx_case = find_index(case_type_list, edit_case_type)
+                    select_case_type = st.selectbox("Тип кейса", case_type_list,
+                                                    index=idx_case, format_func=lambda x: x[1])
+                    edit_case_type = select_case_type[0]
                 else:
-                    edit_case_type = None
+                    st.warning("Нет типов кейсов в базе.")
+            else:
+                edit_case_type = None
 
-                if st.button("Сохранить изменения"):
-                    # Если загрузили новую картинку
-                    if uploaded_file_edit is not None:
-                        file_bytes = uploaded_file_edit.read()
-                        new_image_url = upload_to_s3(file_bytes, uploaded_file_edit.name)
+            if st.button("Сохранить изменения"):
+                # Если загрузили новую картинку
+                if uploaded_file_edit is not None:
+                    file_bytes = uploaded_file_edit.read()
+                    stored = upload_to_s3(file_bytes, uploaded_file_edit.name)
+                    new_image_url, new_thumbnail_url = stored.url, stored.thumbnail_url
 
+                with db_connection() as conn:
                     update_product(
                         conn,
                         product_id=chosen_product_id,
@@ -183,207 +287,344 @@ def shop_page():
                         image=new_image_url,
                         availability=edit_aval,
                         category=edit_category,
-                        case_type_id=edit_case_type
+                        case_type_id=edit_case_type,
+                        image_thumbnail=new_thumbnail_url
                     )
-                    st.success("Товар обновлён.")
-
-    # -------------------------------------
-    # Tab 3. Изменение вероятностей
-    # -------------------------------------
-    with tabs[3]:
-        st.subheader("Изменение вероятностей выпадения (case_product_probability)")
-
-        df_case_types = pl.read_database("SELECT case_type_id, name FROM case_type ORDER BY case_type_id", connection=conn)
-        if len(df_case_types) == 0:
-            st.info("Пока нет доступных типов кейсов.")
-        else:
-            case_options = [(r["case_type_id"], r["name"]) for r in df_case_types.to_dicts()]
-            selected_case_type = st.selectbox("Выберите кейс", case_options, format_func=lambda x: x[1])
-            if selected_case_type:
-                current_case_id = selected_case_type[0]
-
-                query_probs = f"""
-                    SELECT cpp.case_type_id, cpp.product_id, cpp.drop_probability,
-                           p.name AS product_name
-                      FROM case_product_probability cpp
-                      JOIN product p ON p.product_id = cpp.product_id
-                     WHERE cpp.case_type_id = {current_case_id}
-                     ORDER BY cpp.product_id
-                """
-                df_probs = pl.read_database(query_probs, connection=conn)
-
-                if len(df_probs) == 0:
-                    st.info("Пока нет товаров в данном кейсе.")
-                else:
-                    # Проходим по записям и для каждого товара даём возможность менять вероятность
-                    for i, row_prob in enumerate(df_probs.to_dicts()):
-                        product_id = row_prob["product_id"]
-                        product_name = row_prob["product_name"]
-                        old_prob = float(row_prob["drop_probability"])
-
-                        # Генерируем уникальный ключ для каждого товара,
-                        # чтобы не было дубликатов ID внутри Streamlit
-                        unique_key = f"prob_input_{current_case_id}_{product_id}_{i}"
-
-                        new_prob = st.number_input(
-                            label=f"{product_name} (ID={product_id}):",
-                            min_value=0.0,
-                            max_value=100.0,
-                            step=1.0,
-                            value=old_prob,
-                            key=unique_key  # уникальный ключ
-                        )
-                        # Если пользователь изменил значение
-                        if new_prob != old_prob:
-                            update_case_probabilities(conn, current_case_id, product_id, new_prob)
-                            st.info(f"Обновлена вероятность для {product_name}: {new_prob}%")
-
-                # Добавить новую связь товар → кейс
-                st.write("---")
-                st.write("**Добавить новую связь (product -> case)**")
-
-                all_merch = pl.read_database(
-                    "SELECT product_id, name FROM product WHERE product_category = 'merch' ORDER BY product_id",
-                    connection=conn
+                st.success("Товар обновлён.")
+
+    st.divider()
+    st.subheader("Массовая замена изображений")
+    st.write("Файл заменяет изображение товара, название которого совпадает с именем файла (без учёта регистра).")
+    bulk_files = st.file_uploader(
+        "Новые изображения", type=["jpg", "jpeg", "png"], accept_multiple_files=True, key="bulk_edit_files"
+    )
+    if not bulk_files:
+        return
+
+    ids_by_name = {}
+    for r in df_products.select("product_id", "name").to_dicts():
+        ids_by_name.setdefault((r["name"] or "").strip().lower(), []).append(r["product_id"])
+    matched = [f for f in bulk_files if product_name_from_filename(f.name).lower() in ids_by_name]
+    unmatched = [f.name for f in bulk_files if f not in matched]
+    if unmatched:
+        st.warning("Нет товаров с такими названиями: " + ", ".join(unmatched))
+
+    if matched and st.button(f"Заменить изображения ({len(matched)})"):
+        results = upload_files_with_progress(matched)
+        images = [
+            (product_id, r.url, r.thumbnail_url)
+            for r in results if r.ok
+            for product_id in ids_by_name[product_name_from_filename(r.filename).lower()]
+        ]
+        with db_connection() as conn:
+            updated = update_product_images(conn, images)
+        st.success(f"Изображения обновлены у товаров: {updated}.")
+
+def case_probabilities_section():
+    """
+    Вероятности выпадения товаров в кейсе: таблица с правками, проверка суммы
+    и сохранение всего состава кейса одной транзакцией (apply_case_probabilities).
+    """
+    st.subheader("Изменение вероятностей выпадения (case_product_probability)")
+
+    df_case_types = load_case_types()
+    if len(df_case_types) == 0:
+        st.info("Пока нет доступных типов кейсов.")
+        return
+
+    case_options = [(r["case_type_id"], r["name"]) for r in df_case_types.to_dicts()]
+    selected_case_type = st.selectbox("Выберите кейс", case_options, format_func=lambda x: x[1])
+    if not selected_case_type:
+        return
+    current_case_id = selected_case_type[0]
+
+    df_probs = load_case_probabilities(current_case_id)
+    # Подписи товаров уникальны (с ID): по ним строки таблицы сопоставляются с product_id
+    label_to_id = {
+        f"{r['name']} (ID={r['product_id']})": r["product_id"] for r in load_merch().to_dicts()
+    }
+    label_to_id.update({
+        f"{r['product_name']} (ID={r['product_id']})": r["product_id"] for r in df_probs.to_dicts()
+    })
+    editor_frame = pl.DataFrame(
+        {
+            "product": [f"{r['product_name']} (ID={r['product_id']})" for r in df_probs.to_dicts()],
+            "drop_probability": df_probs["drop_probability"].cast(pl.Float64).to_list()
+        },
+        schema={"product": pl.String, "drop_probability": pl.Float64}
+    )
+
+    st.write(
+        "Правьте вероятности, добавляйте и удаляйте строки – изменения применяются "
+        "только по кнопке «Сохранить вероятности», когда сумма равна 100%."
+    )
+    # Ключ зависит от кейса, чтобы правки не переезжали на другой кейс
+    editor_key = f"case_probs_editor_{current_case_id}"
+    edited = st.data_editor(
+        editor_frame,
+        key=editor_key,
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        column_config={
+            "product": st.column_config.SelectboxColumn(
+                "Товар", options=sorted(label_to_id), required=True
+            ),
+            "drop_probability": st.column_config.NumberColumn(
+                "Вероятность, %", min_value=0.0, max_value=100.0, step=0.1, required=True
+            )
+        }
+    )
+
+    rows = edited.filter(pl.col("product").is_not_null()).to_dicts()
+    total = sum(r["drop_probability"] or 0.0 for r in rows)
+    duplicates = {r["product"] for r in rows if sum(x["product"] == r["product"] for x in rows) > 1}
+
+    problems = []
+    if abs(total - 100.0) > PROBABILITY_TOTAL_TOLERANCE:
+        problems.append(f"сумма вероятностей {total:g}% вместо 100%")
+    if any(r["drop_probability"] is None for r in rows):
+        problems.append("не у всех товаров указана вероятность")
+    if duplicates:
+        problems.append("товар указан несколько раз: " + ", ".join(sorted(duplicates)))
+    if not rows:
+        problems.append("в кейсе нет товаров")
+
+    st.metric("Сумма вероятностей", f"{total:g}%", delta=f"{total - 100.0:+g}%" if problems else None)
+    for problem in problems:
+        st.warning(problem.capitalize() + ".")
+
+    if st.button("Сохранить вероятности", disabled=bool(problems)):
+        try:
+            with db_connection() as conn:
+                result = apply_case_probabilities(
+                    conn,
+                    current_case_id,
+                    [(label_to_id[r["product"]], r["drop_probability"]) for r in rows]
                 )
-                if len(all_merch) > 0:
-                    merch_options = [(m["product_id"], m["name"]) for m in all_merch.to_dicts()]
-                    chosen_merch = st.selectbox("Товар для добавления", merch_options, format_func=lambda x: x[1])
-
-                    # Аналогично: даём key для number_input
-                    new_prob_key = f"new_prob_input_{current_case_id}"
-                    prob_input = st.number_input(
-                        "Вероятность (%)",
-                        0.0,
-                        100.0,
-                        step=1.0,
-                        key=new_prob_key
-                    )
-                    if st.button("Добавить связь в кейс"):
-                        insert_case_probability(conn, current_case_id, chosen_merch[0], prob_input)
-                        st.success("Связь добавлена.")
-
-                # Удалить связь
-                st.write("**Удалить связь (product -> case)**")
-                # Нужно заново перечитать df_probs, если вы только что добавили запись (по желанию)
-                # Но для простоты оставим как есть
-                df_probs_after = pl.read_database(query_probs, connection=conn)
-                if len(df_probs_after) > 0:
-                    remove_merch_choice = st.selectbox(
-                        "Выберите для удаления",
-                        [(r["product_id"], r["product_name"]) for r in df_probs_after.to_dicts()],
-                        format_func=lambda x: f"{x[1]} (ID={x[0]})"
-                    )
-                    if remove_merch_choice and st.button("Удалить связь"):
-                        delete_case_probability(conn, current_case_id, remove_merch_choice[0])
-                        st.warning(f"Связь удалена: {remove_merch_choice[1]}")
-
-
-    # -------------------------------------
-    # Tab 4. Создание кейсов
-    # -------------------------------------
-    with tabs[4]:
-        st.subheader("Создание новых типов кейсов")
-        new_case_name = st.text_input("Название кейса (например, 'Платиновый')")
-        new_case_desc = st.text_area("Описание кейса")
-
-        if st.button("Создать новый кейс"):
-            if new_case_name:
+        except ValueError as e:
+            st.error(str(e))
+            st.stop()
+        st.success(
+            f"Сохранено: обновлено {result['updated']}, добавлено {result['inserted']}, "
+            f"удалено {result['deleted']}."
+        )
+        # Таблица перечитается из базы: сбрасываем правки редактора
+        del st.session_state[editor_key]
+        st.rerun()
+
+def case_simulation_section():
+    """
+    Монте-Карло открытий кейса по текущим вероятностям и запасам товаров:
+    ожидаемая выплата, полосы разброса и когда закончатся призы.
+    """
+    st.subheader("Симуляция открытий кейса")
+
+    df_case_types = load_case_types()
+    if len(df_case_types) == 0:
+        st.info("Пока нет доступных типов кейсов.")
+        return
+
+    case_options = [(r["case_type_id"], r["name"]) for r in df_case_types.to_dicts()]
+    selected_case_type = st.selectbox("Выберите кейс", case_options, format_func=lambda x: x[1], key="sim_case")
+    if not selected_case_type:
+        return
+    case_type_id = selected_case_type[0]
+
+    df_prizes = load_case_prizes(case_type_id)
+    if len(df_prizes) == 0:
+        st.info("У кейса нет товаров с ненулевой вероятностью.")
+        return
+
+    stored_price = load_case_price(case_type_id)
+    col1, col2, col3, col4 = st.columns(4)
+    openings = col1.number_input("Открытий в прогоне", min_value=1, max_value=1_000_000, value=10_000, step=1000)
+    runs = col2.number_input("Прогонов", min_value=10, max_value=10_000, value=1000, step=100)
+    openings_per_day = col3.number_input("Открытий в день", min_value=0.0, value=100.0, step=10.0)
+    case_price = col4.number_input(
+        "Цена кейса, монет", min_value=0.0, value=stored_price or 0.0, step=1.0,
+        help="По умолчанию – цена товара-кейса этого типа"
+    )
+
+    if openings * runs > CASE_SIMULATION_MAX_DRAWS:
+        st.error(
+            f"Слишком большая симуляция: {int(openings * runs):,} выпадений при пределе "
+            f"{CASE_SIMULATION_MAX_DRAWS:,}. Уменьшите число открытий или прогонов."
+        )
+        return
+
+    if not st.button("Запустить симуляцию"):
+        return
+
+    with section("case_simulation"):
+        payout, depletion = simulate_case(
+            df_prizes["drop_probability"].cast(pl.Float64).to_numpy(),
+            df_prizes["price"].cast(pl.Float64).fill_null(0.0).to_numpy(),
+            df_prizes["stock"].fill_null(0).to_numpy(),
+            openings=int(openings),
+            runs=int(runs)
+        )
+        economics, per_product = summarize_simulation(
+            df_prizes, payout, depletion, int(openings),
+            case_price=case_price or None,
+            openings_per_day=openings_per_day or None
+        )
+
+    col1, col2, col3 = st.columns(3)
+    col1.metric("Ожидаемая выплата за открытие", f"{economics['expected_payout']:.2f}",
+                help=f"По симуляции: {economics['simulated_payout']:.2f}, σ = {economics['payout_std']:.2f}")
+    col2.metric(f"Выплата за {economics['openings']} открытий (5–95%)",
+                f"{economics['total_lower']:,.0f} – {economics['total_upper']:,.0f}")
+    if economics["expected_margin"] is not None:
+        col3.metric("Маржа за открытие", f"{economics['expected_margin']:.2f}",
+                    help=f"Доля прогонов в убыток: {economics['loss_share']:.1%}")
+
+    st.write("Исчерпание призов (номер открытия, квантили 5/50/95% по прогонам, где товар закончился):")
+    st.dataframe(
+        per_product.rename({
+            "product_id": "ID",
+            "product_name": "Товар",
+            "stock": "Запас",
+            "share": "Вероятность, %",
+            "expected_drops": "Ожидаемо выпадет",
+            "depleted_share": "Исчерпан в % прогонов",
+            "depletion_lower": "Открытие, 5%",
+            "depletion_median": "Открытие, медиана",
+            "depletion_upper": "Открытие, 95%",
+            "depletion_days": "Дней до исчерпания (медиана)"
+        }, strict=False),
+        hide_index=True,
+        use_container_width=True
+    )
+
+def create_case_section():
+    """
+    Создание нового типа кейса.
+    """
+    st.subheader("Создание новых типов кейсов")
+    new_case_name = st.text_input("Название кейса (например, 'Платиновый')")
+    new_case_desc = st.text_area("Описание кейса")
+
+    if st.button("Создать новый кейс"):
+        if new_case_name:
+            with db_connection() as conn:
                 create_case_type(conn, new_case_name, new_case_desc)
-                st.success("Новый кейс добавлен!")
-            else:
-                st.error("Введите название кейса.")
-
-    # -------------------------------------
-    # Tab 5. Удаление кейсов
-    # -------------------------------------
-    with tabs[5]:
-        st.subheader("Удаление типов кейсов")
-        df_ctypes = pl.read_database("SELECT case_type_id, name FROM case_type ORDER BY case_type_id", connection=conn)
-        if len(df_ctypes) == 0:
-            st.info("Нет кейсов для удаления.")
+            st.success("Новый кейс добавлен!")
         else:
-            ct_options = [(r["case_type_id"], r["name"]) for r in df_ctypes.to_dicts()]
-            chosen_ct = st.selectbox("Выберите кейс для удаления", ct_options, format_func=lambda x: x[1])
-            if chosen_ct and st.button("Удалить кейс"):
+            st.error("Введите название кейса.")
+
+def delete_case_section():
+    """
+    Удаление типа кейса.
+    """
+    st.subheader("Удаление типов кейсов")
+    df_ctypes = load_case_types()
+    if len(df_ctypes) == 0:
+        st.info("Нет кейсов для удаления.")
+    else:
+        ct_options = [(r["case_type_id"], r["name"]) for r in df_ctypes.to_dicts()]
+        chosen_ct = st.selectbox("Выберите кейс для удаления", ct_options, format_func=lambda x: x[1])
+        if chosen_ct and st.button("Удалить кейс"):
+            with db_connection() as conn:
                 delete_case_type(conn, chosen_ct[0])
-                st.warning(f"Кейс '{chosen_ct[1]}' удалён.")
-
-    # -------------------------------------
-    # Tab 6. Редактирование кейсов
-    # -------------------------------------
-    with tabs[6]:
-        st.subheader("Редактирование типов кейсов")
-        df_ctypes = pl.read_database("SELECT case_type_id, name, description FROM case_type ORDER BY case_type_id", connection=conn)
-        if len(df_ctypes) == 0:
-            st.info("Нет кейсов для редактирования.")
-        else:
-            ct_options = [(r["case_type_id"], r["name"]) for r in df_ctypes.to_dicts()]
-            chosen_ct = st.selectbox("Выберите кейс для редактирования", ct_options, format_func=lambda x: x[1])
-            if chosen_ct:
-                row_ct = next((x for x in df_ctypes.to_dicts() if x["case_type_id"] == chosen_ct[0]), None)
-                if row_ct:
-                    new_name = st.text_input("Название кейса", value=row_ct["name"])
-                    new_desc = st.text_area("Описание кейса", value=row_ct["description"] or "")
-
-                    if st.button("Сохранить изменения кейса"):
+            st.warning(f"Кейс '{chosen_ct[1]}' удалён.")
+
+def edit_case_section():
+    """
+    Редактирование названия и описания типа кейса.
+    """
+    st.subheader("Редактирование типов кейсов")
+    df_ctypes = load_case_types()
+    if len(df_ctypes) == 0:
+        st.info("Нет кейсов для редактирования.")
+    else:
+        ct_options = [(r["case_type_id"], r["name"]) for r in df_ctypes.to_dicts()]
+        chosen_ct = st.selectbox("Выберите кейс для редактирования", ct_options, format_func=lambda x: x[1])
+        if chosen_ct:
+            row_ct = next((x for x in df_ctypes.to_dicts() if x["case_type_id"] == chosen_ct[0]), None)
+            if row_ct:
+                new_name = st.text_input("Название кейса", value=row_ct["name"])
+                new_desc = st.text_area("Описание кейса", value=row_ct["description"] or "")
+
+                if st.button("Сохранить изменения кейса"):
+                    with db_connection() as conn:
                         update_case_type(conn, chosen_ct[0], new_name, new_desc)
-                        st.success("Кейс обновлён.")
-
-    # -------------------------------------
-    # Tab 7. Выдача товаров (призы)
-    # -------------------------------------
-    with tabs[7]:
-        st.subheader("Выдача товаров (призы) пользователям")
-        delivered_filter = st.selectbox("Показать:", ["Все", "Только невыданные", "Только выданные"])
-
-        filter_query = """
-            SELECT uw.user_winning_id, uw.user_id, uw.product_id, uw.delivered, uw.delivered_at, uw.delivered_by,
-                   p.name AS product_name
-              FROM user_winnings uw
-              JOIN product p ON uw.product_id = p.product_id
-        """
-        if delivered_filter == "Только невыданные":
-            filter_query += " WHERE uw.delivered = FALSE"
-        elif delivered_filter == "Только выданные":
-            filter_query += " WHERE uw.delivered = TRUE"
-
-        df_winnings = pl.read_database(filter_query, connection=conn)
-
-        if len(df_winnings) == 0:
-            st.info("Нет призов по выбранному фильтру.")
-        else:
-            pd_winnings = df_winnings.to_pandas()
-            st.dataframe(pd_winnings)
-
-            # Выберем приз для выдачи
-            not_delivered = pd_winnings[pd_winnings["delivered"] == False]
-            if not_delivered.shape[0] > 0:
-                winning_options = [
-                    (r.user_winning_id, f"User {r.user_id}, Товар {r.product_name}")
-                    for r in not_delivered.itertuples()
-                ]
-                chosen_winning = st.selectbox("Отметить приз как выданный", winning_options, format_func=lambda x: x[1])
-                if chosen_winning:
-                    if st.button("Выдать приз"):
-                        admin_id = 999  # условный админ
+                    st.success("Кейс обновлён.")
+
+def winnings_section():
+    """
+    Список призов пользователей и отметка о выдаче.
+    """
+    st.subheader("Выдача товаров (призы) пользователям")
+    delivered_filter = st.selectbox("Показать:", ["Все", "Только невыданные", "Только выданные"])
+
+    df_winnings = load_winnings(delivered_filter)
+
+    if len(df_winnings) == 0:
+        st.info("Нет призов по выбранному фильтру.")
+    else:
+        pd_winnings = df_winnings.to_pandas()
+        st.dataframe(pd_winnings)
+
+        # Выберем приз для выдачи
+        not_delivered = pd_winnings[pd_winnings["delivered"] == False]
+        if not_delivered.shape[0] > 0:
+            winning_options = [
+                (r.user_winning_id, f"User {r.user_id}, Товар {r.product_name}")
+                for r in not_delivered.itertuples()
+            ]
+            chosen_winning = st.selectbox("Отметить приз как выданный", winning_options, format_func=lambda x: x[1])
+            if chosen_winning:
+                if st.button("Выдать приз"):
+                    admin_id = 999  # условный админ
+                    with db_connection() as conn:
                         update_winning_delivery(conn, chosen_winning[0], True, admin_id)
-                        st.success(f"Приз (ID={chosen_winning[0]}) выдан.")
-
-    # -------------------------------------
-    # Tab 8. Просмотр S3
-    # -------------------------------------
-    with tabs[8]:
-        st.subheader("Просмотр загруженных объектов в S3")
-        objects = list_s3_objects()
-        if not objects:
-            st.info("В бакете нет объектов.")
-        else:
-            st.write("Список ключей (файлов) в бакете:")
-            for obj_key in objects:
-                st.write(obj_key)
+                    st.success(f"Приз (ID={chosen_winning[0]}) выдан.")
+
+def s3_browser_section():
+    """
+    Список объектов в бакете S3.
+    """
+    st.subheader("Просмотр загруженных объектов в S3")
+    if st.button("Обновить список"):
+        refresh_s3_listing()
+    objects = list_s3_objects_cached()
+    if not objects:
+        st.info("В бакете нет объектов.")
+    else:
+        st.write("Список ключей (файлов) в бакете:")
+        for obj_key in objects:
+            st.write(obj_key)
+
+# Разделы страницы в порядке меню: название -> функция отрисовки (без аргументов:
+# соединение берётся только в обработчиках сохранения)
+SHOP_SECTIONS = {
+    "Добавление товаров": add_product_section,
+    "Удаление товаров": delete_product_section,
+    "Редактирование товаров": edit_product_section,
+    "Изменение вероятностей": case_probabilities_section,
+    "Симуляция кейсов": case_simulation_section,
+    "Создание кейсов": create_case_section,
+    "Удаление кейсов": delete_case_section,
+    "Редактирование кейсов": edit_case_section,
+    "Выдача товаров (призы)": winnings_section,
+    "Просмотр S3": s3_browser_section
+}
+
+def shop_page():
+    start_rerun("3_shop")
+    st.title("Управление магазином (с загрузкой изображений в S3)")
+
+    # st.tabs выполняет тела всех вкладок на каждом прогоне – вместо них
+    # переключатель разделов: данные читает и виджеты строит только открытый раздел.
+    # Чтения идут через read_cached со своим соединением, а раздел берёт соединение
+    # из пула только на время сохранения изменений
+    chosen = st.radio("Раздел", list(SHOP_SECTIONS), horizontal=True, key="shop_section")
+
+    with section(chosen):
+        SHOP_SECTIONS[chosen]()
 
-    conn.close()
+    render_debug_sidebar()
 
 if __name__ == "__main__":
     shop_page()
@@ -0,0 +1,227 @@
+# src/rollups.py
+import hashlib
+import os
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import polars as pl
+
+import hll
+from settings import ANALYTICS_ROLLUP_DIR, ANALYTICS_ROLLUP_REFRESH_INTERVAL, ANALYTICS_ROLLUP_LOOKBACK_DAYS
+
+# Описание дневного агрегата:
+#   method      – метод источника данных, отдающий сырые строки (DataSource.logins и т.д.);
+#   date_column – колонка даты события;
+#   keys        – ключи помимо дня;
+#   aggs        – выражения агрегации за день;
+#   prepare     – необязательное преобразование сырых строк перед агрегацией.
+RollupSpec = namedtuple("RollupSpec", ["method", "date_column", "keys", "aggs", "prepare"], defaults=(None,))
+
+# Имя агрегата с дневными HLL-скетчами; точность в имени – скетчи разной точности несовместимы
+USER_SKETCHES = f"daily_user_sketches_p{hll.PRECISION}"
+
+ROLLUPS = {
+    # Уникальные активные пользователи за день
+    "daily_active_users": RollupSpec(
+        method="logins",
+        date_column="login_date",
+        keys=[],
+        aggs=[pl.col("user_id").n_unique().cast(pl.Int64).alias("active_users")]
+    ),
+    # Дневные HLL-скетчи активных пользователей (day, register, rank) –
+    # для недельной и месячной активности объединением скетчей
+    USER_SKETCHES: RollupSpec(
+        method="logins",
+        date_column="login_date",
+        keys=["register"],
+        aggs=[pl.col("rank").max().cast(pl.Int64)],
+        prepare=lambda frame: hll.sketch_columns(frame, "user_id")
+    ),
+    # Выручка и проданное количество по товару за день
+    "daily_item_sales": RollupSpec(
+        method="transactions",
+        date_column="transaction_date",
+        keys=["item"],
+        aggs=[
+            pl.col("total_amount").sum().cast(pl.Float64).alias("revenue"),
+            pl.col("quantity").sum().cast(pl.Int64).alias("quantity")
+        ]
+    ),
+    # Полученные достижения по типу за день
+    "daily_achievements": RollupSpec(
+        method="achievements",
+        date_column="unlock_date",
+        keys=["achievement"],
+        aggs=[pl.len().cast(pl.Int64).alias("count")]
+    )
+}
+
+
+def aggregate_daily(spec: RollupSpec, frame: pl.LazyFrame) -> pl.LazyFrame:
+    """
+    Сворачивает сырые строки источника в дневной агрегат (колонка day – начало дня).
+    """
+    if spec.prepare is not None:
+        frame = spec.prepare(frame)
+    return frame.with_columns(
+        pl.col(spec.date_column).cast(pl.Datetime("us")).dt.truncate("1d").alias("day")
+    ).group_by(["day", *spec.keys]).agg(spec.aggs)
+
+
+def aggregate_batches(spec: RollupSpec, batches) -> pl.DataFrame:
+    """
+    Дневной агрегат по порциям сырых строк, упорядоченным по дате события.
+
+    Последний день порции может продолжиться в следующей, поэтому его строки
+    переносятся в следующую порцию, а агрегируются только завершённые дни.
+    Так любой агрегат (и n_unique) считается верно, а в памяти – порция
+    и хвост одного дня, а не вся история.
+    """
+    day = pl.col(spec.date_column).cast(pl.Datetime("us")).dt.truncate("1d")
+    parts, carry = [], None
+    for batch in batches:
+        if carry is not None:
+            batch = pl.concat([carry, batch], how="vertical_relaxed")
+        if batch.height == 0:
+            continue
+        last_day = batch.select(day.max()).item()
+        parts.append(aggregate_daily(spec, batch.lazy().filter(day < last_day)).collect())
+        carry = batch.filter(day >= last_day)
+    if carry is not None:
+        parts.append(aggregate_daily(spec, carry.lazy()).collect())
+    if not parts:
+        return None
+    return pl.concat(parts, how="vertical_relaxed")
+
+
+class RollupStore:
+    """
+    Дневные агрегаты одного источника данных, которые дозагружаются инкрементально.
+
+    Для каждого агрегата хранится таблица (day, ключи, метрики). update()
+    пересчитывает окно из lookback_days последних дней: читает из источника
+    строки начиная с начала окна и заменяет ими хвост таблицы. Окно
+    отсчитывается от последнего сохранённого дня, но не позже сегодняшнего,
+    поэтому подхватываются и неполный последний день, и поздно записанные
+    события (посещения, выигрыши) за прошлые дни, а событие с датой в будущем
+    не останавливает пересчёт предыдущих дней. Стоимость обновления зависит
+    от окна и новых данных, а не от длины истории.
+
+    При заданном directory таблицы хранятся в Parquet (переживают перезапуск),
+    иначе – только в памяти процесса. Изменения и удаления строк старше
+    окна не подхватываются – для этого есть reset().
+    """
+
+    def __init__(self, directory=None, refresh_interval=60.0, lookback_days=7):
+        self.directory = directory
+        self.refresh_interval = refresh_interval
+        self.lookback_days = lookback_days
+        self._lock = threading.Lock()
+        self._frames = {}
+        self._updated_at = None
+
+    def update(self, source, force=False):
+        """
+        Дочитывает в агрегаты новые данные источника.
+        Не чаще одного раза в refresh_interval секунд, если не force.
+        """
+        with self._lock:
+            if not force and self._updated_at is not None and \
+                    time.monotonic() - self._updated_at < self.refresh_interval:
+                return
+            today = datetime.combine(datetime.now().date(), datetime.min.time())
+            for name, spec in ROLLUPS.items():
+                stored = self._load(name)
+                window_start = None
+                if stored is not None and stored.height > 0:
+                    window_start = min(stored["day"].max(), today) - timedelta(days=self.lookback_days)
+                fresh = aggregate_batches(spec, source.batches(spec.method, start_dt=window_start))
+                if fresh is None:
+                    # В источнике нет строк начиная с окна
+                    if stored is None:
+                        continue
+                    fresh = stored.head(0)
+                if window_start is not None:
+                    fresh = pl.concat([stored.filter(pl.col("day") < window_start), fresh], how="vertical_relaxed")
+                self._save(name, fresh.sort(["day", *spec.keys]))
+            self._updated_at = time.monotonic()
+
+    def reset(self):
+        """
+        Удаляет сохранённые агрегаты: следующий update() пересчитает всю историю.
+        """
+        with self._lock:
+            self._frames.clear()
+            self._updated_at = None
+            for name in ROLLUPS:
+                path = self._path(name)
+                if path is not None and os.path.exists(path):
+                    os.remove(path)
+
+    def scan(self, name, start_dt=None, end_dt=None) -> pl.LazyFrame:
+        """
+        Агрегат за период [start_dt, end_dt] как pl.LazyFrame.
+        """
+        with self._lock:
+            frame = self._load(name)
+        if frame is None:
+            spec = ROLLUPS[name]
+            frame = pl.DataFrame(schema={
+                "day": pl.Datetime("us"),
+                **{key: pl.Int64 if key == "register" else pl.String for key in spec.keys},
+                **{agg.meta.output_name(): pl.Float64 for agg in spec.aggs}
+            })
+        lazy = frame.lazy()
+        if start_dt is not None:
+            lazy = lazy.filter(pl.col("day") >= pl.lit(start_dt).dt.truncate("1d"))
+        if end_dt is not None:
+            lazy = lazy.filter(pl.col("day") <= end_dt)
+        return lazy
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.parquet") if self.directory else None
+
+    def _load(self, name):
+        if name not in self._frames:
+            path = self._path(name)
+            if path is None or not os.path.exists(path):
+                return None
+            self._frames[name] = pl.read_parquet(path)
+        return self._frames[name]
+
+    def _save(self, name, frame):
+        path = self._path(name)
+        if path is not None:
+            os.makedirs(self.directory, exist_ok=True)
+            # Пишем во временный файл и подменяем: читатели не увидят недописанный файл
+            frame.write_parquet(f"{path}.tmp")
+            os.replace(f"{path}.tmp", path)
+        self._frames[name] = frame
+
+
+# Хранилища по источникам: модуль импортируется один раз и разделяется всеми сессиями
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def rollup_store(source) -> RollupStore:
+    """
+    Возвращает общее хранилище агрегатов для источника.
+    Каталог – ANALYTICS_ROLLUP_DIR/<вид источника>/<хэш параметров источника>;
+    источники с persist_rollups = False (синтетика) держат агрегаты в памяти.
+    """
+    key = source.cache_key()
+    with _stores_lock:
+        if key not in _stores:
+            directory = None
+            if source.persist_rollups:
+                digest = hashlib.sha1(repr(key).encode("utf-8")).hexdigest()[:12]
+                directory = os.path.join(ANALYTICS_ROLLUP_DIR, source.kind, digest)
+            _stores[key] = RollupStore(
+                directory,
+                refresh_interval=ANALYTICS_ROLLUP_REFRESH_INTERVAL,
+                lookback_days=ANALYTICS_ROLLUP_LOOKBACK_DAYS
+            )
+        return _stores[key]
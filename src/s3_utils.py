@@ -1,70 +1,266 @@
 # src/s3_utils.py
-import uuid
+import contextvars
+import hashlib
+import io
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Optional
+
 import boto3
-from settings import S3_BUCKET_NAME, S3_ENDPOINT_URL, S3_ACCESS_KEY, S3_SECRET_KEY
+import streamlit as st
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+
+from data_cache import table_cache
+from images import image_extension, normalize_image
+from instrumentation import track, traced
+from settings import (
+    S3_BUCKET_NAME,
+    S3_ENDPOINT_URL,
+    S3_ACCESS_KEY,
+    S3_SECRET_KEY,
+    S3_MAX_POOL_CONNECTIONS,
+    S3_RETRIES,
+    S3_UPLOAD_WORKERS,
+    S3_MULTIPART_THRESHOLD_MB,
+    S3_MULTIPART_CHUNK_MB,
+    S3_TRANSFER_CONCURRENCY,
+    IMAGE_MAX_SIZE,
+    IMAGE_THUMBNAIL_SIZE
+)
+
+MB = 1024 * 1024
 
+# Файлы больше порога грузятся частями; части одного файла – в несколько потоков
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD_MB * MB,
+    multipart_chunksize=S3_MULTIPART_CHUNK_MB * MB,
+    max_concurrency=S3_TRANSFER_CONCURRENCY
+)
+# upload_many уже грузит S3_UPLOAD_WORKERS файлов параллельно – части каждого
+# файла идут в одном потоке, чтобы соединений было не больше, чем загрузчиков
+BULK_TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=S3_MULTIPART_THRESHOLD_MB * MB,
+    multipart_chunksize=S3_MULTIPART_CHUNK_MB * MB,
+    max_concurrency=1
+)
+
+
+@dataclass
+class StoredImage:
+    """
+    Ссылки на сохранённое изображение и его миниатюру.
+    uploaded = False – все объекты уже были в бакете, байты не передавались.
+    """
+    url: str
+    thumbnail_url: Optional[str]
+    uploaded: bool
+
+
+@dataclass
+class UploadResult:
+    """
+    Результат загрузки одного файла в upload_many.
+    """
+    filename: str
+    ok: bool
+    url: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    uploaded: bool = False
+    error: Optional[str] = None
+
+
+@st.cache_resource
 def s3_client():
     """
-    Создаёт и возвращает клиент для работы с S3.
+    Общий на процесс клиент S3 (клиенты boto3 потокобезопасны).
+    Пул соединений не меньше числа параллельных загрузок upload_many и потоков
+    одной multipart-загрузки, временные ошибки и троттлинг повторяются
+    с экспоненциальной паузой.
     """
     return boto3.client(
         's3',
         endpoint_url=S3_ENDPOINT_URL,
         aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY
+        aws_secret_access_key=S3_SECRET_KEY,
+        config=Config(
+            max_pool_connections=max(S3_MAX_POOL_CONNECTIONS, S3_UPLOAD_WORKERS, S3_TRANSFER_CONCURRENCY),
+            retries={"max_attempts": S3_RETRIES, "mode": "standard"}
+        )
     )
 
-def upload_to_s3(file_bytes, original_filename):
+def content_type_for(filename):
     """
-    Загружает файл (в байтах) в S3 и возвращает публичную ссылку на него.
+    Content-Type по расширению файла.
+    """
+    if filename.lower().endswith(('.jpg', '.jpeg')):
+        return 'image/jpeg'
+    if filename.lower().endswith('.png'):
+        return 'image/png'
+    return 'application/octet-stream'
 
-    :param file_bytes: содержимое файла (bytes)
-    :param original_filename: исходное имя файла (например, "bronze_case.png")
-    :return: публичная ссылка на загруженный файл
+def public_url(key):
+    return f"{S3_ENDPOINT_URL}/{S3_BUCKET_NAME}/{key}"
+
+def object_exists(key):
+    """
+    HEAD-запрос: есть ли объект с таким ключом в бакете.
+    """
+    with track("s3", "head_object") as span:
+        try:
+            s3_client().head_object(Bucket=S3_BUCKET_NAME, Key=key)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return False
+            span.ok = False
+            raise
+    return True
+
+def _put_bytes(file_bytes, key, content_type, transfer_config=TRANSFER_CONFIG):
     """
-    s3 = s3_client()
+    Загружает байты под ключом key. Большие файлы уходят multipart-загрузкой
+    (см. TRANSFER_CONFIG).
+    """
+    with track("s3", "put_object") as span:
+        s3_client().upload_fileobj(
+            io.BytesIO(file_bytes),
+            S3_BUCKET_NAME,
+            key,
+            ExtraArgs={
+                "ContentType": content_type,
+                "ACL": "public-read"  # делаем файл публично доступным
+            },
+            Config=transfer_config
+        )
+        span.rows, span.bytes = 1, len(file_bytes)
+
+def _put_image(file_bytes, original_filename, transfer_config=TRANSFER_CONFIG):
+    """
+    Сохраняет изображение по адресу от содержимого и возвращает StoredImage.
 
-    # Определяем Content-Type на основе расширения файла
-    if original_filename.lower().endswith(('.jpg', '.jpeg')):
-        content_type = 'image/jpeg'
-    elif original_filename.lower().endswith('.png'):
-        content_type = 'image/png'
+    Ключ – images/<sha256 исходных байтов>_<IMAGE_MAX_SIZE>.<расширение>,
+    миниатюра – images/<sha256>_<IMAGE_THUMBNAIL_SIZE>.<расширение>: размер в
+    ключе, чтобы после смены настроек не отдавался вариант старого размера.
+    Перед загрузкой HEAD-запрос проверяет, нет ли объекта в бакете: повторная
+    загрузка той же картинки не передаёт и не хранит байты заново. Основное
+    изображение уменьшается до IMAGE_MAX_SIZE по большей стороне. Файлы,
+    которые не читаются как изображение, сохраняются как есть и без миниатюры.
+    """
+    digest = hashlib.sha256(file_bytes).hexdigest()
+    extension = image_extension(original_filename)
+    content_type = content_type_for(original_filename)
+    if extension is None:
+        key, thumbnail_key = f"images/{digest}", None
     else:
-        content_type = 'application/octet-stream'
-
-    # Генерируем уникальное имя файла с сохранением оригинального имени,
-    # например, помещая файлы в папку images/
-    unique_name = f"images/{uuid.uuid4().hex}_{original_filename}"
-
-    # Загружаем файл в бакет
-    s3.put_object(
-        Bucket=S3_BUCKET_NAME,
-        Key=unique_name,
-        Body=file_bytes,
-        ContentType=content_type,
-        ACL="public-read"  # делаем файл публично доступным
+        key = f"images/{digest}_{IMAGE_MAX_SIZE}.{extension}"
+        thumbnail_key = f"images/{digest}_{IMAGE_THUMBNAIL_SIZE}.{extension}"
+
+    uploaded = False
+    if not object_exists(key):
+        body = file_bytes
+        if extension is not None:
+            try:
+                body = normalize_image(file_bytes, extension, IMAGE_MAX_SIZE)
+            except ValueError:
+                # Нечитаемое изображение сохраняем как есть, но без миниатюры
+                thumbnail_key = None
+        _put_bytes(body, key, content_type, transfer_config)
+        uploaded = True
+    if thumbnail_key is not None and not object_exists(thumbnail_key):
+        try:
+            _put_bytes(
+                normalize_image(file_bytes, extension, IMAGE_THUMBNAIL_SIZE), thumbnail_key, content_type,
+                transfer_config
+            )
+            uploaded = True
+        except ValueError:
+            thumbnail_key = None
+
+    return StoredImage(
+        url=public_url(key),
+        thumbnail_url=public_url(thumbnail_key) if thumbnail_key is not None else None,
+        uploaded=uploaded
     )
 
-    # Формируем публичную ссылку
-    s3_url = f"{S3_ENDPOINT_URL}/{S3_BUCKET_NAME}/{unique_name}"
+@traced("s3", measure=lambda args, kwargs, result: (1, len(args[0])))
+def upload_to_s3(file_bytes, original_filename):
+    """
+    Загружает изображение (в байтах) в S3 вместе с миниатюрой (см. _put_image).
 
-    return s3_url
+    :param file_bytes: содержимое файла (bytes)
+    :param original_filename: исходное имя файла (например, "bronze_case.png")
+    :return: StoredImage – публичные ссылки на изображение и миниатюру
+    """
+    stored = _put_image(file_bytes, original_filename)
+    if stored.uploaded:
+        refresh_s3_listing()
+    return stored
 
+@traced("s3", measure=lambda args, kwargs, result: (sum(r.ok for r in result), sum(len(b) for _, b in args[0])))
+def upload_many(files, on_progress=None, max_workers=S3_UPLOAD_WORKERS):
+    """
+    Загружает много изображений параллельно из пула потоков через общий клиент.
+
+    :param files: список пар (имя файла, bytes)
+    :param on_progress: необязательный callback(done, total, filename), вызывается
+                        в вызывающем потоке по мере завершения загрузок
+    :return: список UploadResult в порядке files (ошибки не пробрасываются);
+             файлы, уже лежащие в бакете, не загружаются повторно (uploaded = False)
+    """
+    files = list(files)
+    results = [None] * len(files)
+    if not files:
+        return results
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="s3-upload") as executor:
+        # Каждой задаче – своя копия контекста, чтобы замеры попадали в трассировку страницы
+        futures = {
+            executor.submit(contextvars.copy_context().run, _put_image, file_bytes, filename, BULK_TRANSFER_CONFIG): i
+            for i, (filename, file_bytes) in enumerate(files)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            filename = files[i][0]
+            try:
+                stored = future.result()
+                results[i] = UploadResult(
+                    filename, ok=True, url=stored.url, thumbnail_url=stored.thumbnail_url, uploaded=stored.uploaded
+                )
+            except Exception as e:
+                results[i] = UploadResult(filename, ok=False, error=str(e))
+            if on_progress is not None:
+                on_progress(done, len(files), filename)
+    refresh_s3_listing()
+    return results
+
+@traced("s3", measure=lambda args, kwargs, result: (len(result), None))
 def list_s3_objects():
     """
     Возвращает список объектов (keys) в бакете S3.
     """
-    s3 = s3_client()
-    response = s3.list_objects_v2(Bucket=S3_BUCKET_NAME)
-    if "Contents" not in response:
-        return []
-    objects = response["Contents"]
-    keys = [obj["Key"] for obj in objects]
+    paginator = s3_client().get_paginator("list_objects_v2")
+    keys = []
+    for page in paginator.paginate(Bucket=S3_BUCKET_NAME):
+        keys.extend(obj["Key"] for obj in page.get("Contents", []))
     return keys
 
+@traced("s3")
 def delete_s3_object(key):
     """
     Удаляет объект (key) из S3-бакета.
     """
-    s3 = s3_client()
-    s3.delete_object(Bucket=S3_BUCKET_NAME, Key=key)
+    s3_client().delete_object(Bucket=S3_BUCKET_NAME, Key=key)
+    refresh_s3_listing()
+
+def list_s3_objects_cached():
+    """
+    Список объектов бакета из общего кэша (data_cache.table_cache, метка "s3"):
+    живёт TABLE_CACHE_TTL секунд и сбрасывается при загрузке и удалении через этот модуль.
+    """
+    return table_cache.get_or_load(("s3.list", S3_BUCKET_NAME), ["s3"], list_s3_objects)
+
+def refresh_s3_listing():
+    """
+    Сбрасывает закэшированный список объектов бакета.
+    """
+    table_cache.invalidate("s3")
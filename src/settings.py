@@ -1,8 +1,10 @@
 import os
-import psycopg2
-import boto3
+from urllib.parse import quote
+import streamlit as st
 from dotenv import load_dotenv
 
+from db_pool import ConnectionPool
+
 # Загрузка переменных окружения из файла .env
 load_dotenv()
 
@@ -13,35 +15,114 @@ POSTGRES_DB   = os.getenv("POSTGRES_DB")
 POSTGRES_USER = os.getenv("POSTGRES_USER")
 POSTGRES_PWD  = os.getenv("POSTGRES_PWD")
 
+# Параметры пула соединений
+POSTGRES_POOL_MAX_SIZE        = int(os.getenv("POSTGRES_POOL_MAX_SIZE", 10))
+POSTGRES_POOL_TIMEOUT         = float(os.getenv("POSTGRES_POOL_TIMEOUT", 10))
+POSTGRES_POOL_MAX_LIFETIME    = float(os.getenv("POSTGRES_POOL_MAX_LIFETIME", 1800))
+POSTGRES_POOL_HEALTH_INTERVAL = float(os.getenv("POSTGRES_POOL_HEALTH_INTERVAL", 30))
+POSTGRES_CONNECT_TIMEOUT      = int(os.getenv("POSTGRES_CONNECT_TIMEOUT", 5))
+
+# URI для Arrow-движков массового чтения (см. db_reader.py)
+POSTGRES_URI = (
+    f"postgresql://{quote(POSTGRES_USER or '', safe='')}:{quote(POSTGRES_PWD or '', safe='')}"
+    f"@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DB}"
+)
+# auto | adbc | connectorx | psycopg2
+DB_BULK_ENGINE     = os.getenv("DB_BULK_ENGINE", "auto")
+DB_BULK_BATCH_SIZE = int(os.getenv("DB_BULK_BATCH_SIZE", 100_000))
+
+# Кэш прочитанных таблиц (см. data_cache.py)
+TABLE_CACHE_TTL         = float(os.getenv("TABLE_CACHE_TTL", 300))
+TABLE_CACHE_MAX_ENTRIES = int(os.getenv("TABLE_CACHE_MAX_ENTRIES", 128))
+TABLE_CACHE_MAX_MB      = int(os.getenv("TABLE_CACHE_MAX_MB", 512))
+
+# Инструментирование: отладочная панель и журнал замеров (JSONL)
+DASHBOARD_DEBUG  = os.getenv("DASHBOARD_DEBUG", "0") == "1"
+METRICS_LOG_PATH = os.getenv("METRICS_LOG_PATH")
+
+# Источник данных страницы аналитики: synthetic | postgres | parquet (см. analytics_data.py)
+ANALYTICS_SOURCE               = os.getenv("ANALYTICS_SOURCE", "synthetic")
+ANALYTICS_PARQUET_DIR          = os.getenv("ANALYTICS_PARQUET_DIR", "data/analytics")
+# Колонка user_winnings с датой выигрыша (покупки)
+ANALYTICS_WINNINGS_DATE_COLUMN = os.getenv("ANALYTICS_WINNINGS_DATE_COLUMN", "created_at")
+# Дневные агрегаты аналитики (см. rollups.py): каталог Parquet, период дозагрузки, сек,
+# и сколько последних дней пересчитывается при каждой дозагрузке (поздно записанные события)
+ANALYTICS_ROLLUP_DIR              = os.getenv("ANALYTICS_ROLLUP_DIR", "data/rollups")
+ANALYTICS_ROLLUP_REFRESH_INTERVAL = float(os.getenv("ANALYTICS_ROLLUP_REFRESH_INTERVAL", 60))
+ANALYTICS_ROLLUP_LOOKBACK_DAYS    = int(os.getenv("ANALYTICS_ROLLUP_LOOKBACK_DAYS", 7))
+# Число активных за неделю/месяц (см. hll.py): допустимая ошибка HLL-оценки и предел
+# числа пар (пользователь, день) в окне, до которого считается точно
+ANALYTICS_HLL_ERROR      = float(os.getenv("ANALYTICS_HLL_ERROR", 0.02))
+ANALYTICS_EXACT_DISTINCT = int(os.getenv("ANALYTICS_EXACT_DISTINCT", 1_000_000))
+
+# Бэктест моделей прогноза (см. backtesting.py): число процессов
+BACKTEST_WORKERS = int(os.getenv("BACKTEST_WORKERS", 4))
+
+# Графики (см. charts.py): предел точек линии (≈ ширина в пикселях) и столбцов бар-чарта
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", 1000))
+CHART_MAX_BARS   = int(os.getenv("CHART_MAX_BARS", 30))
+
+# Симуляция кейсов (см. case_simulation.py): предел открытий × прогонов за запуск
+# (~100 нс на выпадение – около 5 с на предел)
+CASE_SIMULATION_MAX_DRAWS = int(os.getenv("CASE_SIMULATION_MAX_DRAWS", 50_000_000))
+
 # Константы для S3
 S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")
 S3_ACCESS_KEY   = os.getenv("S3_ACCESS_KEY")
 S3_SECRET_KEY   = os.getenv("S3_SECRET_KEY")
 S3_BUCKET_NAME  = os.getenv("S3_BUCKET_NAME")
+# Клиент и массовая загрузка (см. s3_utils.py): пул соединений, повторы,
+# число параллельных загрузок, порог/размер части multipart-загрузки, МБ,
+# и число потоков на части одного файла (при массовой загрузке – 1 поток на файл)
+S3_MAX_POOL_CONNECTIONS   = int(os.getenv("S3_MAX_POOL_CONNECTIONS", 32))
+S3_RETRIES                = int(os.getenv("S3_RETRIES", 5))
+S3_UPLOAD_WORKERS         = int(os.getenv("S3_UPLOAD_WORKERS", 16))
+S3_MULTIPART_THRESHOLD_MB = int(os.getenv("S3_MULTIPART_THRESHOLD_MB", 8))
+S3_MULTIPART_CHUNK_MB     = int(os.getenv("S3_MULTIPART_CHUNK_MB", 8))
+S3_TRANSFER_CONCURRENCY   = int(os.getenv("S3_TRANSFER_CONCURRENCY", 4))
+# Изображения товаров (см. images.py): наибольшая сторона основного изображения
+# и миниатюры, пиксели, и качество JPEG при пережатии
+IMAGE_MAX_SIZE       = int(os.getenv("IMAGE_MAX_SIZE", 1600))
+IMAGE_THUMBNAIL_SIZE = int(os.getenv("IMAGE_THUMBNAIL_SIZE", 320))
+IMAGE_JPEG_QUALITY   = int(os.getenv("IMAGE_JPEG_QUALITY", 85))
 
-def db_connection():
+# API начисления ачивок за посещение
+ACHIEVEMENTS_API_URL       = os.getenv("ACHIEVEMENTS_API_URL", "https://api.b8st.ru")
+VISIT_ACHIEVEMENT_TYPE_ID  = int(os.getenv("VISIT_ACHIEVEMENT_TYPE_ID", 10))
+ACHIEVEMENTS_API_WORKERS   = int(os.getenv("ACHIEVEMENTS_API_WORKERS", 16))
+ACHIEVEMENTS_API_TIMEOUT   = float(os.getenv("ACHIEVEMENTS_API_TIMEOUT", 10))
+ACHIEVEMENTS_API_RETRIES   = int(os.getenv("ACHIEVEMENTS_API_RETRIES", 3))
+
+@st.cache_resource
+def db_pool():
     """
-    Устанавливает соединение с PostgreSQL
-    и возвращает объект подключения.
+    Создаёт пул соединений с PostgreSQL.
+    Кэшируется на весь процесс, поэтому общий для всех сессий Streamlit.
     """
-    connection = psycopg2.connect(
-        host=POSTGRES_HOST,
-        port=POSTGRES_PORT,
-        database=POSTGRES_DB,
-        user=POSTGRES_USER,
-        password=POSTGRES_PWD
+    return ConnectionPool(
+        dict(
+            host=POSTGRES_HOST,
+            port=POSTGRES_PORT,
+            database=POSTGRES_DB,
+            user=POSTGRES_USER,
+            password=POSTGRES_PWD,
+            connect_timeout=POSTGRES_CONNECT_TIMEOUT
+        ),
+        max_size=POSTGRES_POOL_MAX_SIZE,
+        checkout_timeout=POSTGRES_POOL_TIMEOUT,
+        max_lifetime=POSTGRES_POOL_MAX_LIFETIME,
+        health_check_interval=POSTGRES_POOL_HEALTH_INTERVAL
     )
-    return connection
 
-def s3_client():
+def db_connection():
     """
-    Создаёт и возвращает клиент S3 (boto3.client)
-    с заданными параметрами (эндпоинт, ключи).
+    Выдаёт соединение с PostgreSQL из общего пула.
+    Используется как контекстный менеджер:
+
+        with db_connection() as conn:
+            ...
+
+    По выходу из блока соединение возвращается в пул
+    (незакоммиченная транзакция откатывается).
     """
-    client = boto3.client(
-        service_name="s3",
-        endpoint_url=S3_ENDPOINT_URL,
-        aws_access_key_id=S3_ACCESS_KEY,
-        aws_secret_access_key=S3_SECRET_KEY
-    )
-    return client
+    return db_pool().connection()
@@ -0,0 +1,105 @@
+# src/visits.py
+from data_cache import read_cached
+
+
+def diff_visits(loaded_statuses, attended_flags):
+    """
+    Вычисляет минимальный набор изменений посещаемости.
+
+    :param loaded_statuses: {(event_id, user_id): visit} – статусы, загруженные из базы
+    :param attended_flags: {(event_id, user_id): bool} – состояние галочек «Посетил»
+    :return: список (event_id, user_id, new_visit) только для строк, где галочка
+             разошлась с загруженным статусом. Строки без изменений (в т.ч. "late"
+             с неотмеченной галочкой) не попадают в результат.
+    """
+    changes = []
+    for key, attended in attended_flags.items():
+        was_attended = loaded_statuses.get(key) == "attended"
+        if attended != was_attended:
+            changes.append((key[0], key[1], "attended" if attended else "missed"))
+    return changes
+
+
+def edited_attendance(df_visits, edited_rows):
+    """
+    Собирает загруженные статусы и новые значения галочек только для строк,
+    которые правили в st.data_editor.
+
+    :param df_visits: страница посещаемости (event_id, user_id, visit, ...)
+    :param edited_rows: st.session_state[<key>]["edited_rows"] – {номер строки: {колонка: значение}}
+    :return: (loaded_statuses, attended_flags) в формате diff_visits
+    """
+    loaded_statuses = {}
+    attended_flags = {}
+    for idx, cells in edited_rows.items():
+        if "attended" not in cells:
+            continue
+        row = df_visits.row(int(idx), named=True)
+        key = (row["event_id"], row["user_id"])
+        loaded_statuses[key] = row["visit"]
+        attended_flags[key] = bool(cells["attended"])
+    return loaded_statuses, attended_flags
+
+
+# -------------------------------------
+# Серверная выборка посещаемости с постраничным чтением
+# -------------------------------------
+VISITS_PAGE_SIZE = 10000
+VISITS_TABLES = ["event_user_visits", "events", "users"]
+
+
+def _visits_where(event_id=None, event_name=None, after=None):
+    """
+    Собирает WHERE и параметры для фильтров. В текст запроса попадают
+    только фиксированные условия, значения передаются параметрами.
+    """
+    clauses, params = [], []
+    if event_id is not None:
+        clauses.append("v.event_id = %s")
+        params.append(event_id)
+    if event_name is not None:
+        clauses.append("e.event_name = %s")
+        params.append(event_name)
+    if after is not None:
+        # keyset-пагинация: строки строго после последнего ключа предыдущей страницы
+        clauses.append("(v.event_id, v.user_id) > (%s, %s)")
+        params.extend(after)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+    return where, params
+
+
+def fetch_visits_page(event_id=None, event_name=None, after=None, limit=VISITS_PAGE_SIZE):
+    """
+    Возвращает одну страницу посещаемости, уже соединённую с events и users
+    и отфильтрованную в PostgreSQL. Порядок – по (event_id, user_id).
+
+    :param after: ключ (event_id, user_id) последней строки предыдущей страницы
+    :return: polars.DataFrame с колонками event_id, user_id, visit,
+             event_name, surname, name, last_surname
+    """
+    where, params = _visits_where(event_id, event_name, after)
+    query = f"""
+        SELECT v.event_id, v.user_id, v.visit,
+               e.event_name, u.surname, u.name, u.last_surname
+          FROM event_user_visits v
+          LEFT JOIN events e ON e.event_id = v.event_id
+          LEFT JOIN users u ON u.user_id = v.user_id
+          {where}
+         ORDER BY v.event_id, v.user_id
+         LIMIT %s
+    """
+    return read_cached(query, tables=VISITS_TABLES, params=params + [limit], bulk=True)
+
+
+def count_visits(event_id=None, event_name=None):
+    """
+    Возвращает общее число строк посещаемости под фильтрами.
+    """
+    where, params = _visits_where(event_id, event_name)
+    query = f"""
+        SELECT COUNT(*) AS total
+          FROM event_user_visits v
+          LEFT JOIN events e ON e.event_id = v.event_id
+          {where}
+    """
+    return int(read_cached(query, tables=VISITS_TABLES, params=params)["total"][0])
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import os
+import sys
+
+# Модули приложения лежат плоско в src/ и импортируют друг друга по имени
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
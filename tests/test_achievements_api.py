@@ -0,0 +1,130 @@
+# tests/test_achievements_api.py
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from achievements_api import VisitDispatcher
+
+
+class VisitHandler(BaseHTTPRequestHandler):
+    """
+    Заглушка POST /admin/events/visit: статус ответа берётся из server.statuses
+    по userID (список – по одному на попытку, последний повторяется).
+    """
+
+    def do_POST(self):
+        server = self.server
+        payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        user_id = payload["userID"]
+        with server.lock:
+            server.requests.append((self.path, payload))
+            attempt = server.attempts.get(user_id, 0)
+            server.attempts[user_id] = attempt + 1
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        statuses = server.statuses.get(user_id, [200])
+        status = statuses[min(attempt, len(statuses) - 1)]
+        time.sleep(server.delay)
+        with server.lock:
+            server.active -= 1
+        body = b"{}" if status == 200 else f"error {status}".encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), VisitHandler)
+    server.lock = threading.Lock()
+    server.requests, server.attempts, server.statuses = [], {}, {}
+    server.active = server.max_active = 0
+    server.delay = 0.0
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_dispatcher(server, **kwargs):
+    host, port = server.server_address
+    kwargs.setdefault("backoff_factor", 0)
+    return VisitDispatcher(f"http://{host}:{port}/", achievement_type_id=7, **kwargs)
+
+
+def test_dispatch_reports_each_visit_in_input_order(server):
+    server.statuses = {2: [400]}
+    dispatcher = make_dispatcher(server)
+
+    results = dispatcher.dispatch([(1, 1), (1, 2), (5, 3)])
+    dispatcher.close()
+
+    assert [(r.event_id, r.user_id, r.ok, r.status_code) for r in results] == [
+        (1, 1, True, 200), (1, 2, False, 400), (5, 3, True, 200)
+    ]
+    assert results[1].error == "error 400"
+    path, payload = server.requests[0]
+    assert path == "/admin/events/visit" and payload["achievement_type_id"] == 7
+
+
+def test_concurrency_is_bounded_by_max_workers(server):
+    server.delay = 0.05
+    dispatcher = make_dispatcher(server, max_workers=3)
+
+    results = dispatcher.dispatch([(1, user_id) for user_id in range(12)])
+    dispatcher.close()
+
+    assert all(r.ok for r in results)
+    assert 1 < server.max_active <= 3
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_retries_when_request_was_not_accepted(server, status):
+    server.statuses = {1: [status, status, 200]}
+    dispatcher = make_dispatcher(server, retries=3)
+
+    [result] = dispatcher.dispatch([(1, 1)])
+    dispatcher.close()
+
+    assert result.ok
+    assert server.attempts[1] == 3
+
+
+@pytest.mark.parametrize("status", [400, 500, 502, 504])
+def test_does_not_retry_other_errors(server, status):
+    server.statuses = {1: [status, 200]}
+    dispatcher = make_dispatcher(server, retries=3)
+
+    [result] = dispatcher.dispatch([(1, 1)])
+    dispatcher.close()
+
+    assert not result.ok and result.status_code == status
+    assert server.attempts[1] == 1
+
+
+def test_gives_up_after_retries(server):
+    server.statuses = {1: [503]}
+    dispatcher = make_dispatcher(server, retries=2)
+
+    [result] = dispatcher.dispatch([(1, 1)])
+    dispatcher.close()
+
+    assert not result.ok and result.status_code == 503
+    assert server.attempts[1] == 3
+
+
+def test_connection_errors_are_reported_not_raised():
+    dispatcher = VisitDispatcher("http://127.0.0.1:9", retries=0, timeout=1)
+
+    [result] = dispatcher.dispatch([(1, 1)])
+    dispatcher.close()
+
+    assert not result.ok and result.status_code is None and result.error
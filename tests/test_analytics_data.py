@@ -0,0 +1,27 @@
+# tests/test_analytics_data.py
+import analytics_data
+from analytics_data import ParquetSource, SyntheticSource, available_sources, make_data_source
+
+
+def test_parquet_source_needs_all_files(tmp_path):
+    source = ParquetSource(str(tmp_path))
+    assert not source.available()
+
+    frames = SyntheticSource(n_transactions=50, n_logins=50, n_achievements=20, seed=1)
+    for name in ("users", "transactions", "logins", "achievements"):
+        getattr(frames, name)().collect().write_parquet(tmp_path / f"{name}.parquet")
+
+    assert source.available()
+    assert source.item_names()
+
+
+def test_available_sources_skip_unconfigured(monkeypatch, tmp_path):
+    monkeypatch.setattr(analytics_data, "POSTGRES_HOST", None)
+    monkeypatch.setattr(ParquetSource.__init__, "__defaults__", (str(tmp_path / "missing"),))
+
+    assert available_sources() == ["synthetic"]
+
+
+def test_make_data_source_shares_instances():
+    assert make_data_source("synthetic") is make_data_source("synthetic")
+    assert make_data_source("synthetic", seed=1) is not make_data_source("synthetic", seed=2)
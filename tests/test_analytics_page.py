@@ -0,0 +1,48 @@
+# tests/test_analytics_page.py
+import os
+from datetime import datetime, timedelta
+
+import polars as pl
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import backtesting
+
+ANALYTICS_PAGE = os.path.join(os.path.dirname(__file__), "..", "src", "pages", "2_analytics.py")
+
+
+@pytest.fixture
+def backtests(monkeypatch):
+    """
+    Бэктест без пула процессов: считает вызовы и отдаёт готовую сводку.
+    """
+    calls = []
+
+    def run_backtest(matrix, horizon, min_train, step, max_workers):
+        calls.append(min_train)
+        summary = pl.DataFrame({"model": ["trend"], "MAE": [1.0]})
+        return summary, summary.with_columns(pl.lit("A").alias("series"))
+
+    monkeypatch.setattr(backtesting, "run_backtest", run_backtest)
+    return calls
+
+
+def backtest_tables(at):
+    return [df for df in at.dataframe if "model" in df.value.columns]
+
+
+def test_backtest_results_are_dropped_when_filters_change(backtests):
+    at = AppTest.from_file(ANALYTICS_PAGE, default_timeout=60).run()
+    [b for b in at.button if b.label == "Запустить бэктест"][0].click().run()
+    assert not at.exception
+    assert backtests and backtest_tables(at)
+    runs = len(backtests)
+
+    # Тот же период – результат остаётся на экране без пересчёта
+    at.run()
+    assert backtest_tables(at) and len(backtests) == runs
+
+    today = datetime.now().date()
+    at.date_input[0].set_value([today - timedelta(days=10), today]).run()
+    assert not at.exception
+    assert not backtest_tables(at)
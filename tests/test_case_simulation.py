@@ -0,0 +1,20 @@
+# tests/test_case_simulation.py
+import numpy as np
+
+from case_simulation import depletion_openings
+
+
+def test_depletion_openings_finds_last_unit_of_each_product():
+    draws = np.array([
+        [0, 1, 0, 2, 1, 0],
+        [2, 2, 2, 0, 1, 1],
+    ])
+    stock = np.array([2, 2, 0, 4])
+
+    result = depletion_openings(draws, 4, stock)
+
+    expected = np.array([
+        [3, 5, 0, np.nan],
+        [np.nan, 6, 0, np.nan],
+    ])
+    np.testing.assert_array_equal(result, expected)
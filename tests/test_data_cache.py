@@ -0,0 +1,101 @@
+# tests/test_data_cache.py
+import polars as pl
+import pytest
+
+import data_cache
+from data_cache import FrameCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(data_cache.time, "monotonic", clock)
+    return clock
+
+
+def counting_loader(value):
+    calls = []
+
+    def load():
+        calls.append(value)
+        return value
+    return load, calls
+
+
+def test_invalidate_drops_only_entries_of_that_table():
+    cache = FrameCache()
+    events, events_calls = counting_loader("events")
+    both, both_calls = counting_loader("both")
+    users, users_calls = counting_loader("users")
+    cache.get_or_load("e", ["events"], events)
+    cache.get_or_load("eu", ["events", "users"], both)
+    cache.get_or_load("u", ["users"], users)
+
+    cache.invalidate("events")
+    for key, tables, loader in (("e", ["events"], events), ("eu", ["events", "users"], both), ("u", ["users"], users)):
+        cache.get_or_load(key, tables, loader)
+
+    assert (len(events_calls), len(both_calls), len(users_calls)) == (2, 2, 1)
+
+
+@pytest.mark.parametrize("reset", [lambda cache: cache.invalidate("events"), lambda cache: cache.clear()])
+def test_load_in_flight_during_reset_is_not_stored(reset):
+    cache = FrameCache()
+
+    def stale_load():
+        # Таблицу меняют (или кэш сбрасывают), пока идёт чтение
+        reset(cache)
+        return "stale"
+
+    assert cache.get_or_load("e", ["events"], stale_load) == "stale"
+    fresh, calls = counting_loader("fresh")
+    assert cache.get_or_load("e", ["events"], fresh) == "fresh"
+    assert calls == ["fresh"]
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = FrameCache(ttl=10)
+    load, calls = counting_loader("value")
+
+    cache.get_or_load("k", ["t"], load)
+    clock.now += 10
+    cache.get_or_load("k", ["t"], load)
+    clock.now += 0.5
+    cache.get_or_load("k", ["t"], load)
+
+    assert len(calls) == 2
+
+
+def test_least_recently_used_entries_are_evicted_by_count():
+    cache = FrameCache(max_entries=2)
+    loads = {key: counting_loader(key) for key in "abc"}
+    cache.get_or_load("a", ["t"], loads["a"][0])
+    cache.get_or_load("b", ["t"], loads["b"][0])
+    cache.get_or_load("a", ["t"], loads["a"][0])  # a использована последней
+    cache.get_or_load("c", ["t"], loads["c"][0])  # вытесняет b
+
+    cache.get_or_load("a", ["t"], loads["a"][0])
+    cache.get_or_load("b", ["t"], loads["b"][0])
+
+    assert len(loads["a"][1]) == 1 and len(loads["b"][1]) == 2
+
+
+def test_entries_are_evicted_by_size():
+    frame = pl.DataFrame({"x": range(1000)})
+    cache = FrameCache(max_bytes=int(frame.estimated_size() * 2.5))
+    loads = {key: counting_loader(frame) for key in "abc"}
+    for key in "abc":
+        cache.get_or_load(key, ["t"], loads[key][0])
+
+    assert cache._total_bytes <= cache.max_bytes
+    cache.get_or_load("a", ["t"], loads["a"][0])
+    cache.get_or_load("c", ["t"], loads["c"][0])
+    assert len(loads["a"][1]) == 2 and len(loads["c"][1]) == 1
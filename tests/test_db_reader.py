@@ -0,0 +1,70 @@
+# tests/test_db_reader.py
+import contextlib
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import polars as pl
+import pytest
+
+import db_reader
+from db_reader import _render
+
+
+def test_render_quotes_parameters_without_connection():
+    query = _render(
+        "SELECT 1 WHERE a = %s AND b = ANY(%s) AND c >= %s AND d = %s AND e IS %s AND f = %s",
+        ["Ачивка o'k \\", ["x", "y"], datetime(2024, 1, 2), date(2024, 1, 3), None, 1.5]
+    )
+    assert query == (
+        "SELECT 1 WHERE a = E'Ачивка o''k \\\\' AND b = ANY(ARRAY[E'x', E'y'])"
+        " AND c >= '2024-01-02T00:00:00'::timestamp AND d = '2024-01-03'::date"
+        " AND e IS NULL AND f = 1.5"
+    )
+
+
+def test_render_without_params_keeps_query():
+    assert _render("SELECT '%'", None) == "SELECT '%'"
+
+
+def test_render_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        _render("SELECT %s", [object()])
+
+
+class NamedCursor:
+    """
+    Как именованный курсор psycopg2: description пуст до первого FETCH.
+    """
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.description = None
+        self.executed = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query, params=None):
+        self.executed = (query, params)
+
+    def fetchmany(self, size):
+        self.description = (("day", None), ("user_id", None))
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+
+def test_server_cursor_reads_columns_after_first_fetch(monkeypatch):
+    rows = [(date(2024, 1, day), day) for day in range(1, 6)]
+    cursor = NamedCursor(rows)
+    connection = SimpleNamespace(cursor=lambda name: cursor)
+    monkeypatch.setattr(db_reader, "db_connection", lambda: contextlib.nullcontext(connection))
+
+    batches = list(db_reader._iter_server_cursor("SELECT day, user_id FROM t WHERE x = %s", [1], 2))
+
+    assert cursor.executed == ("SELECT day, user_id FROM t WHERE x = %s", [1])
+    assert [batch.height for batch in batches] == [2, 2, 1]
+    assert pl.concat(batches).rows() == rows
+    assert batches[0].columns == ["day", "user_id"]
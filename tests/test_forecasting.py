@@ -0,0 +1,113 @@
+# tests/test_forecasting.py
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+import pytest
+from polars.testing import assert_frame_equal
+
+from forecasting import TrendState, fit_linear_trends, forecast_inventory, forecast_series
+
+START = datetime(2025, 1, 1)
+
+
+def daily_sales(items=("A", "B", "C"), days=40, seed=0):
+    """
+    Дневные продажи по товарам с пропусками дней и разными наклонами.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for k, item in enumerate(items):
+        for day in sorted(rng.choice(days, size=days // 2 + k, replace=False)):
+            rows.append((item, START + timedelta(days=int(day)), float(k + 0.3 * k * day + rng.normal(0, 2))))
+    return pl.DataFrame(rows, schema={"item": pl.String, "trans_day": pl.Datetime("us"), "daily_sold": pl.Float64},
+                        orient="row")
+
+
+def test_vectorized_fit_matches_polyfit_per_item():
+    df = daily_sales()
+
+    trends = fit_linear_trends(df, ["item"], "trans_day", "daily_sold").sort("item")
+
+    for row in trends.iter_rows(named=True):
+        group = df.filter(pl.col("item") == row["item"]).sort("trans_day")
+        x = np.array([(d - group["trans_day"][0]).days for d in group["trans_day"]], dtype=float)
+        slope, intercept = np.polyfit(x, group["daily_sold"].to_numpy(), 1)
+        assert row["slope"] == pytest.approx(slope)
+        assert row["intercept"] == pytest.approx(intercept)
+        assert row["last_index"] == x[-1]
+        assert row["total"] == pytest.approx(group["daily_sold"].sum())
+
+
+def test_single_point_forecasts_its_value_from_last_data_day():
+    df = pl.DataFrame({"trans_day": [START + timedelta(days=3)], "daily_sold": [5.0]})
+
+    forecast = forecast_series(df, "trans_day", "daily_sold", horizon=3, default_last_day=START + timedelta(days=30))
+
+    assert forecast["date"].to_list() == [START + timedelta(days=d) for d in (4, 5, 6)]
+    assert forecast["forecast"].to_list() == [5.0, 5.0, 5.0]
+
+
+def test_empty_series_forecasts_zero_from_default_day():
+    df = pl.DataFrame(schema={"trans_day": pl.Datetime("us"), "daily_sold": pl.Float64})
+
+    forecast = forecast_series(df, "trans_day", "daily_sold", horizon=2, default_last_day=START)
+
+    assert forecast["date"].to_list() == [START + timedelta(days=1), START + timedelta(days=2)]
+    assert forecast["forecast"].to_list() == [0.0, 0.0]
+
+
+def test_items_without_sales_keep_their_stock():
+    trends = fit_linear_trends(daily_sales(items=("A",)), ["item"], "trans_day", "daily_sold")
+
+    projection, stockout = forecast_inventory(trends, {"A": 100, "new": None}, horizon=5, default_stock=50,
+                                              default_last_day=START)
+
+    new = stockout.filter(pl.col("item") == "new").row(0, named=True)
+    assert new["current_inventory"] == 50.0 and new["status"] == "Нет продаж/минимальные"
+    assert new["days_to_stockout"] is None
+    assert projection.filter(pl.col("item") == "new")["forecast_inventory"].to_list() == [50.0] * 5
+
+
+def full_fit(df):
+    return fit_linear_trends(df, ["item"], "trans_day", "daily_sold").sort("item")
+
+
+def test_incremental_fit_equals_full_refit(tmp_path):
+    df = daily_sales()
+    state = TrendState(str(tmp_path / "trends.parquet"))
+    for cut in (10, 25, 40):
+        since = state.high_water_mark()
+        rows = df.filter(pl.col("trans_day") < START + timedelta(days=cut))
+        if since is not None:
+            rows = rows.filter(pl.col("trans_day") > since)
+        result = state.fit(rows, complete_before=START + timedelta(days=cut))
+
+    assert_frame_equal(result.sort("item"), full_fit(df), check_exact=False)
+    # Состояние переживает перезапуск: новый объект читает его из Parquet
+    reloaded = TrendState(str(tmp_path / "trends.parquet"))
+    assert_frame_equal(reloaded.fit(df.head(0), START + timedelta(days=40)).sort("item"), full_fit(df),
+                       check_exact=False)
+
+
+def test_days_after_complete_before_are_not_persisted():
+    df = daily_sales()
+    boundary = START + timedelta(days=30)
+    state = TrendState()
+
+    # Первый прогон: дни окна пересчёта (начиная с boundary) ещё могут измениться
+    state.fit(df, complete_before=boundary)
+    assert state.high_water_mark() < boundary
+
+    # Поздно записанные продажи изменили дни окна; состояние дочитывает дни после high-water mark
+    revised = df.with_columns(
+        pl.when(pl.col("trans_day") >= boundary).then(pl.col("daily_sold") + 10).otherwise(pl.col("daily_sold"))
+        .alias("daily_sold")
+    )
+    since = state.high_water_mark()
+    result = state.fit(revised.filter(pl.col("trans_day") > since), complete_before=boundary)
+    # Повторный прогон с теми же строками ничего не удваивает
+    again = state.fit(revised.filter(pl.col("trans_day") > since), complete_before=boundary)
+
+    assert_frame_equal(result.sort("item"), full_fit(revised), check_exact=False)
+    assert_frame_equal(again.sort("item"), full_fit(revised), check_exact=False)
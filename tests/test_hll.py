@@ -0,0 +1,97 @@
+# tests/test_hll.py
+from datetime import datetime, timedelta
+
+import numpy as np
+import polars as pl
+import pytest
+
+import hll
+
+START = datetime(2025, 1, 1)
+
+
+def sketch(values, p=hll.PRECISION):
+    registers, ranks = hll.register_ranks(np.asarray(values, dtype=np.int64), p)
+    matrix = np.zeros((1, 1 << p), dtype=np.uint8)
+    np.maximum.at(matrix[0], registers, ranks.astype(np.uint8))
+    return matrix
+
+
+def logins(n, users, days, seed):
+    rng = np.random.default_rng(seed)
+    return pl.DataFrame({
+        "login_date": [START + timedelta(days=int(d), hours=int(h))
+                       for d, h in zip(rng.integers(0, days, n), rng.integers(0, 24, n))],
+        "user_id": rng.integers(0, users, n)
+    })
+
+
+def naive_rolling_distinct(frame, window):
+    days = frame["login_date"].dt.truncate("1d")
+    ids = frame["user_id"].to_numpy()
+    result = {}
+    for day in sorted(set(days.to_list())):
+        in_window = ((days > day - timedelta(days=window)) & (days <= day)).to_numpy()
+        result[day] = len(set(ids[in_window]))
+    return result
+
+
+@pytest.mark.parametrize("cardinality", [50, 1_000, 20_000, 300_000])
+def test_estimate_within_error_bound(cardinality):
+    values = np.arange(cardinality) * 7919 + 13
+    # Повторы значений не меняют оценку
+    matrix = sketch(np.concatenate([values, values[: cardinality // 2]]))
+
+    [estimated] = hll.estimate(matrix)
+
+    assert abs(estimated - cardinality) / cardinality <= 4 * hll.standard_error()
+
+
+def test_precision_for_error_meets_requested_error():
+    for error in (0.1, 0.05, 0.02, 0.01):
+        assert hll.standard_error(hll.precision_for_error(error)) <= error
+    assert hll.precision_for_error(1e-6) == hll.MAX_PRECISION
+
+
+@pytest.mark.parametrize("window", [1, 2, 3, 7, 30])
+def test_rolling_merge_matches_naive_window_max(window):
+    matrix = np.random.default_rng(window).integers(0, 40, size=(45, 64), dtype=np.uint8)
+
+    merged = hll.rolling_merge(matrix, window)
+
+    for i in range(len(matrix)):
+        np.testing.assert_array_equal(merged[i], matrix[max(0, i - window + 1): i + 1].max(axis=0))
+
+
+def test_merged_sketch_equals_sketch_of_union():
+    a, b = np.arange(0, 5000), np.arange(3000, 9000)
+    merged = hll.rolling_merge(np.vstack([sketch(a), sketch(b)]), 2)[1]
+    np.testing.assert_array_equal(merged, sketch(np.concatenate([a, b]))[0])
+
+
+@pytest.mark.parametrize("window", [1, 3, 7])
+def test_rolling_distinct_exact_matches_naive(window):
+    frame = logins(3000, users=400, days=20, seed=window)
+
+    exact = hll.rolling_distinct_exact(frame.lazy(), "login_date", "user_id", window)
+    expected = naive_rolling_distinct(frame, window)
+
+    got = dict(exact.rows())
+    assert {day: got[day] for day in expected} == expected
+
+
+def test_rolling_distinct_close_to_exact_counts():
+    window = 7
+    frame = logins(60_000, users=20_000, days=30, seed=1)
+    sketches = hll.sketch_columns(frame.lazy(), "user_id").with_columns(
+        pl.col("login_date").dt.truncate("1d").alias("day")
+    ).group_by("day", "register").agg(pl.col("rank").max()).collect()
+    days = [START + timedelta(days=d) for d in range(30)]
+
+    estimated = hll.rolling_distinct(sketches, days, window)
+    expected = naive_rolling_distinct(frame, window)
+
+    relative = np.abs(estimated - np.array([expected[day] for day in days])) / np.array(
+        [expected[day] for day in days]
+    )
+    assert relative.max() <= 4 * hll.standard_error()
@@ -0,0 +1,113 @@
+# tests/test_insert_data.py
+from types import SimpleNamespace
+
+import pytest
+from psycopg2.extensions import adapt
+
+import insert_data
+
+
+class FakeCursor:
+    """
+    Курсор без базы: подставляет параметры так же, как psycopg2 (adapt),
+    и запоминает выполненные запросы.
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.connection = SimpleNamespace(encoding="UTF8")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def mogrify(self, query, params):
+        if isinstance(query, bytes):
+            query = query.decode()
+        quoted = tuple(adapt(p).getquoted().decode() for p in params)
+        return (query % quoted).encode()
+
+    def execute(self, query, params=None):
+        if isinstance(query, bytes):
+            query = query.decode()
+        self.conn.statements.append(query if params is None else self.mogrify(query, params).decode())
+
+    def fetchone(self):
+        return self.conn.one if self.conn.one is not None else (self.conn.visit_type,)
+
+    def fetchall(self):
+        return self.conn.returning
+
+
+class FakeConnection:
+    def __init__(self, visit_type=None, returning=(), one=None):
+        self.visit_type = visit_type
+        self.returning = returning
+        self.one = one
+        self.statements = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_update_visits_casts_values_to_column_type(monkeypatch):
+    monkeypatch.setattr(insert_data, "_column_types", {})
+    conn = FakeConnection("visit_status", returning=[(1, 10)])
+
+    result = insert_data.update_visits(conn, [(1, 10, "attended"), (1, 11, "missed")])
+
+    lookup, update = conn.statements
+    assert "pg_attribute" in lookup and "'event_user_visits'::regclass" in lookup
+    assert "(1::bigint, 10::bigint, 'attended'::visit_status)" in update
+    assert "(1::bigint, 11::bigint, 'missed'::visit_status)" in update
+    assert conn.commits == 1
+    assert result == {(1, 10): True, (1, 11): False}
+
+
+def test_column_type_is_read_once(monkeypatch):
+    monkeypatch.setattr(insert_data, "_column_types", {})
+    conn = FakeConnection("text", returning=[])
+
+    insert_data.update_visits(conn, [(1, 10, "attended")])
+    insert_data.update_visits(conn, [(2, 20, "missed")])
+
+    assert sum("pg_attribute" in statement for statement in conn.statements) == 1
+    assert "'missed'::text" in conn.statements[-1]
+
+
+def test_case_probabilities_applied_in_one_statement(monkeypatch):
+    invalidated = []
+    monkeypatch.setattr(insert_data, "invalidate_tables", lambda *tables: invalidated.extend(tables))
+    conn = FakeConnection(one=(1, 2, 3))
+
+    result = insert_data.apply_case_probabilities(conn, 7, [(1, 50), (2, "25.5"), (3, 24.5)])
+
+    [statement] = conn.statements
+    assert result == {"deleted": 1, "updated": 2, "inserted": 3}
+    assert "DELETE FROM case_product_probability" in statement
+    assert "UPDATE case_product_probability" in statement
+    assert "INSERT INTO case_product_probability" in statement
+    assert "(1::bigint, 50.0::numeric), (2::bigint, 25.5::numeric), (3::bigint, 24.5::numeric)" in statement
+    assert statement.count("case_type_id = 7") == 3 and "SELECT 7, d.product_id" in statement
+    assert conn.commits == 1
+    assert invalidated == ["case_product_probability"]
+
+
+@pytest.mark.parametrize("rows, message", [
+    ([(1, 60), (2, 30)], "Сумма вероятностей должна быть 100%, сейчас 90%"),
+    ([(1, 50), (2, 25), (1, 25)], "Товар указан несколько раз: 1"),
+    ([], "хотя бы один товар"),
+])
+def test_case_probabilities_validation(rows, message):
+    conn = FakeConnection(one=(0, 0, 0))
+
+    with pytest.raises(ValueError, match=message):
+        insert_data.apply_case_probabilities(conn, 7, rows)
+
+    assert conn.statements == [] and conn.commits == 0
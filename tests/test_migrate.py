@@ -0,0 +1,33 @@
+# tests/test_migrate.py
+from migrate import apply_migrations
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.statements = []
+        self.commits = 0
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        self.statements.append(query)
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_apply_migrations_runs_files_in_order():
+    conn = RecordingConnection()
+
+    applied = apply_migrations(conn)
+
+    assert applied == sorted(applied) and "001_product_image_thumbnail.sql" in applied
+    assert "ADD COLUMN IF NOT EXISTS image_thumbnail" in conn.statements[0]
+    assert conn.commits == 1
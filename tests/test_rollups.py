@@ -0,0 +1,60 @@
+# tests/test_rollups.py
+from datetime import datetime, timedelta
+
+import polars as pl
+from polars.testing import assert_frame_equal
+
+from analytics_data import SyntheticSource, _date_filter
+from rollups import ROLLUPS, RollupStore, aggregate_batches, aggregate_daily
+
+
+def test_aggregate_batches_matches_full_aggregate():
+    source = SyntheticSource(n_logins=3000, n_transactions=2000, seed=7)
+    for spec in ROLLUPS.values():
+        full = aggregate_daily(spec, getattr(source, spec.method)()).collect().sort(["day", *spec.keys])
+        rows = getattr(source, spec.method)().collect().sort(spec.date_column)
+        # Порции режут дни посередине: хвост дня должен переноситься в следующую
+        batches = (rows[i:i + 97] for i in range(0, rows.height, 97))
+        batched = aggregate_batches(spec, batches).sort(["day", *spec.keys])
+        assert_frame_equal(full, batched, check_exact=False)
+
+
+class LateSource(SyntheticSource):
+    """
+    Синтетика, в которую можно задним числом дописать покупки.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.late = []
+
+    def transactions(self, items=None, start_dt=None, end_dt=None):
+        frame = super().transactions()
+        if self.late:
+            late = pl.DataFrame(self.late, schema=frame.collect_schema(), orient="row")
+            frame = pl.concat([frame, late.lazy()])
+        return frame.filter(_date_filter("transaction_date", start_dt, end_dt))
+
+    def record(self, day, item):
+        self.late.append((day, 1, item, 1, 10.0, 10.0))
+
+
+def sold(store, item):
+    sales = store.scan("daily_item_sales").collect()
+    return sales.filter(pl.col("item") == item).select("day", "quantity").rows()
+
+
+def test_update_picks_up_late_events_in_lookback_window():
+    source = LateSource(n_transactions=500, seed=3)
+    store = RollupStore(lookback_days=3)
+    store.update(source)
+
+    today = datetime.combine(datetime.now().date(), datetime.min.time())
+    # Событие с датой в будущем не должно сдвигать окно пересчёта
+    source.record(today + timedelta(days=30), "future")
+    store.update(source, force=True)
+    source.record(today - timedelta(days=2, hours=-5), "late")
+    store.update(source, force=True)
+
+    assert sold(store, "future") == [(today + timedelta(days=30), 1)]
+    assert sold(store, "late") == [(today - timedelta(days=2), 1)]
@@ -0,0 +1,102 @@
+# tests/test_s3_utils.py
+import io
+
+import boto3
+import pytest
+from moto import mock_aws
+from PIL import Image
+
+import s3_utils
+from settings import IMAGE_MAX_SIZE, IMAGE_THUMBNAIL_SIZE, S3_UPLOAD_WORKERS
+
+BUCKET = "dashboard-test"
+
+
+@pytest.fixture
+def bucket(monkeypatch):
+    """
+    Бакет в moto вместо S3: общий клиент модуля подменяется клиентом заглушки.
+    """
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket=BUCKET)
+        monkeypatch.setattr(s3_utils, "s3_client", lambda: client)
+        monkeypatch.setattr(s3_utils, "S3_BUCKET_NAME", BUCKET)
+        monkeypatch.setattr(s3_utils, "S3_ENDPOINT_URL", "http://s3.local")
+        yield client
+
+
+def image_bytes(size, color, fmt="PNG"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, fmt)
+    return buffer.getvalue()
+
+
+def keys(client):
+    return sorted(obj["Key"] for obj in client.list_objects_v2(Bucket=BUCKET).get("Contents", []))
+
+
+def test_upload_many_reports_results_in_order(bucket):
+    files = [(f"item_{i}.png", image_bytes((40, 30), (i, 0, 0))) for i in range(20)]
+    progress = []
+
+    results = s3_utils.upload_many(files, on_progress=lambda done, total, name: progress.append((done, total)))
+
+    assert [r.filename for r in results] == [name for name, _ in files]
+    assert all(r.ok and r.uploaded for r in results)
+    assert [done for done, _ in progress] == list(range(1, 21)) and progress[-1][1] == 20
+    assert len(keys(bucket)) == 40  # изображение и миниатюра на файл
+    assert results[0].url.startswith(f"http://s3.local/{BUCKET}/images/")
+
+
+def test_same_content_is_stored_once(bucket):
+    data = image_bytes((40, 30), (1, 2, 3))
+
+    first, second = s3_utils.upload_many([("a.png", data), ("copy.png", data)])
+    again = s3_utils.upload_to_s3(data, "b.png")
+
+    assert first.url == second.url == again.url
+    assert not again.uploaded
+    assert len(keys(bucket)) == 2
+
+
+def test_large_image_is_resized_with_thumbnail(bucket):
+    stored = s3_utils.upload_to_s3(image_bytes((4000, 3000), (10, 20, 30), "JPEG"), "big.jpg")
+
+    assert stored.url.endswith(f"_{IMAGE_MAX_SIZE}.jpg")
+    assert stored.thumbnail_url.endswith(f"_{IMAGE_THUMBNAIL_SIZE}.jpg")
+    main = bucket.get_object(Bucket=BUCKET, Key=stored.url.split(f"/{BUCKET}/")[1])
+    assert main["ContentType"] == "image/jpeg"
+    assert max(Image.open(io.BytesIO(main["Body"].read())).size) == IMAGE_MAX_SIZE
+
+
+def test_large_file_uses_multipart_upload(bucket):
+    data = bytes(20 * 1024 * 1024)
+
+    [result] = s3_utils.upload_many([("archive.bin", data)])
+
+    head = bucket.head_object(Bucket=BUCKET, Key=result.url.split(f"/{BUCKET}/")[1])
+    assert head["ContentLength"] == len(data)
+    assert head["ETag"].strip('"').endswith("-3")  # 20 МБ частями по 8 МБ
+    assert result.thumbnail_url is None
+
+
+def test_failed_upload_is_reported_not_raised(bucket, monkeypatch):
+    monkeypatch.setattr(s3_utils, "S3_BUCKET_NAME", "missing-bucket")
+
+    [result] = s3_utils.upload_many([("a.png", image_bytes((10, 10), (0, 0, 0)))])
+
+    assert not result.ok and result.error
+
+
+def test_pool_fits_parallel_uploads():
+    with mock_aws():
+        s3_utils.s3_client.clear()
+        client = s3_utils.s3_client()
+        s3_utils.s3_client.clear()
+    bulk_connections = S3_UPLOAD_WORKERS * s3_utils.BULK_TRANSFER_CONFIG.max_request_concurrency
+    assert client.meta.config.max_pool_connections >= bulk_connections
+    assert client.meta.config.max_pool_connections >= s3_utils.TRANSFER_CONFIG.max_request_concurrency
@@ -0,0 +1,83 @@
+# tests/test_shop_page.py
+import contextlib
+import os
+
+import polars as pl
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import data_cache
+import insert_data
+import s3_utils
+import settings
+
+SHOP_PAGE = os.path.join(os.path.dirname(__file__), "..", "src", "pages", "3_shop.py")
+
+PRODUCTS = pl.DataFrame({
+    "product_id": [1, 2], "name": ["A", "B"], "price": [10.0, 500.0], "description": ["", ""],
+    "image": [None, None], "avalibility": [5, 5], "product_category": ["merch", "merch"],
+    "case_type_id": [None, None]
+})
+
+
+def fake_read_cached(query, tables, params=None, bulk=False):
+    """
+    Ответы на чтения страницы магазина без базы.
+    """
+    q = query.lower()
+    if "avalibility as stock" in q:
+        return pl.DataFrame({
+            "product_id": [1, 2], "product_name": ["A", "B"], "drop_probability": [90.0, 10.0],
+            "price": [10.0, 500.0], "stock": [800, 50]
+        })
+    if "min(price)" in q:
+        return pl.DataFrame({"price": [100.0]})
+    if "from case_product_probability" in q:
+        return pl.DataFrame({
+            "case_type_id": [1, 1], "product_id": [1, 2], "drop_probability": [60.0, 40.0],
+            "product_name": ["A", "B"]
+        })
+    if "from case_type" in q:
+        return pl.DataFrame({"case_type_id": [1], "name": ["Gold"], "description": ["d"]})
+    if "from user_winnings" in q:
+        return pl.DataFrame({
+            "user_winning_id": [1], "user_id": [5], "product_id": [1], "delivered": [False],
+            "delivered_at": [None], "delivered_by": [None], "product_name": ["A"]
+        })
+    return PRODUCTS
+
+
+@pytest.fixture
+def checkouts(monkeypatch):
+    """
+    Считает соединения, взятые страницей из пула, и вызовы insert_data.
+    """
+    taken = []
+
+    def db_connection():
+        taken.append("conn")
+        return contextlib.nullcontext(object())
+
+    monkeypatch.setattr(settings, "db_connection", db_connection)
+    monkeypatch.setattr(data_cache, "read_cached", fake_read_cached)
+    monkeypatch.setattr(s3_utils, "list_s3_objects_cached", lambda: ["images/a.png"])
+    monkeypatch.setattr(insert_data, "create_case_type", lambda conn, name, desc: taken.append(("create", name)))
+    return taken
+
+
+def test_sections_render_without_taking_a_connection(checkouts):
+    at = AppTest.from_file(SHOP_PAGE, default_timeout=30).run()
+    for name in at.radio[0].options:
+        at.radio[0].set_value(name).run()
+        assert not at.exception, name
+    assert checkouts == []
+
+
+def test_save_takes_one_connection(checkouts):
+    at = AppTest.from_file(SHOP_PAGE, default_timeout=30).run()
+    at.radio[0].set_value("Создание кейсов").run()
+    at.text_input[0].input("Платиновый")
+    [b for b in at.button if b.label == "Создать новый кейс"][0].click().run()
+
+    assert not at.exception
+    assert checkouts == ["conn", ("create", "Платиновый")]
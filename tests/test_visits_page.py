@@ -0,0 +1,84 @@
+# tests/test_visits_page.py
+import os
+from datetime import datetime
+
+import polars as pl
+import pytest
+from streamlit.testing.v1 import AppTest
+
+import achievements_api
+import data_cache
+import visits
+from achievements_api import DispatchResult
+
+VISITS_PAGE = os.path.join(os.path.dirname(__file__), "..", "src", "pages", "1_page_one.py")
+FAILED_ACHIEVEMENTS_KEY = "visits_failed_achievements"
+
+EVENTS = pl.DataFrame({
+    "event_id": [1], "event_name": ["Хакатон"], "description": [""], "title": [""],
+    "start_ds": [datetime(2025, 3, 1, 10)], "end_ds": [datetime(2025, 3, 1, 18)], "status": ["open"],
+    "event_type": ["offline"], "max_users": [100], "coin": [10], "achievement_type_id": [None],
+    "company_id": [1]
+})
+
+
+class FakeDispatcher:
+    """
+    Диспетчер, который отказывает для пар из failing.
+    """
+
+    def __init__(self, failing):
+        self.failing = set(failing)
+        self.sent = []
+
+    def dispatch(self, visits, on_progress=None):
+        visits = list(visits)
+        self.sent.append(visits)
+        return [
+            DispatchResult(event_id, user_id, ok=(event_id, user_id) not in self.failing,
+                           status_code=500 if (event_id, user_id) in self.failing else 200)
+            for event_id, user_id in visits
+        ]
+
+
+@pytest.fixture
+def page(monkeypatch):
+    def fake_read_cached(query, tables, params=None, bulk=False):
+        if "company" in query:
+            return pl.DataFrame({"company_id": [1], "company": ["ACME"]})
+        return EVENTS
+
+    monkeypatch.setattr(data_cache, "read_cached", fake_read_cached)
+    monkeypatch.setattr(visits, "count_visits", lambda *args, **kwargs: 0)
+    monkeypatch.setattr(visits, "fetch_visits_page", lambda *args, **kwargs: pl.DataFrame(
+        schema={"event_id": pl.Int64, "user_id": pl.Int64, "visit": pl.String}
+    ))
+    dispatcher = FakeDispatcher(failing=[(1, 20)])
+    monkeypatch.setattr(achievements_api, "visit_dispatcher", lambda: dispatcher)
+    return dispatcher
+
+
+def test_failed_achievements_are_kept_for_retry(page):
+    at = AppTest.from_file(VISITS_PAGE, default_timeout=30)
+    at.session_state[FAILED_ACHIEVEMENTS_KEY] = [(1, 10), (1, 20)]
+    at.run()
+    assert not at.exception
+    assert any("не начислена: 2" in w.value for w in at.warning)
+
+    [b for b in at.button if b.label == "Повторить начисление ачивок"][0].click().run()
+
+    assert page.sent == [[(1, 10), (1, 20)]]
+    assert at.session_state[FAILED_ACHIEVEMENTS_KEY] == [(1, 20)]
+    assert any("userID=20" in e.value for e in at.error)
+
+
+def test_retry_clears_pending_achievements(page):
+    page.failing.clear()
+    at = AppTest.from_file(VISITS_PAGE, default_timeout=30)
+    at.session_state[FAILED_ACHIEVEMENTS_KEY] = [(1, 20)]
+    at.run()
+
+    [b for b in at.button if b.label == "Повторить начисление ачивок"][0].click().run()
+
+    assert at.session_state[FAILED_ACHIEVEMENTS_KEY] == []
+    assert not [b for b in at.button if b.label == "Повторить начисление ачивок"]